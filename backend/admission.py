@@ -0,0 +1,357 @@
+import asyncio
+import ipaddress
+import json
+import os
+import time
+from collections import OrderedDict
+from auth_utils import bearer_claims
+
+##
+# @brief Set to "0" to disable admission control.
+#
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+
+##
+# @brief Redis connection URL; when set, rate limit buckets are shared by every API worker.
+#
+REDIS_URL = os.getenv("REDIS_URL")
+
+##
+# @brief Maximum number of rate limit buckets held by the in-process backend.
+#
+ADMISSION_MAX_KEYS = int(os.getenv("ADMISSION_MAX_KEYS", "10000"))
+
+##
+# @brief Proxies trusted to set X-Forwarded-For: comma-separated addresses or networks, or "*".
+# @details The client address used for per-IP rate limits is the rightmost X-Forwarded-For entry
+#          that is not a trusted proxy, and is read only when the immediate peer is trusted. "*"
+#          trusts any peer and takes the entry the peer itself appended (the Dockerfile sets it,
+#          since the container is reachable only through the hosting platform's proxy). serve.py
+#          passes the same setting to uvicorn.
+#
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+##
+# @brief A named group of routes sharing a concurrency limit and rate limits.
+# @details Every setting can be overridden with ADMISSION_<NAME>_<SETTING>, e.g.
+#          ADMISSION_AUTH_CONCURRENCY or ADMISSION_CUSTOMER_READ_IP_RATE.
+#
+class RouteClass:
+    ##
+    # @param name Class name, e.g. "auth".
+    # @param routes (method, path prefix) pairs; method None matches any method.
+    # @param concurrency Requests of the class running at once (0 means unlimited).
+    # @param queue_timeout Seconds a request may wait for a slot before it is shed with 503.
+    # @param max_queue Requests allowed to wait for a slot; beyond that they are shed immediately.
+    # @param ip_rate Sustained requests per second per client IP (0 means unlimited).
+    # @param ip_burst Bucket size of the per-IP limiter.
+    # @param account_rate Sustained requests per second per authenticated account (0 means unlimited).
+    # @param account_burst Bucket size of the per-account limiter.
+    #
+    def __init__(self, name: str, routes, concurrency: int = 0, queue_timeout: float = 1.0, max_queue: int = 100,
+                 ip_rate: float = 0, ip_burst: float = 0, account_rate: float = 0, account_burst: float = 0):
+        prefix = "ADMISSION_" + name.upper().replace("-", "_") + "_"
+        setting = lambda key, default: type(default)(os.getenv(prefix + key, str(default)))
+        self.name = name
+        self.routes = routes
+        self.concurrency = setting("CONCURRENCY", concurrency)
+        self.queue_timeout = setting("QUEUE_TIMEOUT", queue_timeout)
+        self.max_queue = setting("MAX_QUEUE", max_queue)
+        self.ip_rate = setting("IP_RATE", float(ip_rate))
+        self.ip_burst = setting("IP_BURST", float(ip_burst or ip_rate))
+        self.account_rate = setting("ACCOUNT_RATE", float(account_rate))
+        self.account_burst = setting("ACCOUNT_BURST", float(account_burst or account_rate))
+        self.limiter = ConcurrencyLimiter(self.concurrency, self.queue_timeout, self.max_queue)
+        ## Requests let through.
+        self.admitted = 0
+        ## Requests shed because the wait queue was full.
+        self.shed_queue_full = 0
+        ## Requests shed because no slot freed up within queue_timeout.
+        self.shed_timeout = 0
+        ## Requests rejected by the per-IP limiter.
+        self.shed_ip_rate = 0
+        ## Requests rejected by the per-account limiter.
+        self.shed_account_rate = 0
+
+    def matches(self, method: str, path: str) -> bool:
+        return any((m is None or m == method) and path.startswith(p) for m, p in self.routes)
+
+    def as_dict(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_timeout": self.queue_timeout,
+            "active": self.limiter.active,
+            "queued": self.limiter.waiting,
+            "admitted": self.admitted,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+            "shed_ip_rate": self.shed_ip_rate,
+            "shed_account_rate": self.shed_account_rate,
+        }
+
+##
+# @brief Bounds the number of concurrently running requests, with a bounded, time-limited wait queue.
+#
+class ConcurrencyLimiter:
+    def __init__(self, limit: int, queue_timeout: float, max_queue: int):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    ##
+    # @brief Waits for a slot.
+    # @return None once a slot is held, otherwise "queue_full" or "timeout".
+    #
+    async def acquire(self) -> str | None:
+        if self._semaphore is None:
+            self.active += 1
+            return None
+        if self._semaphore.locked():
+            if self.waiting >= self.max_queue:
+                return "queue_full"
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                return "timeout"
+            finally:
+                self.waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        return None
+
+    def release(self):
+        self.active -= 1
+        if self._semaphore is not None:
+            self._semaphore.release()
+
+##
+# @brief In-process token buckets, one per key, with LRU eviction.
+#
+class MemoryRateLimitBackend:
+    name = "memory"
+
+    def __init__(self, max_keys: int = ADMISSION_MAX_KEYS):
+        self.max_keys = max_keys
+        self.errors = 0
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    ##
+    # @brief Takes one token from a bucket.
+    # @return 0 if the request is allowed, otherwise the seconds until a token is available.
+    #
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (burst, now))
+        tokens = min(burst, tokens + (now - updated) * rate)
+        allowed = tokens >= 1
+        self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return 0.0 if allowed else (1 - tokens) / rate
+
+##
+# @brief Redis token buckets shared by every API worker; refilled atomically in a Lua script.
+#
+class RedisRateLimitBackend:
+    name = "redis"
+
+    _SCRIPT = """
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+        local tokens = tonumber(state[1]) or burst
+        local updated = tonumber(state[2]) or now
+        tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+        redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+        return tostring(wait)
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(self._SCRIPT)
+        ## Failed calls (requests are let through).
+        self.errors = 0
+
+    async def take(self, key: str, rate: float, burst: float) -> float:
+        return float(await self._take(keys=[f"ratelimit:{key}"], args=[rate, burst]))
+
+##
+# @brief Addresses and networks of FORWARDED_ALLOW_IPS.
+#
+class TrustedProxies:
+    def __init__(self, value: str):
+        entries = [e.strip() for e in value.split(",") if e.strip()]
+        self.trust_all = "*" in entries
+        self.networks = []
+        for entry in entries:
+            if entry == "*":
+                continue
+            try:
+                self.networks.append(ipaddress.ip_network(entry, strict=False))
+            except ValueError:
+                print(f"Ignoring invalid FORWARDED_ALLOW_IPS entry: {entry}")
+
+    def __contains__(self, host: str) -> bool:
+        if self.trust_all:
+            return True
+        try:
+            address = ipaddress.ip_address(host)
+        except ValueError:
+            return False
+        return any(address in network for network in self.networks)
+
+    ##
+    # @brief Resolves the address of the client behind the proxies.
+    #
+    # @param scope The ASGI scope.
+    # @return The client address, or None when none can be resolved.
+    #
+    def client_ip(self, scope) -> str | None:
+        client = scope.get("client")
+        peer = client[0] if client else None
+        if not peer or peer not in self:
+            return peer
+        forwarded = [h.strip() for name, value in scope["headers"] if name == b"x-forwarded-for"
+                     for h in value.decode("latin-1").split(",") if h.strip()]
+        if not forwarded:
+            return peer
+        if self.trust_all:
+            return _strip_port(forwarded[-1])
+        for host in reversed(forwarded):
+            host = _strip_port(host)
+            if host not in self:
+                return host
+        # Every hop is a trusted proxy: the request came from inside
+        return _strip_port(forwarded[0])
+
+def _strip_port(host: str) -> str:
+    if host.startswith("["):
+        return host[1:host.find("]")] if "]" in host else host
+    if host.count(":") == 1:
+        return host.split(":")[0]
+    return host
+
+## Proxies whose X-Forwarded-For is believed.
+trusted_proxies = TrustedProxies(FORWARDED_ALLOW_IPS)
+
+## Process-wide rate limit backend.
+rate_limit_backend = RedisRateLimitBackend(REDIS_URL) if REDIS_URL else MemoryRateLimitBackend()
+
+##
+# @brief Route classes in match order; requests matching none are not limited.
+#
+ROUTE_CLASSES = [
+    RouteClass(
+        "auth",
+        [("POST", "/token"), ("POST", "/register"), ("POST", "/auth/")],
+        concurrency=16, queue_timeout=2.0, ip_rate=2, ip_burst=10,
+    ),
+    RouteClass(
+        "admin-analytics",
+        [("GET", "/api/analytics/")],
+        concurrency=8, queue_timeout=5.0, account_rate=5, account_burst=20,
+    ),
+    RouteClass(
+        "imports",
+        [("POST", "/api/upload/")],
+        concurrency=2, queue_timeout=1.0, max_queue=4, account_rate=0.2, account_burst=3,
+    ),
+    RouteClass(
+        "customer-read",
+        [("GET", "/api/mechanics"), ("GET", "/api/users/me")],
+        concurrency=64, queue_timeout=1.0, max_queue=256, ip_rate=20, ip_burst=60,
+    ),
+]
+
+##
+# @brief ASGI middleware applying the route classes' rate and concurrency limits.
+# @details Rate limits are checked first and answer 429; a request that cannot get a
+#          concurrency slot within its class's queue timeout answers 503. Both carry Retry-After,
+#          and rejected requests cost no database or hashing work.
+#
+class AdmissionMiddleware:
+    def __init__(self, app, route_classes=ROUTE_CLASSES, backend=None, proxies=None):
+        self.app = app
+        self.route_classes = route_classes
+        self.backend = backend or rate_limit_backend
+        self.proxies = proxies or trusted_proxies
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_ENABLED:
+            return await self.app(scope, receive, send)
+        route_class = next((c for c in self.route_classes if c.matches(scope["method"], scope["path"])), None)
+        if route_class is None:
+            return await self.app(scope, receive, send)
+
+        wait = 0.0
+        if route_class.ip_rate > 0:
+            # Requests whose client cannot be resolved share one bucket
+            client = self.proxies.client_ip(scope) or "-"
+            wait = await self._take(f"{route_class.name}:ip:{client}", route_class.ip_rate, route_class.ip_burst)
+            if wait:
+                route_class.shed_ip_rate += 1
+        if not wait and route_class.account_rate > 0:
+            account = (bearer_claims(scope["headers"]) or {}).get("sub")
+            if account is not None:
+                wait = await self._take(f"{route_class.name}:account:{account}", route_class.account_rate, route_class.account_burst)
+                if wait:
+                    route_class.shed_account_rate += 1
+        if wait:
+            return await _reject(send, 429, "Too many requests", wait)
+
+        outcome = await route_class.limiter.acquire()
+        if outcome == "queue_full":
+            route_class.shed_queue_full += 1
+            return await _reject(send, 503, "Server busy, please retry", 1)
+        if outcome == "timeout":
+            route_class.shed_timeout += 1
+            return await _reject(send, 503, "Server busy, please retry", 1)
+        route_class.admitted += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.limiter.release()
+
+    async def _take(self, key: str, rate: float, burst: float) -> float:
+        try:
+            return await self.backend.take(key, rate, burst)
+        except Exception as e:
+            self.backend.errors += 1
+            print(f"Rate limit backend error: {e}")
+            return 0.0
+
+async def _reject(send, status: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, round(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+##
+# @brief Reports admission counters: per route class, what was admitted and what was shed and why.
+#
+def admission_as_dict() -> dict:
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "backend": rate_limit_backend.name,
+        "backend_errors": rate_limit_backend.errors,
+        "forwarded_allow_ips": FORWARDED_ALLOW_IPS,
+        "classes": {c.name: c.as_dict() for c in ROUTE_CLASSES},
+    }
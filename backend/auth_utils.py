@@ -1,7 +1,11 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
 import os
+import time
+from metrics import PASSWORD_HASHES, PASSWORD_HASH_REJECTED
 
 ## 
 # @brief Secret key for signing JWT tokens.
@@ -19,6 +23,18 @@ ALGORITHM = "HS256"
 #
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
 
+##
+# @brief Lifetime of a refresh token in days; each refresh issues a new one.
+#
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+
+##
+# @brief Prefix of stored password values that never match any password.
+# @details Used for accounts that must be activated through an OTP before they have a password;
+#          it avoids hashing a random throwaway password with bcrypt.
+#
+UNUSABLE_PASSWORD_PREFIX = "!"
+
 ##
 # @brief Configuration for password hashing using bcrypt.
 #
@@ -32,6 +48,8 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 # @return True if the password matches, False otherwise.
 #
 def verify_password(plain_password, hashed_password):
+    if not hashed_password or hashed_password.startswith(UNUSABLE_PASSWORD_PREFIX):
+        return False
     return pwd_context.verify(plain_password, hashed_password)
 
 ##
@@ -43,6 +61,139 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+##
+# @brief Executor kind used for bcrypt work: "thread" (default) or "process".
+# @details bcrypt releases the GIL, so threads scale across cores without pickling overhead.
+#
+HASH_POOL_KIND = os.getenv("HASH_POOL_KIND", "thread")
+
+##
+# @brief Number of workers in the hashing pool.
+#
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+##
+# @brief Maximum number of hashes running in the pool at once.
+#
+HASH_MAX_CONCURRENCY = int(os.getenv("HASH_MAX_CONCURRENCY", str(HASH_POOL_WORKERS)))
+
+##
+# @brief Maximum number of hash requests allowed to wait for a slot before new ones are rejected.
+#
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "256"))
+
+##
+# @brief Raised when the hashing queue is full and the request should be retried later.
+#
+class HashingBusyError(Exception):
+    pass
+
+##
+# @brief Counters describing the hashing pool load.
+#
+class HashingStats:
+    def __init__(self):
+        ## Hash/verify calls currently running in the pool.
+        self.in_flight = 0
+        ## Calls waiting for a free slot.
+        self.queued = 0
+        ## Highest queue depth seen since startup.
+        self.max_queued = 0
+        ## Completed calls.
+        self.completed = 0
+        ## Calls rejected because the queue was full.
+        self.rejected = 0
+        ## Total seconds spent inside the pool.
+        self.busy_seconds = 0.0
+        ## Total seconds spent waiting for a slot.
+        self.wait_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "kind": HASH_POOL_KIND,
+            "workers": HASH_POOL_WORKERS,
+            "max_concurrency": HASH_MAX_CONCURRENCY,
+            "max_queue": HASH_MAX_QUEUE,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_queued": self.max_queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_hash_ms": round(self.busy_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+            "avg_wait_ms": round(self.wait_seconds / self.completed * 1000, 2) if self.completed else 0.0,
+        }
+
+## Live hashing pool statistics.
+hashing_stats = HashingStats()
+
+_hash_executor = None
+_hash_semaphore = None
+
+def _get_hash_executor():
+    global _hash_executor
+    if _hash_executor is None:
+        if HASH_POOL_KIND == "process":
+            _hash_executor = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS)
+        else:
+            _hash_executor = ThreadPoolExecutor(max_workers=HASH_POOL_WORKERS, thread_name_prefix="bcrypt")
+    return _hash_executor
+
+def _get_hash_semaphore():
+    global _hash_semaphore
+    if _hash_semaphore is None:
+        _hash_semaphore = asyncio.Semaphore(HASH_MAX_CONCURRENCY)
+    return _hash_semaphore
+
+async def _run_in_hash_pool(fn, *args):
+    if hashing_stats.queued >= HASH_MAX_QUEUE:
+        hashing_stats.rejected += 1
+        PASSWORD_HASH_REJECTED.inc()
+        raise HashingBusyError("Password hashing queue is full")
+
+    semaphore = _get_hash_semaphore()
+    hashing_stats.queued += 1
+    hashing_stats.max_queued = max(hashing_stats.max_queued, hashing_stats.queued)
+    waited_from = time.perf_counter()
+    try:
+        await semaphore.acquire()
+    finally:
+        hashing_stats.queued -= 1
+
+    started = time.perf_counter()
+    hashing_stats.wait_seconds += started - waited_from
+    hashing_stats.in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_hash_executor(), fn, *args)
+    finally:
+        hashing_stats.in_flight -= 1
+        hashing_stats.completed += 1
+        hashing_stats.busy_seconds += time.perf_counter() - started
+        semaphore.release()
+
+##
+# @brief Hashes a password in the bounded worker pool without blocking the event loop.
+#
+# @param password The plain text password to hash.
+# @return The hashed password string.
+# @throws HashingBusyError If the hashing queue is full.
+#
+async def get_password_hash_async(password):
+    PASSWORD_HASHES.labels("hash").inc()
+    return await _run_in_hash_pool(get_password_hash, password)
+
+##
+# @brief Verifies a password in the bounded worker pool without blocking the event loop.
+#
+# @param plain_password The plain text password to verify.
+# @param hashed_password The hashed password to compare against.
+# @return True if the password matches, False otherwise.
+# @throws HashingBusyError If the hashing queue is full.
+#
+async def verify_password_async(plain_password, hashed_password):
+    PASSWORD_HASHES.labels("verify").inc()
+    return await _run_in_hash_pool(verify_password, plain_password, hashed_password)
+
 ##
 # @brief Creates a JSON Web Token (JWT).
 #
@@ -60,7 +211,29 @@ def create_access_token(data: dict, expires_delta: timedelta | None = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-import random
+##
+# @brief Returns the verified claims of the bearer token in raw ASGI headers, or None.
+# @details Only the signature and expiry are checked (no database access), for middleware
+#          that needs to know who is calling before the route runs.
+#
+# @param headers The ASGI scope's header list.
+# @return The token payload, or None if there is no valid bearer token.
+#
+def bearer_claims(headers: list) -> dict | None:
+    for name, value in headers:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer":
+                return None
+            try:
+                return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            except JWTError:
+                return None
+    return None
+
+import hashlib
+import hmac
+import secrets
 import string
 
 ##
@@ -70,4 +243,67 @@ import string
 # @return A string containing key digits.
 #
 def generate_otp(length=6):
-    return ''.join(random.choices(string.digits, k=length))
\ No newline at end of file
+    return ''.join(secrets.choice(string.digits) for _ in range(length))
+
+##
+# @brief Returns a stored password value that no password matches.
+#
+def unusable_password():
+    return UNUSABLE_PASSWORD_PREFIX + secrets.token_hex(8)
+
+##
+# @brief Server-side key for OTP hashes.
+# @details Loaded from OTP_SECRET; defaults to SECRET_KEY.
+#
+OTP_SECRET = os.getenv("OTP_SECRET", SECRET_KEY).encode()
+
+##
+# @brief Failed verification attempts allowed per OTP before a new code must be requested.
+#
+OTP_MAX_ATTEMPTS = int(os.getenv("OTP_MAX_ATTEMPTS", "5"))
+
+##
+# @brief Hashes an OTP with a salted, server-keyed HMAC-SHA256.
+# @details OTPs are short-lived and attempt-limited, so a keyed hash is enough; bcrypt would only add CPU cost.
+#
+# @param otp The plain OTP.
+# @return The stored form "hmac$<salt>$<hex digest>".
+#
+def hash_otp(otp: str) -> str:
+    salt = secrets.token_hex(8)
+    digest = hmac.new(OTP_SECRET, f"{salt}:{otp}".encode(), hashlib.sha256).hexdigest()
+    return f"hmac${salt}${digest}"
+
+##
+# @brief Verifies an OTP against its stored hash.
+# @details Codes stored before the switch to HMAC are bcrypt hashes; they are still verified
+#          (in the hashing pool) until they expire.
+#
+# @param otp The OTP entered by the user.
+# @param stored The stored OTP hash.
+# @return True if the OTP matches, False otherwise.
+#
+async def verify_otp_async(otp: str, stored: str) -> bool:
+    if stored.startswith("hmac$"):
+        _, salt, digest = stored.split("$", 2)
+        expected = hmac.new(OTP_SECRET, f"{salt}:{otp}".encode(), hashlib.sha256).hexdigest()
+        return hmac.compare_digest(expected, digest)
+    return await verify_password_async(otp, stored)
+
+##
+# @brief Generates an opaque refresh token.
+#
+# @return A random URL-safe string with 256 bits of entropy.
+#
+def generate_refresh_token() -> str:
+    return secrets.token_urlsafe(32)
+
+##
+# @brief Digests a refresh token for storage and lookup.
+# @details Refresh tokens are random 256-bit values, so a plain SHA-256 is enough and keeps refreshes off the bcrypt pool.
+#
+# @param token The refresh token.
+# @return The hex SHA-256 digest.
+#
+def hash_refresh_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
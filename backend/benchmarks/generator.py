@@ -0,0 +1,196 @@
+"""
+@brief Deterministic generator of a synthetic policy book: customers, policies and mechanics.
+@details The same seed and row numbers always produce the same rows, so benchmark runs on
+         different commits see identical data. Rows can be written to the database (COPY) or to
+         .csv/.xlsx fixtures for the importers.
+
+Usage (from backend/):
+
+    python -m benchmarks.generator fixtures --rows 100000 --out /tmp/asfalya-fixtures
+    BENCH_DATABASE_URL=... python -m benchmarks.generator seed --customers 1000000 --mechanics 5000
+"""
+import argparse
+import asyncio
+import csv
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+## Default generator seed.
+SEED = 20240101
+
+## Password of every generated customer (used by the login benchmark).
+BENCH_PASSWORD = "bench-password"
+
+POLICY_TYPES = ["Kasko", "Trafik", "Full", "Third-Party", "Comprehensive"]
+FIRST_NAMES = ["Ali", "Ayse", "Mehmet", "Elena", "Andreas", "Maria", "Can", "Zeynep", "Nikos", "Deniz"]
+LAST_NAMES = ["Yilmaz", "Kaya", "Demir", "Georgiou", "Christodoulou", "Sahin", "Ioannou", "Celik"]
+CITIES = ["Nicosia", "Kyrenia", "Famagusta", "Morphou", "Iskele", "Lefka"]
+
+## Mechanics are scattered over this bounding box (min_lat, min_lon, max_lat, max_lon).
+MECHANIC_AREA = (34.9, 32.3, 35.7, 34.6)
+
+## Reference time for sign-up and expiry dates, fixed so generated rows do not depend on the clock.
+EPOCH = datetime(2025, 1, 1)
+
+CUSTOMER_FIELDS = ["email", "phone", "full_name", "premium", "policy_type", "policy_number", "policy_expiry", "vehicle_plate"]
+MECHANIC_FIELDS = ["name", "address", "latitude", "longitude", "phone"]
+
+##
+# @brief Generates customer rows.
+#
+# @param n Number of rows.
+# @param start Number of the first row; rows with the same number are identical across calls.
+# @param seed Generator seed.
+# @return An iterator of dictionaries with the columns of the customer import sheet plus created_at and is_active.
+#
+def customers(n: int, start: int = 0, seed: int = SEED):
+    for i in range(start, start + n):
+        rng = random.Random(seed * 1_000_003 + i)
+        yield {
+            "email": f"customer{i}@bench.example.com",
+            "phone": f"+90533{i:07d}",
+            "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "premium": round(rng.uniform(200, 5000), 2),
+            "policy_type": rng.choice(POLICY_TYPES),
+            "policy_number": f"POL-{i:08d}",
+            "policy_expiry": EPOCH + timedelta(days=rng.randint(-30, 365)),
+            "vehicle_plate": f"{chr(65 + rng.randrange(26))}{chr(65 + rng.randrange(26))} {rng.randint(100, 999)}",
+            "created_at": EPOCH - timedelta(days=rng.randint(0, 1100)),
+            "is_active": rng.random() >= 0.1,
+        }
+
+##
+# @brief Generates mechanic rows.
+#
+# @param n Number of rows.
+# @param start Number of the first row.
+# @param seed Generator seed.
+# @return An iterator of dictionaries with the columns of the mechanic import sheet.
+#
+def mechanics(n: int, start: int = 0, seed: int = SEED):
+    min_lat, min_lon, max_lat, max_lon = MECHANIC_AREA
+    for i in range(start, start + n):
+        rng = random.Random(seed * 1_000_033 + i)
+        yield {
+            "name": f"Bench Garage {i}",
+            "address": f"{rng.randint(1, 200)} {rng.choice(LAST_NAMES)} St, {rng.choice(CITIES)}",
+            "latitude": round(rng.uniform(min_lat, max_lat), 6),
+            "longitude": round(rng.uniform(min_lon, max_lon), 6),
+            "phone": f"+90392{i:07d}",
+        }
+
+def _sheet_value(value):
+    return value.strftime("%Y-%m-%d") if isinstance(value, datetime) else value
+
+##
+# @brief Writes rows to an import fixture; the format follows the extension (.csv or .xlsx).
+#
+# @param path Output path.
+# @param rows Rows from customers() or mechanics().
+# @param fields Columns to write, in order.
+#
+def write_fixture(path: str, rows, fields: list[str]):
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(fields)
+            for row in rows:
+                writer.writerow([_sheet_value(row[k]) for k in fields])
+        return
+    from openpyxl import Workbook
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(fields)
+    for row in rows:
+        sheet.append([_sheet_value(row[k]) for k in fields])
+    workbook.save(path)
+
+##
+# @brief Writes customer and mechanic fixtures in both formats.
+#
+# @param directory Output directory.
+# @param n Rows per fixture.
+# @param start Number of the first customer row (use distinct ranges for insert-only imports).
+# @return A dictionary of fixture paths by name, e.g. "customers.csv".
+#
+def write_fixtures(directory: str, n: int, start: int = 0) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    paths = {}
+    for ext in ("csv", "xlsx"):
+        paths[f"customers.{ext}"] = os.path.join(directory, f"customers-{start}-{n}.{ext}")
+        write_fixture(paths[f"customers.{ext}"], customers(n, start), CUSTOMER_FIELDS)
+        paths[f"mechanics.{ext}"] = os.path.join(directory, f"mechanics-{start}-{n}.{ext}")
+        write_fixture(paths[f"mechanics.{ext}"], mechanics(n, start), MECHANIC_FIELDS)
+    return paths
+
+##
+# @brief Replaces the non-admin customers and all mechanics with generated rows.
+# @details Rows are loaded with COPY in chunks, then the tables are analyzed and the analytics
+#          rollups rebuilt. Every customer's password is BENCH_PASSWORD.
+#
+# @param n_customers Number of customers.
+# @param n_mechanics Number of mechanics.
+# @param chunk Rows per COPY.
+#
+async def seed_database(n_customers: int, n_mechanics: int, chunk: int = 50_000):
+    from sqlalchemy import text
+    from database import engine, AsyncSessionLocal
+    from auth_utils import get_password_hash
+    from rollups import rebuild_rollups
+
+    password_hash = get_password_hash(BENCH_PASSWORD)
+    columns = CUSTOMER_FIELDS + ["created_at", "is_active", "hashed_password", "is_admin"]
+    async with engine.begin() as conn:
+        await conn.execute(text("DELETE FROM users WHERE is_admin = false"))
+        await conn.execute(text("DELETE FROM mechanics"))
+        raw = (await conn.get_raw_connection()).driver_connection
+        for start in range(0, n_customers, chunk):
+            records = [
+                tuple(row[k] for k in CUSTOMER_FIELDS + ["created_at", "is_active"]) + (password_hash, False)
+                for row in customers(min(chunk, n_customers - start), start)
+            ]
+            await raw.copy_records_to_table("users", records=records, columns=columns)
+        for start in range(0, n_mechanics, chunk):
+            records = [tuple(row[k] for k in MECHANIC_FIELDS) for row in mechanics(min(chunk, n_mechanics - start), start)]
+            await raw.copy_records_to_table("mechanics", records=records, columns=MECHANIC_FIELDS)
+    async with engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("VACUUM ANALYZE users"))
+        await conn.execute(text("VACUUM ANALYZE mechanics"))
+    # Seeding bypasses the API, so the analytics rollups are rebuilt from scratch
+    async with AsyncSessionLocal() as session:
+        await rebuild_rollups(session)
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    fixtures = commands.add_parser("fixtures", help="Write .csv and .xlsx import fixtures")
+    fixtures.add_argument("--rows", type=int, default=10_000)
+    fixtures.add_argument("--start", type=int, default=0)
+    fixtures.add_argument("--out", default="benchmarks/fixtures")
+    seed = commands.add_parser("seed", help="Load generated rows into BENCH_DATABASE_URL")
+    seed.add_argument("--customers", type=int, default=10_000)
+    seed.add_argument("--mechanics", type=int, default=1_000)
+    args = parser.parse_args()
+
+    if args.command == "fixtures":
+        for name, path in write_fixtures(args.out, args.rows, args.start).items():
+            print(f"{name:16} {path}")
+        return
+    if not os.getenv("BENCH_DATABASE_URL"):
+        sys.exit("Set BENCH_DATABASE_URL to a throwaway database; seeding deletes customers and mechanics.")
+    os.environ["DATABASE_URL"] = os.environ["BENCH_DATABASE_URL"]
+
+    async def seed_and_dispose():
+        from database import engine
+        from migrations import migrate
+        await migrate()
+        await seed_database(args.customers, args.mechanics)
+        await engine.dispose()
+    asyncio.run(seed_and_dispose())
+    print(f"Seeded {args.customers:,} customers and {args.mechanics:,} mechanics.")
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,160 @@
+"""
+@brief Startup profile of the API process, checked against a time and memory budget.
+@details Measures, each in a fresh interpreter:
+         - the time to `import main` (median of --runs) and the import-time breakdown by top-level
+           package (from `python -X importtime`);
+         - the peak RSS after the import, and which heavy libraries got loaded (none of --forbid
+           may be: they belong behind first use);
+         - time-to-first-request: from spawning `uvicorn main:app` to the first 200 response, and
+           the server's RSS at that point (needs DATABASE_URL; skip with --no-server).
+         Exits with status 1 when a budget is exceeded, so CI can run it as a regression check.
+
+Usage (from backend/):
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --max-import-ms 1200 --max-rss-mb 150 --no-server
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## Libraries the API process must not load at boot.
+DEFAULT_FORBIDDEN = "pandas,numpy,openpyxl,sklearn,resend,celery,pyinstrument"
+
+_PROBE = """
+import json, resource, sys, time
+started = time.perf_counter()
+import main
+elapsed = time.perf_counter() - started
+print(json.dumps({
+    "import_ms": elapsed * 1000,
+    "maxrss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024),
+    "modules": sorted({name.split(".")[0] for name in sys.modules}),
+}))
+"""
+
+def _python(args: list[str], **kwargs) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=BACKEND_DIR, capture_output=True, text=True, check=True, **kwargs)
+
+##
+# @brief Imports main in a fresh interpreter.
+#
+# @return Import time, peak RSS and the loaded top-level modules.
+#
+def probe_import() -> dict:
+    return json.loads(_python(["-c", _PROBE]).stdout.strip().splitlines()[-1])
+
+##
+# @brief Self import time by top-level package, from `python -X importtime -c "import main"`.
+#
+# @return A list of (package, milliseconds), slowest first.
+#
+def import_breakdown() -> list[tuple[str, float]]:
+    stderr = _python(["-X", "importtime", "-c", "import main"]).stderr
+    totals = defaultdict(float)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        totals[name.strip().split(".")[0]] += int(self_us) / 1000
+    return sorted(totals.items(), key=lambda kv: -kv[1])
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+##
+# @brief Spawns a single uvicorn process and waits for its first successful response.
+#
+# @param timeout Seconds to wait before giving up.
+# @return Time-to-first-request in milliseconds and the server's RSS (None where /proc is missing).
+#
+def probe_first_request(timeout: float = 60) -> dict:
+    port = _free_port()
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+                              cwd=BACKEND_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with {server.returncode}: {server.stderr.read()[-500:]}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return {"first_request_ms": (time.perf_counter() - started) * 1000, "server_rss_mb": _rss_mb(server.pid)}
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("uvicorn did not answer in time")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Fresh imports to take the median of")
+    parser.add_argument("--top", type=int, default=15, help="Packages shown in the breakdown")
+    parser.add_argument("--max-import-ms", type=float, default=1500)
+    parser.add_argument("--max-first-request-ms", type=float, default=5000)
+    parser.add_argument("--max-rss-mb", type=float, default=200, help="Budget for the import and for the serving process")
+    parser.add_argument("--forbid", default=DEFAULT_FORBIDDEN, help="Comma-separated modules that must not load at boot")
+    parser.add_argument("--no-server", action="store_true", help="Skip time-to-first-request (no database available)")
+    args = parser.parse_args()
+
+    probes = [probe_import() for _ in range(args.runs)]
+    import_ms = statistics.median(p["import_ms"] for p in probes)
+    rss_mb = max(p["maxrss_mb"] for p in probes)
+    loaded = set(probes[0]["modules"])
+
+    print(f"Import-time breakdown of main (self time by top-level package):")
+    for package, ms in import_breakdown()[:args.top]:
+        print(f"  {package:28} {ms:8.1f} ms")
+    print(f"\nimport main        {import_ms:8.1f} ms (median of {args.runs})   budget {args.max_import_ms:.0f} ms")
+    print(f"peak RSS           {rss_mb:8.1f} MB                  budget {args.max_rss_mb:.0f} MB")
+
+    failures = []
+    if import_ms > args.max_import_ms:
+        failures.append(f"import main took {import_ms:.0f} ms (budget {args.max_import_ms:.0f} ms)")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"peak RSS after import is {rss_mb:.0f} MB (budget {args.max_rss_mb:.0f} MB)")
+    forbidden = sorted(m for m in args.forbid.split(",") if m and m in loaded)
+    if forbidden:
+        failures.append(f"loaded at boot: {', '.join(forbidden)}")
+
+    if not args.no_server:
+        server = probe_first_request()
+        server_rss = server["server_rss_mb"]
+        print(f"first request      {server['first_request_ms']:8.1f} ms                  budget {args.max_first_request_ms:.0f} ms")
+        if server_rss is not None:
+            print(f"serving RSS        {server_rss:8.1f} MB                  budget {args.max_rss_mb:.0f} MB")
+        if server["first_request_ms"] > args.max_first_request_ms:
+            failures.append(f"first request after {server['first_request_ms']:.0f} ms (budget {args.max_first_request_ms:.0f} ms)")
+        if server_rss is not None and server_rss > args.max_rss_mb:
+            failures.append(f"serving RSS is {server_rss:.0f} MB (budget {args.max_rss_mb:.0f} MB)")
+
+    if failures:
+        print("\nStartup budget exceeded:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print("\nWithin the startup budget.")
+
+if __name__ == "__main__":
+    _main()
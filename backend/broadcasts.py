@@ -0,0 +1,178 @@
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import select, func
+from database import AsyncSessionLocal
+from models import User
+from pagination import keyset_condition, keyset_order
+
+##
+# @brief Recipients fetched per keyset page.
+#
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", "1000"))
+
+##
+# @brief Maximum number of channel sends in flight per broadcast.
+#
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))
+
+##
+# @brief Token bucket limiting how many messages a channel sends per second.
+#
+class RateLimiter:
+    def __init__(self, rate: float, burst: float | None = None):
+        ## Sustained messages per second (0 or less means unlimited).
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    ## Waits until one message may be sent.
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+##
+# @brief Base class of broadcast delivery channels.
+# @details Subclasses set `name` and `address_field` (the User column holding the recipient
+#          address) and implement deliver(). The rate limit is read from
+#          BROADCAST_RATE_<NAME> in messages per second.
+#
+class Channel(ABC):
+    name = ""
+    address_field = "phone"
+    default_rate = 50.0
+
+    def __init__(self):
+        self.limiter = RateLimiter(float(os.getenv(f"BROADCAST_RATE_{self.name.upper()}", str(self.default_rate))))
+
+    ##
+    # @brief Sends one message, respecting the channel rate limit.
+    #
+    # @param address The recipient's phone number or email address.
+    # @param message The message text.
+    #
+    async def send(self, address: str, message: str):
+        await self.limiter.acquire()
+        await self.deliver(address, message)
+
+    ##
+    # @brief Delivers one message through the provider (the rate limit is already applied).
+    #
+    @abstractmethod
+    async def deliver(self, address: str, message: str):
+        ...
+
+##
+# @brief Base of the mock channels: delivers nothing (run_broadcast logs a count per page).
+#
+class MockChannel(Channel):
+    async def deliver(self, address: str, message: str):
+        pass
+
+class MockWhatsAppChannel(MockChannel):
+    name = "whatsapp"
+
+class MockSmsChannel(MockChannel):
+    name = "sms"
+
+class MockEmailChannel(MockChannel):
+    name = "email"
+    address_field = "email"
+
+##
+# @brief Registered broadcast channels by name.
+#
+CHANNELS: dict[str, Channel] = {}
+
+##
+# @brief Registers a channel instance under its name.
+#
+def register_channel(channel: Channel):
+    CHANNELS[channel.name] = channel
+
+for _channel in (MockWhatsAppChannel(), MockSmsChannel(), MockEmailChannel()):
+    register_channel(_channel)
+
+##
+# @brief Builds the recipient filter for a target audience.
+#
+# @param target_audience One of "all", "active" or "renewal_1week".
+# @return A list of SQLAlchemy conditions on User.
+#
+def audience_conditions(target_audience: str) -> list:
+    conditions = [User.is_admin == False]
+    if target_audience == "active":
+        conditions.append(User.is_active == True)
+    elif target_audience == "renewal_1week":
+        now = datetime.now()
+        next_week = now + timedelta(days=7)
+        # Check if expiry is in the future AND within next 7 days
+        conditions += [User.policy_expiry >= now, User.policy_expiry <= next_week]
+    return conditions
+
+##
+# @brief Sends a broadcast; runs as a background job (see tasks.py).
+# @details Recipients are read in keyset pages on User.id, each in its own short transaction, so
+#          only one chunk is held in memory and no connection or snapshot is kept open while the
+#          rate-limited sends run. Each chunk is sent through the channel with bounded concurrency.
+#
+# @param ctx The JobContext used to report progress.
+# @param message The message text.
+# @param target_audience The audience name (see audience_conditions).
+# @param channel The name of a registered channel.
+# @return A dictionary with sent_count and skipped (recipients without an address).
+#
+async def run_broadcast(ctx, message: str, target_audience: str, channel: str) -> dict:
+    sender = CHANNELS[channel]
+    address_column = getattr(User, sender.address_field)
+    conditions = audience_conditions(target_audience)
+    semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
+    counts = {"processed": 0, "sent": 0, "skipped": 0, "failed": 0}
+
+    async def deliver(address):
+        async with semaphore:
+            try:
+                await sender.send(address, message)
+                counts["sent"] += 1
+            except Exception as e:
+                counts["failed"] += 1
+                ctx.error(f"{address}: {e}")
+            counts["processed"] += 1
+
+    print(f"--- START BROADCAST {ctx.job_id} via {channel}: {message} ---")
+    async with AsyncSessionLocal() as session:
+        total = await session.scalar(select(func.count()).select_from(User).where(*conditions))
+    await ctx.progress(0, total=total, force=True)
+    last_id = None
+    while True:
+        query = select(User.id, address_column).where(*conditions)
+        if last_id is not None:
+            query = query.where(keyset_condition(User.id, User.id, False, None, last_id))
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(query.order_by(*keyset_order(User.id, User.id, False)).limit(BROADCAST_CHUNK_SIZE))).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        addresses = [row[1] for row in rows]
+        missing = sum(1 for address in addresses if not address)
+        counts["skipped"] += missing
+        counts["processed"] += missing
+        await asyncio.gather(*(deliver(address) for address in addresses if address))
+        print(f"[broadcast {ctx.job_id}] {counts['processed']}/{total} recipients processed, {counts['sent']} sent via {channel}")
+        await ctx.progress(counts["processed"], succeeded=counts["sent"], failed=counts["failed"])
+    await ctx.progress(counts["processed"], succeeded=counts["sent"], failed=counts["failed"], force=True)
+    print(f"--- END BROADCAST {ctx.job_id}: Sent {counts['sent']} messages ---")
+    return {"sent_count": counts["sent"], "skipped": counts["skipped"]}
@@ -0,0 +1,277 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from coordination import invalidation_bus
+
+##
+# @brief Redis connection URL; when set, the response cache is shared through Redis.
+#
+REDIS_URL = os.getenv("REDIS_URL")
+
+##
+# @brief Default time-to-live of cached responses in seconds.
+#
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "60"))
+
+##
+# @brief Maximum number of entries held by the in-process LRU backend.
+#
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+
+##
+# @brief Tag attached to every cached value derived from customer rows.
+#
+CUSTOMERS_TAG = "customers"
+
+##
+# @brief Time-to-live of cached authenticated principals in seconds (0 disables the cache).
+#
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+
+##
+# @brief In-process LRU backend with per-entry TTL.
+#
+class MemoryCacheBackend:
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._tags: dict[str, int] = {}
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def tag_versions(self, tags) -> list[int]:
+        return [self._tags.get(tag, 0) for tag in tags]
+
+    async def bump_tags(self, tags):
+        for tag in tags:
+            self._tags[tag] = self._tags.get(tag, 0) + 1
+
+##
+# @brief Redis backend; values are stored as JSON so every API worker shares them.
+#
+class RedisCacheBackend:
+    name = "redis"
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str):
+        raw = await self._redis.get(f"cache:v:{key}")
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value, ttl: float):
+        await self._redis.set(f"cache:v:{key}", json.dumps(value, default=str), px=int(ttl * 1000))
+
+    async def tag_versions(self, tags) -> list[int]:
+        values = await self._redis.mget([f"cache:t:{tag}" for tag in tags])
+        return [int(v or 0) for v in values]
+
+    async def bump_tags(self, tags):
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(f"cache:t:{tag}")
+            await pipe.execute()
+
+##
+# @brief Read-through response cache with tag invalidation and single-flight loading.
+# @details Cache keys embed the current version of each tag, so bumping a tag makes every
+#          entry carrying it unreachable (it then ages out through its TTL). Concurrent misses
+#          for the same key within a process share a single loader call.
+#
+class ResponseCache:
+    def __init__(self, backend):
+        self.backend = backend
+        self._inflight: dict[str, asyncio.Future] = {}
+        ## Lookups answered from the cache.
+        self.hits = 0
+        ## Lookups that ran the loader.
+        self.misses = 0
+        ## Lookups that waited for another caller's loader instead of running their own.
+        self.coalesced = 0
+        ## Backend failures (the loader result is served uncached).
+        self.errors = 0
+
+    ##
+    # @brief Returns the cached value for a key, loading and storing it on a miss.
+    #
+    # @param key The cache key.
+    # @param loader Async callable producing the value on a miss; must return JSON-serializable data.
+    # @param tags Invalidation tags for the entry.
+    # @param ttl Time-to-live in seconds (defaults to CACHE_TTL_SECONDS).
+    # @return The cached or freshly loaded value.
+    #
+    async def get_or_load(self, key: str, loader, tags=(), ttl: float | None = None):
+        try:
+            versions = await self.backend.tag_versions(tags)
+            full_key = key + "".join(f"|{tag}:{v}" for tag, v in zip(tags, versions))
+            value = await self.backend.get(full_key)
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache backend error: {e}")
+            return await loader()
+
+        if value is not None:
+            self.hits += 1
+            return value
+
+        pending = self._inflight.get(full_key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await loader()
+            future.set_result(value)
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # mark retrieved so lone failures are not reported as unhandled
+            raise
+        finally:
+            del self._inflight[full_key]
+
+        try:
+            await self.backend.set(full_key, value, CACHE_TTL_SECONDS if ttl is None else ttl)
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache backend error: {e}")
+        return value
+
+    ##
+    # @brief Invalidates every entry carrying any of the given tags.
+    #
+    async def invalidate_tags(self, *tags):
+        try:
+            await self.backend.bump_tags(tags)
+        except Exception as e:
+            self.errors += 1
+            print(f"Cache invalidation failed: {e}")
+
+    def as_dict(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "inflight": len(self._inflight),
+        }
+
+##
+# @brief Short-lived in-process cache of authenticated principals, keyed by token subject.
+# @details Holds a snapshot of the user's public fields so authenticated requests can skip the
+#          user lookup. Entries are dropped explicitly when the user changes and otherwise expire
+#          after PRINCIPAL_CACHE_TTL_SECONDS. Invalidations reach the other worker processes over
+#          the invalidation bus when REDIS_URL is set; otherwise the TTL bounds their staleness.
+#
+class PrincipalCache:
+    def __init__(self, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[float, int, dict]] = OrderedDict()
+        ## Lookups answered from the cache.
+        self.hits = 0
+        ## Lookups that went to the database.
+        self.misses = 0
+        ## Authorization checks answered from signed token claims alone.
+        self.claim_hits = 0
+        ## Entries dropped because their user changed.
+        self.invalidations = 0
+
+    ##
+    # @brief Returns the cached snapshot for a token subject, or None.
+    #
+    def get(self, subject: str) -> dict | None:
+        entry = self._entries.get(subject)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[subject]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(subject)
+        self.hits += 1
+        return entry[2]
+
+    ##
+    # @brief Stores a user snapshot for a token subject.
+    #
+    # @param subject The token subject.
+    # @param user_id The user's id (used for invalidation).
+    # @param snapshot A dictionary of the user's public fields (never credentials).
+    #
+    def put(self, subject: str, user_id: int, snapshot: dict):
+        if self.ttl <= 0:
+            return
+        self._entries[subject] = (time.monotonic() + self.ttl, user_id, snapshot)
+        self._entries.move_to_end(subject)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    ##
+    # @brief Drops every cached principal of a user (under any subject), here and in the other workers.
+    #
+    # @param user_id The id of the user that was updated, deleted or changed password.
+    #
+    def invalidate_user(self, user_id: int):
+        self._drop_user(user_id)
+        invalidation_bus.publish("principal", user_id)
+
+    ##
+    # @brief Drops the cached principals of several users, with a single message to the other workers.
+    #
+    # @param user_ids The ids of the updated users.
+    #
+    def invalidate_users(self, user_ids: list[int]):
+        if not user_ids:
+            return
+        self._drop_user(user_ids)
+        invalidation_bus.publish("principal", user_ids)
+
+    def _drop_user(self, user_id: int | list[int] | None):
+        if user_id is None:
+            stale = list(self._entries)
+        else:
+            ids = set(user_id) if isinstance(user_id, list) else {user_id}
+            stale = [subject for subject, entry in self._entries.items() if entry[1] in ids]
+        for subject in stale:
+            del self._entries[subject]
+        self.invalidations += len(stale)
+
+    def as_dict(self) -> dict:
+        return {
+            "ttl_seconds": self.ttl,
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "claim_hits": self.claim_hits,
+            "invalidations": self.invalidations,
+        }
+
+## Process-wide response cache for the analytics endpoints.
+response_cache = ResponseCache(RedisCacheBackend(REDIS_URL) if REDIS_URL else MemoryCacheBackend())
+
+## Process-wide cache of authenticated principals used by get_current_user.
+principal_cache = PrincipalCache()
+invalidation_bus.subscribe("principal", principal_cache._drop_user)
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import os
+import uuid
+
+##
+# @brief Redis connection URL; when set, in-process caches of different workers invalidate each other.
+#
+REDIS_URL = os.getenv("REDIS_URL")
+
+##
+# @brief Redis pub/sub channel carrying invalidation messages.
+#
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "asfalya:invalidate")
+
+##
+# @brief Set by serve.py in worker processes, whose one-time startup work already ran in the supervisor.
+#
+SUPERVISED = os.getenv("SERVE_SUPERVISED") == "1"
+
+##
+# @brief Broadcasts invalidations of in-process state to the other worker processes over Redis pub/sub.
+# @details Each topic has one local handler, called with the published payload when another process
+#          publishes on it. Messages are fire-and-forget: after the subscription drops (Redis restart,
+#          network error) every handler is called with None, meaning "drop everything", since
+#          messages may have been missed. Without REDIS_URL publishing is a no-op, which is right
+#          for a single process.
+#
+class InvalidationBus:
+    def __init__(self, url: str | None = REDIS_URL, channel: str = INVALIDATION_CHANNEL):
+        self.url = url
+        self.channel = channel
+        ## Identifies this process; it ignores its own messages (it already applied them).
+        self.origin = uuid.uuid4().hex
+        self._handlers = {}
+        self._redis = None
+        self._listener = None
+        self._publishing: set[asyncio.Task] = set()
+        ## Messages sent.
+        self.published = 0
+        ## Messages from other processes applied.
+        self.received = 0
+        ## Publish or subscription failures.
+        self.errors = 0
+
+    def _client(self):
+        if self._redis is None:
+            import redis.asyncio as redis
+            self._redis = redis.from_url(self.url)
+        return self._redis
+
+    ##
+    # @brief Registers the local handler of a topic.
+    #
+    # @param topic Topic name, e.g. "principal".
+    # @param handler Callable taking the payload (or None to drop all state of the topic).
+    #
+    def subscribe(self, topic: str, handler):
+        self._handlers[topic] = handler
+
+    ##
+    # @brief Tells the other processes to apply an invalidation; returns without waiting.
+    #
+    # @param topic Topic name.
+    # @param payload JSON-serializable payload passed to their handler.
+    #
+    def publish(self, topic: str, payload=None):
+        if self.url is None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no event loop (scripts); other processes fall back to their TTLs
+        task = loop.create_task(self._publish(topic, payload))
+        self._publishing.add(task)
+        task.add_done_callback(self._publishing.discard)
+
+    async def _publish(self, topic: str, payload):
+        message = json.dumps({"origin": self.origin, "topic": topic, "payload": payload})
+        try:
+            await self._client().publish(self.channel, message)
+            self.published += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"Invalidation publish failed: {e}")
+
+    def _dispatch(self, raw):
+        try:
+            message = json.loads(raw)
+        except ValueError:
+            return
+        if message.get("origin") == self.origin:
+            return
+        handler = self._handlers.get(message.get("topic"))
+        if handler is not None:
+            self.received += 1
+            handler(message.get("payload"))
+
+    async def _listen(self):
+        connected_before = False
+        while True:
+            try:
+                async with self._client().pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    if connected_before:
+                        # Messages published while disconnected are lost
+                        for handler in self._handlers.values():
+                            handler(None)
+                    connected_before = True
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._dispatch(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                print(f"Invalidation subscription lost: {e}")
+                await asyncio.sleep(1)
+
+    ##
+    # @brief Starts listening for other processes' invalidations (no-op without REDIS_URL).
+    #
+    def start(self):
+        if self.url is not None and self._listener is None:
+            self._listener = asyncio.create_task(self._listen())
+
+    ##
+    # @brief Waits until the messages published so far have been sent (or failed).
+    #
+    async def flush(self):
+        if self._publishing:
+            await asyncio.gather(*self._publishing, return_exceptions=True)
+
+    ##
+    # @brief Stops listening, waits for pending publishes and closes the Redis connection.
+    # @details The bus can be started again afterwards, e.g. on the next event loop of a Celery worker.
+    #
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        await self.flush()
+        if self._redis is not None:
+            redis, self._redis = self._redis, None
+            try:
+                await redis.aclose()
+            except Exception as e:
+                print(f"Invalidation bus close failed: {e}")
+
+    def as_dict(self) -> dict:
+        return {
+            "enabled": self.url is not None,
+            "listening": self._listener is not None and not self._listener.done(),
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+        }
+
+## Process-wide invalidation bus.
+invalidation_bus = InvalidationBus()
@@ -1,32 +1,72 @@
-import resend
+import asyncio
 import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from sqlalchemy import select, update, func, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal
+from models import EmailOutbox
+from metrics import EMAILS
 
 load_dotenv()
 
 ##
-# @brief Configuration for the Resend API.
-# @details The API key must be set in the RESEND_API_KEY environment variable.
-#
-async def send_activation_email(to_email: str, otp: str):
-    """
-    @brief Sends an account activation email via Resend.
-    
-    @param to_email The recipient's email address.
-    @param otp The 6-digit activation code.
-    @return The API response.
-    """
-    api_key = os.getenv("RESEND_API_KEY")
-    if not api_key:
-        return None
-        
-    resend.api_key = api_key
-
-    params = {
-        "from": "onboarding@resend.dev",
-        "to": [to_email],
-        "subject": "Asfalya - Your Activation Code",
-        "html": f"""
+# @brief Sender address used for all outgoing mail.
+#
+EMAIL_FROM = os.getenv("EMAIL_FROM", "onboarding@resend.dev")
+
+##
+# @brief Transport used to deliver mail: "resend" or "stub".
+# @details Defaults to "resend" when RESEND_API_KEY is set and to the offline stub otherwise.
+#
+EMAIL_TRANSPORT = os.getenv("EMAIL_TRANSPORT", "resend" if os.getenv("RESEND_API_KEY") else "stub")
+
+##
+# @brief Maximum number of provider calls in flight at once.
+#
+EMAIL_CONCURRENCY = int(os.getenv("EMAIL_CONCURRENCY", "4"))
+
+##
+# @brief Messages per provider call (Resend's batch endpoint accepts up to 100).
+#
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", "50"))
+
+##
+# @brief Attempts before a message is marked as permanently failed.
+#
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+
+##
+# @brief Base delay in seconds for exponential retry backoff.
+#
+EMAIL_RETRY_BASE_SECONDS = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "5"))
+
+##
+# @brief How long an idle worker sleeps before polling the outbox again.
+#
+EMAIL_POLL_SECONDS = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+
+##
+# @brief How long a claimed message stays leased before another worker may retry it.
+#
+EMAIL_LEASE_SECONDS = 300
+
+##
+# @brief Minimum interval in seconds between sweeps that clear expired messages' parameters.
+#
+EMAIL_PURGE_SECONDS = float(os.getenv("EMAIL_PURGE_SECONDS", "60"))
+
+##
+# @brief Renders the account activation email.
+#
+# @param otp The 6-digit activation code.
+# @return A (subject, html) tuple.
+#
+def render_activation_email(otp: str):
+    subject = "Asfalya - Your Activation Code"
+    html = f"""
         <div style="font-family: sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border: 1px solid #eee; border-radius: 10px;">
             <h2 style="color: #333;">Welcome to Asfalya</h2>
             <p>Thank you for choosing Asfalya for your insurance management needs. To activate your account, please use the following one-time code:</p>
@@ -37,13 +77,300 @@ async def send_activation_email(to_email: str, otp: str):
             <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;" />
             <p style="color: #999; font-size: 12px; text-align: center;">© 2025 Asfalya. All rights reserved.</p>
         </div>
-        """,
+        """
+    return subject, html
+
+## Templates by name: functions taking the message parameters and returning (subject, html).
+TEMPLATES = {
+    "activation": render_activation_email,
+}
+
+##
+# @brief Builds an outbox row for the account activation email.
+# @details The row holds the template name and the code, not a rendered body; the body is
+#          rendered at send time and the code is cleared once the message leaves the queue.
+#
+# @param to_email The recipient's email address.
+# @param otp The 6-digit activation code.
+# @param expires_at When the code expires; the message is dropped if still unsent by then.
+# @return A dictionary of EmailOutbox column values, suitable for bulk inserts.
+#
+def activation_email_row(to_email: str, otp: str, expires_at: datetime) -> dict:
+    subject, _ = render_activation_email(otp)
+    return {
+        "to_email": to_email, "subject": subject, "template": "activation", "params": {"otp": otp},
+        "expires_at": expires_at, "status": "pending", "attempts": 0,
     }
 
-    try:
-        response = resend.Emails.send(params)
-        return response
-    except Exception as e:
-        # Keep logging errors for production monitoring
-        print(f"Error sending email via Resend: {e}")
-        raise e
+##
+# @brief Drops unsent activation emails to an address, in the caller's transaction.
+# @details Called when the address's code is replaced or used, so the old code does not stay in the outbox.
+#
+# @param db The database session.
+# @param to_email The recipient's email address.
+#
+async def discard_activation_emails(db: AsyncSession, to_email: str):
+    await db.execute(
+        update(EmailOutbox)
+        .where(EmailOutbox.to_email == to_email, EmailOutbox.template == "activation", EmailOutbox.params.is_not(None))
+        .values(
+            params=None,
+            status=case((EmailOutbox.status.in_(["pending", "sending"]), "superseded"), else_=EmailOutbox.status),
+        )
+    )
+
+##
+# @brief Queues an account activation email in the caller's transaction.
+# @details Unsent activation emails with an earlier code are discarded. Nothing is sent until
+#          the caller commits; call outbox_worker.notify() afterwards to wake the worker immediately.
+#
+# @param db The database session.
+# @param to_email The recipient's email address.
+# @param otp The 6-digit activation code.
+# @param expires_at When the code expires.
+#
+async def enqueue_activation_email(db: AsyncSession, to_email: str, otp: str, expires_at: datetime):
+    await discard_activation_emails(db, to_email)
+    db.add(EmailOutbox(**activation_email_row(to_email, otp, expires_at)))
+
+def _render(message: EmailOutbox) -> str | None:
+    if message.template is None:
+        return message.html
+    return TEMPLATES[message.template](**(message.params or {}))[1]
+
+##
+# @brief Sends mail through the Resend API.
+# @details The Resend SDK is blocking, so calls run in a thread; batches use the batch endpoint.
+#
+class ResendTransport:
+    name = "resend"
+
+    def __init__(self):
+        self._resend = None
+
+    def _client(self):
+        # Imported on first send, it is slow to import and unused by the stub transport
+        if self._resend is None:
+            import resend
+            resend.api_key = os.getenv("RESEND_API_KEY")
+            self._resend = resend
+        return self._resend
+
+    async def send_batch(self, messages: list[dict]) -> list[str | None]:
+        resend = self._client()
+        if len(messages) == 1:
+            response = await asyncio.to_thread(resend.Emails.send, messages[0])
+            return [response.get("id")]
+        response = await asyncio.to_thread(resend.Batch.send, messages)
+        return [item.get("id") for item in response.get("data", [])]
+
+##
+# @brief Offline transport for development and load testing.
+# @details Simulates provider latency and failures and keeps counters instead of sending mail.
+#          Tuned with EMAIL_STUB_LATENCY_MS and EMAIL_STUB_FAILURE_RATE.
+#
+class StubTransport:
+    name = "stub"
+
+    def __init__(self):
+        self.latency = float(os.getenv("EMAIL_STUB_LATENCY_MS", "20")) / 1000
+        self.failure_rate = float(os.getenv("EMAIL_STUB_FAILURE_RATE", "0"))
+        ## Number of messages "delivered".
+        self.sent = 0
+        ## Number of provider calls made.
+        self.calls = 0
+
+    async def send_batch(self, messages: list[dict]) -> list[str | None]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Stub transport simulated failure")
+        self.sent += len(messages)
+        return [f"stub-{self.calls}-{i}" for i in range(len(messages))]
+
+##
+# @brief Creates the transport selected by EMAIL_TRANSPORT.
+#
+def get_transport():
+    if EMAIL_TRANSPORT == "resend":
+        return ResendTransport()
+    return StubTransport()
+
+##
+# @brief Background worker that drains the email outbox.
+# @details Claims due messages with SKIP LOCKED (so several API workers can drain the same table),
+#          sends them in provider batches with bounded concurrency and records per-message status.
+#          Failed messages are retried with exponential backoff until EMAIL_MAX_ATTEMPTS.
+#
+class OutboxWorker:
+    def __init__(self, transport=None):
+        self.transport = transport or get_transport()
+        self._task = None
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(EMAIL_CONCURRENCY)
+        self._last_purge = 0.0
+
+    ## Starts the drain loop on the running event loop.
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    ## Stops the drain loop.
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    ## Wakes the worker so freshly committed messages are sent without waiting for the next poll.
+    def notify(self):
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                drained = await self.drain_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Email outbox worker error: {e}")
+                drained = 0
+            if not drained:
+                try:
+                    await self.purge_expired()
+                except Exception as e:
+                    print(f"Email outbox purge error: {e}")
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=EMAIL_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    ##
+    # @brief Claims one round of due messages and sends them.
+    # @return The number of messages claimed.
+    #
+    async def drain_once(self) -> int:
+        messages = await self._claim(EMAIL_BATCH_SIZE * EMAIL_CONCURRENCY)
+        if not messages:
+            return 0
+        batches = [messages[i:i + EMAIL_BATCH_SIZE] for i in range(0, len(messages), EMAIL_BATCH_SIZE)]
+        await asyncio.gather(*(self._send(batch) for batch in batches))
+        return len(messages)
+
+    ##
+    # @brief Clears the parameters and bodies of messages past their expiry; unsent ones become 'expired'.
+    # @details Runs at most every EMAIL_PURGE_SECONDS, when the worker is idle.
+    #
+    async def purge_expired(self):
+        if time.monotonic() - self._last_purge < EMAIL_PURGE_SECONDS:
+            return
+        self._last_purge = time.monotonic()
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.expires_at <= datetime.now(timezone.utc))
+                .where((EmailOutbox.params.is_not(None)) | (EmailOutbox.html.is_not(None)))
+                .values(
+                    params=None, html=None,
+                    status=case((EmailOutbox.status == "pending", "expired"), else_=EmailOutbox.status),
+                )
+            )
+            await session.commit()
+
+    async def _claim(self, limit: int) -> list[EmailOutbox]:
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as session:
+            due = (
+                select(EmailOutbox.id)
+                .where(EmailOutbox.status.in_(["pending", "sending"]))
+                .where(EmailOutbox.next_attempt_at <= now)
+                .order_by(EmailOutbox.next_attempt_at)
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            result = await session.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(due.scalar_subquery()))
+                .values(status="sending", next_attempt_at=now + timedelta(seconds=EMAIL_LEASE_SECONDS))
+                .returning(EmailOutbox)
+            )
+            messages = result.scalars().all()
+            await session.commit()
+            return messages
+
+    async def _send(self, batch: list[EmailOutbox]):
+        now = datetime.now(timezone.utc)
+        expired = [m for m in batch if m.expires_at is not None and m.expires_at <= now]
+        batch = [m for m in batch if m not in expired]
+        if batch:
+            payload = [
+                {"from": EMAIL_FROM, "to": [m.to_email], "subject": m.subject, "html": _render(m)}
+                for m in batch
+            ]
+            async with self._semaphore:
+                try:
+                    provider_ids = await self.transport.send_batch(payload)
+                    error = None
+                except Exception as e:
+                    provider_ids = []
+                    error = str(e)[:500]
+            EMAILS.labels("sent" if error is None else "error").inc(len(batch))
+
+        async with AsyncSessionLocal() as session:
+            now = datetime.now(timezone.utc)
+            for message in expired:
+                await session.execute(
+                    update(EmailOutbox).where(EmailOutbox.id == message.id)
+                    .values(status="expired", html=None, params=None)
+                )
+            for i, message in enumerate(batch):
+                if error is None:
+                    values = {
+                        "status": "sent", "sent_at": now, "html": None, "params": None, "last_error": None,
+                        "attempts": message.attempts + 1,
+                        "provider_id": provider_ids[i] if i < len(provider_ids) else None,
+                    }
+                else:
+                    attempts = message.attempts + 1
+                    delay = EMAIL_RETRY_BASE_SECONDS * (2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+                    values = {
+                        "status": "failed" if attempts >= EMAIL_MAX_ATTEMPTS else "pending",
+                        "attempts": attempts,
+                        "last_error": error,
+                        "next_attempt_at": now + timedelta(seconds=delay),
+                    }
+                    if attempts >= EMAIL_MAX_ATTEMPTS:
+                        # A message that will never be sent must not keep its one-time code
+                        values.update(html=None, params=None)
+                await session.execute(update(EmailOutbox).where(EmailOutbox.id == message.id).values(**values))
+            await session.commit()
+        if batch and error is not None:
+            print(f"Error sending {len(batch)} email(s) via {self.transport.name}: {error}")
+
+##
+# @brief Summarizes outbox delivery status.
+#
+# @param db The database session.
+# @return A dictionary of message counts per status plus the most recent failures.
+#
+async def outbox_status(db: AsyncSession) -> dict:
+    result = await db.execute(select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status))
+    counts = {status: count for status, count in result.all()}
+    result = await db.execute(
+        select(EmailOutbox.id, EmailOutbox.to_email, EmailOutbox.attempts, EmailOutbox.last_error)
+        .where(EmailOutbox.status == "failed")
+        .order_by(EmailOutbox.id.desc())
+        .limit(20)
+    )
+    failures = [
+        {"id": r.id, "to_email": r.to_email, "attempts": r.attempts, "last_error": r.last_error}
+        for r in result.all()
+    ]
+    return {"transport": outbox_worker.transport.name, "counts": counts, "recent_failures": failures}
+
+## Process-wide outbox worker, started with the application.
+outbox_worker = OutboxWorker()
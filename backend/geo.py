@@ -0,0 +1,317 @@
+import asyncio
+import math
+import os
+import time
+from sqlalchemy import select, func
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Mechanic
+from coordination import invalidation_bus
+
+##
+# @brief Mean Earth radius in kilometres.
+#
+EARTH_RADIUS_KM = 6371.0088
+
+##
+# @brief Kilometres per degree of latitude (along a meridian of the EARTH_RADIUS_KM sphere).
+#
+KM_PER_DEGREE = 2 * math.pi * EARTH_RADIUS_KM / 360
+
+##
+# @brief Computes the great-circle distance between two points.
+#
+# @param lat1 Latitude of the first point in degrees.
+# @param lon1 Longitude of the first point in degrees.
+# @param lat2 Latitude of the second point in degrees.
+# @param lon2 Longitude of the second point in degrees.
+# @return The distance in kilometres.
+#
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+##
+# @brief In-process uniform grid index over mechanic coordinates.
+# @details Points are bucketed into square cells of `cell_deg` degrees. A nearest-neighbour query
+#          scans rings of cells outwards from the query point and stops once no unvisited cell
+#          can hold anything closer than the current k-th result (or the search radius).
+#
+class GridIndex:
+    def __init__(self, cell_deg: float = 0.05):
+        ## Cell size in degrees (0.05 deg is roughly 5.5 km).
+        self.cell_deg = cell_deg
+        self._cells: dict[tuple[int, int], list[tuple[int, float, float]]] = {}
+        self._size = 0
+        self._bounds = None
+        ## Whether the index has been loaded at least once.
+        self.loaded = False
+
+    def __len__(self):
+        return self._size
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg))
+
+    ##
+    # @brief Replaces the index contents.
+    # @param points Iterable of (id, latitude, longitude) tuples.
+    #
+    def rebuild(self, points):
+        # Built aside and swapped in, so queries running meanwhile see the old contents
+        fresh = GridIndex(self.cell_deg)
+        for point in points:
+            fresh.add(*point)
+        self._cells, self._size, self._bounds = fresh._cells, fresh._size, fresh._bounds
+        self.loaded = True
+
+    ##
+    # @brief Adds a single point to the index.
+    #
+    def add(self, point_id: int, lat: float, lon: float):
+        i, j = self._cell(lat, lon)
+        self._cells.setdefault((i, j), []).append((point_id, lat, lon))
+        self._size += 1
+        if self._bounds is None:
+            self._bounds = [i, i, j, j]
+        else:
+            b = self._bounds
+            b[0], b[1], b[2], b[3] = min(b[0], i), max(b[1], i), min(b[2], j), max(b[3], j)
+
+    ##
+    # @brief Finds the nearest points to a location.
+    #
+    # @param lat Query latitude in degrees.
+    # @param lon Query longitude in degrees.
+    # @param limit Maximum number of results.
+    # @param radius_km Optional maximum distance in kilometres.
+    # @return A list of (distance_km, id) tuples sorted by distance.
+    #
+    def nearest(self, lat: float, lon: float, limit: int = 20, radius_km: float | None = None):
+        if not self._cells:
+            return []
+        ci, cj = self._cell(lat, lon)
+        min_i, max_i, min_j, max_j = self._bounds
+        max_ring = max(abs(min_i - ci), abs(max_i - ci), abs(min_j - cj), abs(max_j - cj))
+
+        found = []
+        for ring in range(max_ring + 1):
+            bound = self._ring_bound_km(lat, ring)
+            if radius_km is not None and bound > radius_km:
+                break
+            if len(found) >= limit and bound > found[limit - 1][0]:
+                break
+            if 8 * ring > len(self._cells):
+                # Sparse data far from the query: cheaper to visit the remaining occupied cells directly
+                cells = [c for c in self._cells if max(abs(c[0] - ci), abs(c[1] - cj)) >= ring]
+                self._scan(cells, lat, lon, radius_km, found)
+                found.sort()
+                break
+            self._scan(self._ring_cells(ci, cj, ring), lat, lon, radius_km, found)
+            found.sort()
+        return found[:limit]
+
+    ##
+    # @brief Lower bound of the distance from the query point to anything in a ring or beyond.
+    # @details Such points are at least (ring - 1) whole cells away in latitude or in longitude.
+    #          A longitude gap is shortest at the highest latitude the ring reaches, so the cosine
+    #          is taken there (the great-circle form stays a lower bound for wide gaps too).
+    #
+    def _ring_bound_km(self, lat: float, ring: int) -> float:
+        if ring <= 1:
+            return 0.0
+        gap_deg = (ring - 1) * self.cell_deg
+        far_lat = math.radians(min(abs(lat) + ring * self.cell_deg, 90.0))
+        half_gap = math.radians(min(gap_deg, 180.0)) / 2
+        across = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.cos(far_lat) * math.sin(half_gap)))
+        return min(gap_deg * KM_PER_DEGREE, across)
+
+    @staticmethod
+    def _ring_cells(ci: int, cj: int, ring: int):
+        if ring == 0:
+            return [(ci, cj)]
+        cells = [(i, j) for i in range(ci - ring, ci + ring + 1) for j in (cj - ring, cj + ring)]
+        cells += [(i, j) for i in (ci - ring, ci + ring) for j in range(cj - ring + 1, cj + ring)]
+        return cells
+
+    def _scan(self, cells, lat: float, lon: float, radius_km: float | None, found: list):
+        for cell in cells:
+            for point_id, plat, plon in self._cells.get(cell, ()):
+                distance = haversine_km(lat, lon, plat, plon)
+                if radius_km is None or distance <= radius_km:
+                    found.append((distance, point_id))
+
+##
+# @brief Latitude limit of the Web Mercator projection used by map tiles.
+#
+MAX_MERCATOR_LAT = 85.05112878
+
+##
+# @brief Projects a coordinate to fractional Web Mercator tile coordinates.
+#
+# @param lat Latitude in degrees.
+# @param lon Longitude in degrees.
+# @param zoom The map zoom level.
+# @return An (x, y) tuple in tile units at that zoom.
+#
+def to_tile(lat: float, lon: float, zoom: int) -> tuple[float, float]:
+    n = 2 ** zoom
+    lat = max(min(lat, MAX_MERCATOR_LAT), -MAX_MERCATOR_LAT)
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return min(max(x, 0.0), n - 1e-9), min(max(y, 0.0), n - 1e-9)
+
+##
+# @brief Hierarchical grid of pre-aggregated clusters, one level per map zoom.
+# @details At each zoom level, points are bucketed into cells of 1/`cells_per_tile` of a map tile
+#          (64 px for 256 px tiles by default) holding a count and coordinate sums, so a
+#          bounding-box query returns one centroid per occupied cell. The deepest level also
+#          keeps the member points so high zoom levels can return individual markers.
+#
+class ClusterIndex:
+    def __init__(self, max_zoom: int = 18, point_zoom: int = 15, cells_per_tile: int = 4):
+        ## Deepest zoom level indexed.
+        self.max_zoom = max_zoom
+        ## Zoom level from which individual points are returned instead of clusters.
+        self.point_zoom = point_zoom
+        ## Number of cluster cells along one tile edge.
+        self.cells_per_tile = cells_per_tile
+        self._levels: list[dict[tuple[int, int], list]] = [{} for _ in range(max_zoom + 1)]
+        ## Whether the index has been loaded at least once.
+        self.loaded = False
+
+    def _cell(self, lat: float, lon: float, zoom: int) -> tuple[int, int]:
+        x, y = to_tile(lat, lon, zoom)
+        return int(x * self.cells_per_tile), int(y * self.cells_per_tile)
+
+    ##
+    # @brief Replaces the index contents.
+    # @param points Iterable of (id, latitude, longitude) tuples.
+    #
+    def rebuild(self, points):
+        fresh = ClusterIndex(self.max_zoom, self.point_zoom, self.cells_per_tile)
+        for point in points:
+            fresh.add(*point)
+        self._levels = fresh._levels
+        self.loaded = True
+
+    ##
+    # @brief Adds a single point to every zoom level.
+    #
+    def add(self, point_id: int, lat: float, lon: float):
+        for zoom, level in enumerate(self._levels):
+            key = self._cell(lat, lon, zoom)
+            cell = level.get(key)
+            if cell is None:
+                cell = level[key] = [0, 0.0, 0.0, []]
+            cell[0] += 1
+            cell[1] += lat
+            cell[2] += lon
+            if zoom == self.max_zoom or cell[0] == 1:
+                cell[3].append((point_id, lat, lon))
+            elif cell[0] == 2:
+                cell[3] = []  # only singletons and the deepest level keep their members
+
+    ##
+    # @brief Returns the clusters and points visible in a bounding box.
+    #
+    # @param min_lon West edge of the box.
+    # @param min_lat South edge of the box.
+    # @param max_lon East edge of the box.
+    # @param max_lat North edge of the box.
+    # @param zoom The map zoom level.
+    # @return A tuple (clusters, points): clusters as (count, lat, lon), points as (id, lat, lon).
+    #
+    def query(self, min_lon: float, min_lat: float, max_lon: float, max_lat: float, zoom: int):
+        zoom = max(0, min(zoom, self.max_zoom))
+        level_zoom = self.max_zoom if zoom >= self.point_zoom else zoom
+        level = self._levels[level_zoom]
+        x0, y0 = self._cell(max_lat, min_lon, level_zoom)
+        x1, y1 = self._cell(min_lat, max_lon, level_zoom)
+
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(level):
+            cells = [(key, cell) for key, cell in level.items() if x0 <= key[0] <= x1 and y0 <= key[1] <= y1]
+        else:
+            cells = [((x, y), level[(x, y)]) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in level]
+
+        clusters, points = [], []
+        for _, (count, sum_lat, sum_lon, members) in cells:
+            if zoom >= self.point_zoom or count == 1:
+                points.extend(p for p in members if min_lat <= p[1] <= max_lat and min_lon <= p[2] <= max_lon)
+            else:
+                clusters.append((count, sum_lat / count, sum_lon / count))
+        return clusters, points
+
+##
+# @brief Minimum interval in seconds between checks that the indexes still match the mechanics table.
+# @details Mechanics imported by a job worker or added through another API process are picked up
+#          on the next check; with REDIS_URL set, API processes also announce their changes so the
+#          others check right away.
+#
+MECHANIC_INDEX_CHECK_SECONDS = float(os.getenv("MECHANIC_INDEX_CHECK_SECONDS", "10"))
+
+## Process-wide spatial index of mechanic locations.
+mechanic_index = GridIndex()
+
+## Process-wide zoom-level cluster index of mechanic locations.
+mechanic_clusters = ClusterIndex()
+
+# (row count, max id) of the mechanics table as last indexed, and when it was last compared
+_index_signature = None
+_index_checked_at = 0.0
+
+##
+# @brief Reloads the mechanic spatial and cluster indexes from the database.
+#
+# @param db The database session.
+#
+async def rebuild_mechanic_index(db: AsyncSession):
+    global _index_signature, _index_checked_at
+    result = await db.execute(select(Mechanic.id, Mechanic.latitude, Mechanic.longitude))
+    points = result.all()
+
+    def build():
+        mechanic_index.rebuild(points)
+        mechanic_clusters.rebuild(points)
+
+    # Building is CPU bound (large imports can take seconds), keep it off the event loop
+    await asyncio.to_thread(build)
+    _index_signature = (len(points), max((p[0] for p in points), default=None))
+    _index_checked_at = time.monotonic()
+
+##
+# @brief Loads the indexes on first use and reloads them when the mechanics table has changed.
+# @details The table is compared by row count and max id at most every MECHANIC_INDEX_CHECK_SECONDS.
+#
+# @param db The database session.
+#
+async def ensure_mechanic_index(db: AsyncSession):
+    global _index_checked_at
+    if mechanic_index.loaded and time.monotonic() - _index_checked_at < MECHANIC_INDEX_CHECK_SECONDS:
+        return
+    _index_checked_at = time.monotonic()
+    result = await db.execute(select(func.count(), func.max(Mechanic.id)))
+    if not mechanic_index.loaded or tuple(result.one()) != _index_signature:
+        await rebuild_mechanic_index(db)
+
+##
+# @brief Adds a newly inserted mechanic to the in-process indexes.
+#
+# @param mechanic The persisted Mechanic.
+#
+def index_mechanic(mechanic: Mechanic):
+    global _index_signature
+    mechanic_index.add(mechanic.id, mechanic.latitude, mechanic.longitude)
+    mechanic_clusters.add(mechanic.id, mechanic.latitude, mechanic.longitude)
+    if _index_signature is not None:
+        count, max_id = _index_signature
+        _index_signature = (count + 1, max(max_id or 0, mechanic.id))
+    invalidation_bus.publish("mechanics")
+
+def _mechanics_changed_elsewhere(payload):
+    global _index_checked_at
+    _index_checked_at = 0.0  # compare with the table on the next request
+
+invalidation_bus.subscribe("mechanics", _mechanics_changed_elsewhere)
@@ -0,0 +1,572 @@
+# pandas is imported where it is used: it costs API workers hundreds of milliseconds and tens of MB
+# at boot, and only import jobs need it (annotations are strings, see the __future__ import)
+from __future__ import annotations
+import asyncio
+import csv
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, select, update, or_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import Mechanic, User, EmailOutbox
+from auth_utils import generate_otp, hash_otp, unusable_password
+from email_service import activation_email_row, outbox_worker
+from cache import principal_cache
+from rollups import apply_rollup_changes, rollup_snapshot
+
+##
+# @brief Number of rows written per INSERT/COPY batch (and per commit).
+# @details Loaded from the IMPORT_BATCH_SIZE environment variable.
+#
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+##
+# @brief Write strategy for bulk_write: "insert" (multi-row INSERT) or "copy" (asyncpg COPY).
+# @details Used by mechanics imports; customer imports are upserts and always use INSERT ... ON CONFLICT.
+#
+IMPORT_WRITE_MODE = os.getenv("IMPORT_WRITE_MODE", "insert")
+
+## Columns that must be present in a mechanics sheet.
+MECHANIC_REQUIRED_COLUMNS = ['name', 'address', 'latitude', 'longitude']
+
+## File extensions accepted for uploads.
+UPLOAD_EXTENSIONS = ('.xlsx', '.csv')
+
+##
+# @brief Reads the header row of an uploaded .xlsx or .csv file.
+#
+# @param path Path of the file.
+# @return The list of column names.
+#
+def read_upload_columns(path: str) -> list[str]:
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return [c.strip() for c in next(csv.reader(f), [])]
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        header = next(wb.active.iter_rows(max_row=1, values_only=True), ())
+        return [str(c).strip() if c is not None else "" for c in header]
+    finally:
+        wb.close()
+
+##
+# @brief Checks that an upload has the columns an import needs.
+#
+# @param kind "mechanics" or "customers".
+# @param columns The column names of the upload.
+# @return An error message, or None if the columns are sufficient.
+#
+def validate_upload_columns(kind: str, columns: list[str]) -> str | None:
+    if kind == "mechanics" and not all(col in columns for col in MECHANIC_REQUIRED_COLUMNS):
+        return f"Missing required columns: {MECHANIC_REQUIRED_COLUMNS}"
+    # Phone is the customers' mandatory key (clean_customers rejects rows without one)
+    if kind == "customers" and 'phone' not in columns:
+        return "Missing required column: 'phone'"
+    return None
+
+##
+# @brief Estimates the number of data rows in an upload, for progress reporting.
+# @details Uses the sheet dimension for .xlsx and counts line breaks for .csv.
+#
+# @param path Path of the file.
+# @return The estimated row count, or None if unknown.
+#
+def estimate_upload_rows(path: str) -> int | None:
+    if path.endswith('.csv'):
+        lines = 0
+        with open(path, 'rb') as f:
+            while block := f.read(1024 * 1024):
+                lines += block.count(b'\n')
+        return max(lines - 1, 0)
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True)
+    try:
+        max_row = wb.active.max_row
+        return max(max_row - 1, 0) if max_row else None
+    finally:
+        wb.close()
+
+##
+# @brief Yields the rows of an uploaded .xlsx or .csv file as DataFrames of at most batch_size rows.
+# @details Memory use is bounded by one batch regardless of the file size: .xlsx files are read
+#          with openpyxl in read-only (streaming) mode, .csv files with pandas' C parser in chunks.
+#          CSV values are kept as strings so phone numbers keep their leading zeros. The index of
+#          each DataFrame is the data row number (sheet row - 2), used for row-level reports.
+#
+# @param path Path of the file.
+# @param batch_size Rows per DataFrame (defaults to IMPORT_BATCH_SIZE).
+#
+def iter_upload_batches(path: str, batch_size: int | None = None):
+    import pandas as pd
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    if path.endswith('.csv'):
+        yield from pd.read_csv(path, chunksize=batch_size, dtype=str, encoding='utf-8-sig', skipinitialspace=True)
+        return
+
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [str(c).strip() if c is not None else f"Unnamed: {i}" for i, c in enumerate(header)]
+        width = len(columns)
+        # The index is the 0-based data row (sheet row - 2), continuing across batches like read_csv's
+        batch, index = [], []
+        for number, row in enumerate(rows):
+            if any(v is not None for v in row):
+                batch.append(tuple(row[:width]) + (None,) * (width - len(row)))
+                index.append(number)
+            if len(batch) >= batch_size:
+                yield pd.DataFrame(batch, columns=columns, index=index)
+                batch, index = [], []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=index)
+    finally:
+        wb.close()
+
+##
+# @brief Async wrapper over iter_upload_batches that parses each batch in a worker thread.
+#
+async def aiter_upload_batches(path: str, batch_size: int | None = None):
+    batches = iter_upload_batches(path, batch_size)
+    try:
+        while (df := await asyncio.to_thread(next, batches, None)) is not None:
+            yield df
+    finally:
+        batches.close()
+
+##
+# @brief Cleans a text column without touching rows one by one.
+# @details Strips whitespace and turns empty strings and NaN into None; the text itself is kept
+#          as uploaded (e.g. a policy number "AB-1.0").
+#
+# @param series The raw pandas Series.
+# @return A Series of str/None values.
+#
+def clean_text_column(series: pd.Series) -> pd.Series:
+    cleaned = series.astype(str).str.strip()
+    cleaned = cleaned.where(series.notna() & (cleaned != "") & (cleaned.str.lower() != "nan"))
+    return cleaned.astype(object).where(cleaned.notna(), None)
+
+##
+# @brief Parses a coordinate column into floats.
+# @details Applies the heuristic for values whose decimal point was lost in Excel
+#          (e.g. 353370 -> 35.3370) and turns out-of-range or non-numeric values into NaN.
+#
+# @param series The raw pandas Series.
+# @param limit The absolute maximum valid value (90 for latitude, 180 for longitude).
+# @return A float Series.
+#
+def clean_coordinate_column(series: pd.Series, limit: float) -> pd.Series:
+    import pandas as pd
+    values = pd.to_numeric(series, errors='coerce')
+    values = values.where(values.abs() <= limit, values / 10000)
+    return values.where(values.abs() <= limit)
+
+##
+# @brief Turns whole-number floats into digit strings.
+# @details Number cells of an .xlsx sheet (e.g. phone numbers typed as numbers) are read as
+#          floats, which would otherwise print as "35799123456.0". Strings are left alone.
+#
+# @param series The raw pandas Series.
+# @return A Series of the same values with whole-number floats as str.
+#
+def numbers_as_text(series: pd.Series) -> pd.Series:
+    return series.map(lambda v: str(int(v)) if isinstance(v, float) and v.is_integer() else v)
+
+##
+# @brief Cleans a phone number column.
+# @details Applies numbers_as_text and clean_text_column, then removes spaces, dashes, dots and parentheses.
+#
+# @param series The raw pandas Series.
+# @return A Series of str/None values.
+#
+def clean_phone_column(series: pd.Series) -> pd.Series:
+    cleaned = clean_text_column(numbers_as_text(series)).str.replace(r"[\s\-().]", "", regex=True)
+    return cleaned.astype(object).where(cleaned.notna() & (cleaned != ""), None)
+
+def _reject(reasons: pd.Series, mask: pd.Series, reason: str):
+    # Only the first failing check is reported for a row
+    reasons[mask & reasons.isna()] = reason
+
+##
+# @brief Validates and cleans a mechanics DataFrame in a vectorized way.
+#
+# @param df The DataFrame read from the uploaded sheet.
+# @return A cleaned DataFrame with one column per Mechanic field plus '_reason', which holds the
+#         rejection reason of invalid rows and None for valid ones.
+#
+def clean_mechanics(df: pd.DataFrame) -> pd.DataFrame:
+    import pandas as pd
+    cleaned = pd.DataFrame({
+        'name': clean_text_column(df['name']),
+        'address': clean_text_column(df['address']),
+        'latitude': clean_coordinate_column(df['latitude'], 90),
+        'longitude': clean_coordinate_column(df['longitude'], 180),
+        'phone': clean_text_column(numbers_as_text(df['phone'])) if 'phone' in df.columns else None,
+    })
+    reasons = pd.Series(None, index=df.index, dtype=object)
+    for col in MECHANIC_REQUIRED_COLUMNS:
+        _reject(reasons, cleaned[col].isna(), f"missing or invalid {col}")
+    cleaned['_reason'] = reasons
+    return cleaned
+
+##
+# @brief Validates and cleans a customers DataFrame in a vectorized way.
+# @details Phone numbers are required (they are the users table's mandatory unique key), must be
+#          digits with an optional leading '+', and may appear only once in the file; the same
+#          holds for emails when present.
+#
+# @param df The DataFrame read from the uploaded sheet.
+# @return A cleaned DataFrame of customer fields plus '_reason', which holds the rejection reason
+#         of invalid rows and None for valid ones. Missing optional values are None.
+#
+def clean_customers(df: pd.DataFrame) -> pd.DataFrame:
+    import pandas as pd
+    cleaned = pd.DataFrame(index=df.index)
+    for col in ['email', 'full_name', 'policy_type']:
+        cleaned[col] = clean_text_column(df[col]) if col in df.columns else None
+    # Identifiers may be number cells (read as float when the column has blanks)
+    for col in ['policy_number', 'vehicle_plate']:
+        cleaned[col] = clean_text_column(numbers_as_text(df[col])) if col in df.columns else None
+    cleaned['phone'] = clean_phone_column(df['phone']) if 'phone' in df.columns else None
+
+    reasons = pd.Series(None, index=df.index, dtype=object)
+
+    if 'premium' in df.columns:
+        premium = pd.to_numeric(df['premium'], errors='coerce')
+        _reject(reasons, premium.isna() & clean_text_column(df['premium']).notna(), "invalid premium")
+        cleaned['premium'] = premium.astype(object).where(premium.notna(), None)
+    else:
+        cleaned['premium'] = None
+
+    if 'policy_expiry' in df.columns:
+        expiry = pd.to_datetime(df['policy_expiry'], errors='coerce')
+        _reject(reasons, expiry.isna() & clean_text_column(df['policy_expiry']).notna(), "invalid policy_expiry")
+        cleaned['policy_expiry'] = expiry.astype(object).where(expiry.notna(), None)
+    else:
+        cleaned['policy_expiry'] = None
+
+    phone, email = cleaned['phone'], cleaned['email']
+    _reject(reasons, phone.isna(), "missing phone")
+    _reject(reasons, phone.notna() & ~phone.astype(str).str.fullmatch(r"\+?\d+"), "invalid phone")
+    _reject(reasons, email.notna() & ~email.astype(str).str.fullmatch(r"[^@\s]+@[^@\s]+\.[^@\s]+"), "invalid email")
+    valid = reasons.isna()
+    _reject(reasons, valid & phone.where(valid).duplicated(), "duplicate phone in file")
+    valid = reasons.isna()
+    _reject(reasons, valid & email.notna() & email.where(valid).duplicated(), "duplicate email in file")
+    cleaned['_reason'] = reasons
+    return cleaned
+
+##
+# @brief Converts a cleaned DataFrame into plain dict records (pandas NA -> None).
+#
+def frame_to_records(df: pd.DataFrame) -> list[dict]:
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+##
+# @brief Writes one chunk of rows through the configured write strategy.
+#
+# @param db The database session.
+# @param model The ORM model whose table receives the rows.
+# @param records The rows to write as dictionaries keyed by column name.
+#
+async def write_chunk(db: AsyncSession, model, records: list[dict]):
+    if IMPORT_WRITE_MODE == "copy":
+        conn = await db.connection()
+        raw = await conn.get_raw_connection()
+        columns = list(records[0].keys())
+        await raw.driver_connection.copy_records_to_table(
+            model.__tablename__,
+            records=[tuple(r[c] for c in columns) for r in records],
+            columns=columns,
+        )
+    else:
+        # executemany on an insert() construct is sent as batched multi-row VALUES
+        await db.execute(insert(model), records)
+
+##
+# @brief Result summary of a bulk write.
+#
+class BulkWriteResult:
+    def __init__(self):
+        ## Number of rows written.
+        self.rows = 0
+        ## Number of committed batches.
+        self.batches = 0
+        ## Wall-clock seconds spent writing.
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows / self.elapsed, 1) if self.elapsed else 0.0
+
+    def as_dict(self) -> dict:
+        return {"rows": self.rows, "batches": self.batches, "rows_per_second": self.rows_per_second}
+
+##
+# @brief Writes rows in fixed-size chunks, committing after each chunk.
+#
+# @param db The database session.
+# @param model The ORM model whose table receives the rows.
+# @param records All rows to write.
+# @param batch_size Rows per chunk (defaults to IMPORT_BATCH_SIZE).
+# @param on_progress Optional async callable invoked with (rows written, total rows) after each chunk.
+# @return A BulkWriteResult.
+#
+async def bulk_write(db: AsyncSession, model, records: list[dict], batch_size: int | None = None,
+                     on_progress=None) -> BulkWriteResult:
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    result = BulkWriteResult()
+    total = len(records)
+    started = time.perf_counter()
+
+    for offset in range(0, total, batch_size):
+        chunk = records[offset:offset + batch_size]
+        await write_chunk(db, model, chunk)
+        await db.commit()
+
+        result.rows += len(chunk)
+        result.batches += 1
+        result.elapsed = time.perf_counter() - started
+        if on_progress:
+            await on_progress(result.rows, total)
+
+    result.elapsed = time.perf_counter() - started
+    return result
+
+##
+# @brief Maximum number of rows listed in an import report (counts are always complete).
+#
+IMPORT_REPORT_MAX_ROWS = int(os.getenv("IMPORT_REPORT_MAX_ROWS", "100000"))
+
+##
+# @brief Row-level outcome of an import.
+# @details Every data row ends up inserted, updated, skipped (already up to date) or rejected
+#          (with a reason). Also carries the keys seen so far, so duplicates are detected across
+#          the batches of one file.
+#
+class ImportReport:
+    STATUSES = ("inserted", "updated", "skipped", "rejected")
+
+    def __init__(self, dry_run: bool = False):
+        ## Whether the import only reports what it would do.
+        self.dry_run = dry_run
+        ## Number of rows per status.
+        self.counts = dict.fromkeys(self.STATUSES, 0)
+        ## Per-row entries ({"row", "status", "reason"}), up to IMPORT_REPORT_MAX_ROWS.
+        self.rows: list[dict] = []
+        ## Number of data rows read from the file.
+        self.rows_read = 0
+        ## Number of batches processed.
+        self.batches = 0
+        ## Wall-clock seconds spent.
+        self.elapsed = 0.0
+        self.seen_phones: set[str] = set()
+        self.seen_emails: set[str] = set()
+
+    ##
+    # @brief Records the outcome of a set of rows.
+    #
+    # @param rows Sheet row numbers.
+    # @param status One of STATUSES.
+    # @param reasons Optional reasons, one per row.
+    #
+    def add(self, rows, status: str, reasons=None):
+        rows = [int(r) for r in rows]
+        self.counts[status] += len(rows)
+        reasons = list(reasons) if reasons is not None else [None] * len(rows)
+        room = max(0, IMPORT_REPORT_MAX_ROWS - len(self.rows))
+        for row, reason in zip(rows[:room], reasons):
+            entry = {"row": row, "status": status}
+            if reason:
+                entry["reason"] = reason
+            self.rows.append(entry)
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.rows_read / self.elapsed, 1) if self.elapsed else 0.0
+
+    def summary(self) -> dict:
+        return {
+            "dry_run": self.dry_run,
+            **self.counts,
+            "rows": self.rows_read,
+            "batches": self.batches,
+            "rows_per_second": self.rows_per_second,
+            "report_truncated": len(self.rows) < sum(self.counts.values()),
+        }
+
+    def as_dict(self) -> dict:
+        return {**self.summary(), "report": sorted(self.rows, key=lambda entry: entry["row"])}
+
+def _sheet_rows(index) -> list[int]:
+    # Data row 0 is sheet row 2 (row 1 is the header)
+    return [int(i) + 2 for i in index]
+
+##
+# @brief Imports mechanics from a DataFrame.
+# @details Mechanics have no natural key, so valid rows are always inserted.
+#
+# @param db The database session.
+# @param df The raw DataFrame read from the sheet.
+# @param report The ImportReport to fill (a new one if omitted).
+# @param dry_run Validate and report without writing.
+# @return The ImportReport.
+#
+async def import_mechanics(db: AsyncSession, df: pd.DataFrame, report: ImportReport | None = None,
+                           dry_run: bool = False) -> ImportReport:
+    report = report or ImportReport(dry_run)
+    cleaned = clean_mechanics(df)
+    rejected = cleaned[cleaned['_reason'].notna()]
+    report.add(_sheet_rows(rejected.index), "rejected", rejected['_reason'])
+    valid = cleaned[cleaned['_reason'].isna()].drop(columns=['_reason'])
+    if not dry_run and len(valid):
+        await bulk_write(db, Mechanic, frame_to_records(valid))
+    report.add(_sheet_rows(valid.index), "inserted")
+    return report
+
+## Customer columns an import may set; empty cells leave the stored value unchanged.
+CUSTOMER_IMPORT_FIELDS = ['email', 'phone', 'full_name', 'premium', 'policy_type', 'policy_number', 'policy_expiry', 'vehicle_plate']
+
+async def _find_customers(db: AsyncSession, phones: list[str], emails: list[str]):
+    result = await db.execute(
+        select(User.id, User.is_admin, User.is_active, User.created_at, *[getattr(User, f) for f in CUSTOMER_IMPORT_FIELDS])
+        .where(or_(User.phone.in_(phones), User.email.in_(emails)))
+    )
+    rows = [dict(r._mapping) for r in result.all()]
+    return {r['phone']: r for r in rows}, {r['email']: r for r in rows if r['email']}
+
+##
+# @brief Imports customers from a DataFrame as an idempotent upsert keyed on phone and email.
+# @details Rows matching an existing customer by phone or email update the fields that differ
+#          (no password or OTP is regenerated); unchanged rows are skipped. New customers are
+#          inserted with ON CONFLICT DO NOTHING, get a random initial password and an activation
+#          OTP, and their activation emails are queued in the same transaction. Each batch commits
+#          on its own, so re-uploading a corrected sheet converges to the same state.
+#
+# @param db The database session.
+# @param df The raw DataFrame read from the sheet.
+# @param report The ImportReport to fill (a new one if omitted).
+# @param dry_run Classify and report rows without writing.
+# @return The ImportReport.
+#
+async def import_customers(db: AsyncSession, df: pd.DataFrame, report: ImportReport | None = None,
+                           dry_run: bool = False) -> ImportReport:
+    report = report or ImportReport(dry_run)
+    cleaned = clean_customers(df)
+
+    # Duplicates of rows from earlier batches of the same file
+    valid = cleaned['_reason'].isna()
+    _reject(cleaned['_reason'], valid & cleaned['phone'].isin(report.seen_phones), "duplicate phone in file")
+    _reject(cleaned['_reason'], valid & cleaned['email'].notna() & cleaned['email'].isin(report.seen_emails), "duplicate email in file")
+    rejected = cleaned[cleaned['_reason'].notna()]
+    report.add(_sheet_rows(rejected.index), "rejected", rejected['_reason'])
+    cleaned = cleaned[cleaned['_reason'].isna()].drop(columns=['_reason'])
+    if not len(cleaned):
+        return report
+    report.seen_phones.update(cleaned['phone'])
+    report.seen_emails.update(cleaned['email'].dropna())
+
+    records = frame_to_records(cleaned)
+    rows = _sheet_rows(cleaned.index)
+    by_phone, by_email = await _find_customers(db, list(cleaned['phone']), list(cleaned['email'].dropna()))
+
+    inserts, updates, unchanged, conflicts = [], [], [], []
+    for row, record in zip(rows, records):
+        match_phone = by_phone.get(record['phone'])
+        match_email = by_email.get(record['email']) if record['email'] else None
+        if match_phone and match_email and match_phone['id'] != match_email['id']:
+            conflicts.append((row, "email and phone belong to different customers"))
+            continue
+        existing = match_phone or match_email
+        if existing is None:
+            inserts.append((row, record))
+        elif existing['is_admin']:
+            conflicts.append((row, "matches an administrator account"))
+        else:
+            changes = {f: v for f, v in record.items() if v is not None and v != existing[f]}
+            if changes:
+                updates.append((row, existing, changes))
+            else:
+                unchanged.append(row)
+
+    report.add([row for row, _ in conflicts], "rejected", [reason for _, reason in conflicts])
+    report.add(unchanged, "skipped", ["unchanged"] * len(unchanged))
+    if dry_run:
+        report.add([row for row, _ in inserts], "inserted")
+        report.add([row for row, _, _ in updates], "updated")
+        return report
+
+    inserted_phones = set()
+    if inserts:
+        chunk = [record for _, record in inserts]
+        otp_expiry = datetime.now(timezone.utc) + timedelta(days=7)  # Give them a week to activate
+        otps = [generate_otp() for _ in chunk]
+        values = [
+            {
+                **record,
+                'premium': record['premium'] or 0.0,
+                'hashed_password': unusable_password(),  # No password until activation
+                'otp_code': hash_otp(otp),
+                'otp_expiry': otp_expiry,
+                'is_active': True,  # They are active, just can't login without password
+                'is_admin': False,
+            }
+            for record, otp in zip(chunk, otps)
+        ]
+        # Rows created concurrently by another import are left alone
+        result = await db.execute(pg_insert(User).on_conflict_do_nothing().returning(User.phone), values)
+        inserted_phones = set(result.scalars().all())
+        emails = [
+            activation_email_row(record['email'], otp, otp_expiry)
+            for record, otp in zip(chunk, otps) if record['email'] and record['phone'] in inserted_phones
+        ]
+        if emails:
+            await db.execute(insert(EmailOutbox), emails)
+
+    if updates:
+        await db.execute(update(User), [{"id": existing['id'], **changes} for _, existing, changes in updates])
+
+    added = [rollup_snapshot(v) for v in values if v['phone'] in inserted_phones] if inserts else []
+    added += [rollup_snapshot({**existing, **changes}) for _, existing, changes in updates]
+    await apply_rollup_changes(db, removed=[rollup_snapshot(existing) for _, existing, _ in updates], added=added)
+    await db.commit()
+    if inserted_phones:
+        outbox_worker.notify()
+    if updates:
+        principal_cache.invalidate_users([existing['id'] for _, existing, _ in updates])
+
+    report.add([row for row, r in inserts if r['phone'] in inserted_phones], "inserted")
+    skipped = [row for row, r in inserts if r['phone'] not in inserted_phones]
+    report.add(skipped, "skipped", ["created concurrently"] * len(skipped))
+    report.add([row for row, _, _ in updates], "updated")
+    return report
+
+##
+# @brief Streams an uploaded file through an import function batch by batch.
+#
+# @param db The database session.
+# @param path Path of the .xlsx or .csv file.
+# @param import_frame import_mechanics or import_customers.
+# @param dry_run Validate and report without writing.
+# @param on_progress Optional async callable invoked with the ImportReport after each batch.
+# @return The ImportReport covering the whole file.
+#
+async def import_upload(db: AsyncSession, path: str, import_frame, dry_run: bool = False,
+                        on_progress=None) -> ImportReport:
+    report = ImportReport(dry_run)
+    started = time.perf_counter()
+    async for df in aiter_upload_batches(path):
+        await import_frame(db, df, report, dry_run=dry_run)
+        report.rows_read += len(df)
+        report.batches += 1
+        report.elapsed = time.perf_counter() - started
+        if on_progress:
+            await on_progress(report)
+    report.elapsed = time.perf_counter() - started
+    return report
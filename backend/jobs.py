@@ -0,0 +1,369 @@
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, cast, type_coerce, JSON
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import defer
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, dispose_engines
+from models import Job
+from coordination import invalidation_bus
+
+##
+# @brief Where jobs run: "local" (in-process asyncio tasks) or "celery" (Celery workers over Redis).
+#
+JOB_BACKEND = os.getenv("JOB_BACKEND", "local")
+
+##
+# @brief Celery broker URL; defaults to REDIS_URL.
+#
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+##
+# @brief Directory where uploaded files wait for their import job.
+# @details Must be shared between the API and the Celery workers when JOB_BACKEND is "celery".
+#
+JOB_UPLOAD_DIR = os.getenv("JOB_UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "asfalya-uploads"))
+
+##
+# @brief Minimum interval in seconds between progress writes of a running job.
+#
+JOB_PROGRESS_INTERVAL = 0.5
+
+##
+# @brief Running jobs whose heartbeat is older than this are considered lost.
+#
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "600"))
+
+##
+# @brief Final job statuses.
+#
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+##
+# @brief Raised inside a handler when its job has been cancelled.
+#
+class JobCancelled(Exception):
+    pass
+
+##
+# @brief Registered job handlers by kind.
+#
+JOB_HANDLERS = {}
+
+##
+# @brief Registers an async job handler.
+# @details The handler is called as `handler(ctx, **params)` and returns a JSON-serializable result.
+#
+# @param kind The job kind name.
+#
+def job_handler(kind: str):
+    def register(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return register
+
+##
+# @brief Handle given to a running job handler for reporting progress.
+#
+class JobContext:
+    def __init__(self, job_id: str, params: dict):
+        self.job_id = job_id
+        self.params = params
+        self.total = None
+        self.processed = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.errors: list[str] = []
+        self._last_write = 0.0
+
+    ##
+    # @brief Records an error message for the job's error summary (the last 20 are kept).
+    #
+    def error(self, message: str):
+        self.errors = (self.errors + [message])[-20:]
+
+    ##
+    # @brief Updates the job's counters and periodically persists them.
+    # @details Persisting also checks for a cancellation request.
+    #
+    # @param processed Rows processed so far.
+    # @param total Total rows, if known.
+    # @param succeeded Rows processed successfully so far (defaults to processed - failed).
+    # @param failed Rows failed so far.
+    # @param force Persist even if the last write was recent.
+    # @throws JobCancelled If the job has been cancelled.
+    #
+    async def progress(self, processed: int, total: int | None = None, succeeded: int | None = None,
+                       failed: int | None = None, force: bool = False):
+        self.processed = processed
+        if total is not None:
+            self.total = total
+        if failed is not None:
+            self.failed = failed
+        self.succeeded = succeeded if succeeded is not None else processed - self.failed
+        if not force and time.monotonic() - self._last_write < JOB_PROGRESS_INTERVAL:
+            return
+        self._last_write = time.monotonic()
+        async with AsyncSessionLocal() as session:
+            cancel_requested = await session.scalar(
+                update(Job).where(Job.id == self.job_id).values(**self._values()).returning(Job.cancel_requested)
+            )
+            await session.commit()
+        if cancel_requested:
+            raise JobCancelled()
+
+    def _values(self) -> dict:
+        values = {
+            "processed_rows": self.processed,
+            "succeeded_rows": self.succeeded,
+            "failed_rows": self.failed,
+            "total_rows": self.total,
+            "updated_at": datetime.now(timezone.utc),
+        }
+        if self.total:
+            values["progress"] = round(min(100.0, 100.0 * self.processed / self.total), 1)
+        if self.errors:
+            values["error_summary"] = "\n".join(self.errors)
+        return values
+
+##
+# @brief Runs a queued job to completion and records the outcome.
+#
+# @param job_id The job id.
+#
+async def run_job(job_id: str):
+    async with AsyncSessionLocal() as session:
+        # Claim the job; a job cancelled while queued (or claimed by another worker) is skipped
+        job = await session.scalar(
+            update(Job).where(Job.id == job_id, Job.status == "queued", Job.cancel_requested == False)
+            .values(status="running", started_at=datetime.now(timezone.utc), updated_at=datetime.now(timezone.utc))
+            .returning(Job)
+        )
+        await session.commit()
+    if job is None:
+        return
+
+    ctx = JobContext(job_id, job.params or {})
+    values = {}
+    try:
+        handler = JOB_HANDLERS[job.kind]
+        result = await handler(ctx, **ctx.params)
+        values = {"status": "completed", "result": result, "progress": 100.0}
+    except (JobCancelled, asyncio.CancelledError):
+        values = {"status": "cancelled"}
+    except Exception as e:
+        ctx.error(str(e)[:1000])
+        values = {"status": "failed"}
+        print(f"Job {job_id} ({job.kind}) failed: {e}")
+    finally:
+        values = {**ctx._values(), **values, "finished_at": datetime.now(timezone.utc)}
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(Job).where(Job.id == job_id).values(**values))
+            await session.commit()
+
+##
+# @brief Runs jobs as asyncio tasks in the API process (development, tests, single instance).
+#
+class LocalJobBackend:
+    name = "local"
+
+    def __init__(self):
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def submit(self, job_id: str):
+        task = asyncio.create_task(run_job(job_id))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+
+    def cancel(self, job_id: str):
+        task = self._tasks.get(job_id)
+        if task is not None:
+            task.cancel()
+
+    async def stop(self):
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+##
+# @brief Dispatches jobs to Celery workers through Redis.
+# @details Start workers with `celery -A tasks.celery_app worker`.
+#
+class CeleryJobBackend:
+    name = "celery"
+
+    def __init__(self, app):
+        self.app = app
+
+    def submit(self, job_id: str):
+        self.app.send_task("asfalya.run_job", args=[job_id])
+
+    def cancel(self, job_id: str):
+        # Running handlers stop cooperatively through cancel_requested
+        pass
+
+    async def stop(self):
+        pass
+
+##
+# @brief Creates the Celery application used by CeleryJobBackend and the workers.
+#
+def create_celery_app():
+    from celery import Celery
+    app = Celery("asfalya", broker=CELERY_BROKER_URL)
+    app.conf.update(task_acks_late=True, worker_prefetch_multiplier=1, task_ignore_result=True)
+
+    @app.task(name="asfalya.run_job")
+    def run_job_task(job_id: str):
+        async def run():
+            try:
+                await run_job(job_id)
+            finally:
+                # asyncio.run() cancels pending tasks on exit: send the job's invalidations first.
+                # The bus's connection, like the engines', is bound to this task's event loop.
+                await invalidation_bus.stop()
+                await dispose_engines()
+        asyncio.run(run())
+
+    return app
+
+## Celery application, only created when JOB_BACKEND is "celery".
+celery_app = create_celery_app() if JOB_BACKEND == "celery" else None
+
+## Process-wide job backend.
+job_backend = CeleryJobBackend(celery_app) if celery_app is not None else LocalJobBackend()
+
+##
+# @brief Persists a new job and hands it to the job backend.
+# @details The job row is committed before submission so a worker can always find it.
+#
+# @param db The database session.
+# @param kind A registered job kind.
+# @param params JSON-serializable handler parameters.
+# @param created_by Email of the requesting user.
+# @return The new Job.
+#
+async def enqueue_job(db: AsyncSession, kind: str, params: dict, created_by: str | None = None) -> Job:
+    if kind not in JOB_HANDLERS:
+        raise KeyError(kind)
+    job = Job(id=uuid.uuid4().hex, kind=kind, status="queued", params=params, created_by=created_by)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    job_backend.submit(job.id)
+    return job
+
+##
+# @brief Removes a job's spooled upload, if it has one.
+#
+# @param params The job's parameters; only a "path" inside JOB_UPLOAD_DIR is removed.
+#
+def remove_job_upload(params: dict | None):
+    path = (params or {}).get("path")
+    if not path or os.path.dirname(os.path.abspath(path)) != os.path.abspath(JOB_UPLOAD_DIR):
+        return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+##
+# @brief Requests cancellation of a job.
+# @details Queued jobs are cancelled immediately and their spooled upload is removed, since no
+#          handler will run to remove it; running jobs stop at their next progress update.
+#
+# @param db The database session.
+# @param job_id The job id.
+# @return The updated Job, or None if it does not exist.
+#
+async def cancel_job(db: AsyncSession, job_id: str) -> Job | None:
+    job = await db.get(Job, job_id)
+    if job is None or job.status in FINISHED_STATUSES:
+        return job
+    # Conditional on the status, so a job claimed by a worker meanwhile is not marked cancelled
+    cancelled = await db.scalar(
+        update(Job).where(Job.id == job_id, Job.status == "queued")
+        .values(status="cancelled", cancel_requested=True, finished_at=datetime.now(timezone.utc))
+        .returning(Job.params)
+        .execution_options(synchronize_session=False)
+    )
+    if cancelled is None:
+        await db.execute(update(Job).where(Job.id == job_id).values(cancel_requested=True))
+    await db.commit()
+    if cancelled is not None:
+        remove_job_upload(cancelled)
+    job_backend.cancel(job_id)
+    await db.refresh(job)
+    return job
+
+##
+# @brief Marks running jobs without a recent heartbeat as failed (their worker died).
+#
+# @param db The database session.
+#
+async def fail_stale_jobs(db: AsyncSession):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=JOB_STALE_SECONDS)
+    await db.execute(
+        update(Job).where(Job.status == "running", Job.updated_at < cutoff)
+        .values(status="failed", error_summary="Worker stopped while the job was running", finished_at=datetime.now(timezone.utc))
+    )
+    await db.commit()
+
+##
+# @brief Serializes a job for the API.
+#
+# @param job The Job.
+# @param include_report Whether to keep the per-row import report (which can be large) in the result.
+#
+def job_as_dict(job: Job, include_report: bool = False) -> dict:
+    result = job.result
+    if isinstance(result, dict) and "report" in result and not include_report:
+        result = {k: v for k, v in result.items() if k != "report"}
+    end = job.finished_at or datetime.now(timezone.utc)
+    elapsed = (end - job.started_at).total_seconds() if job.started_at else 0.0
+    return {
+        "job_id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "total_rows": job.total_rows,
+        "processed_rows": job.processed_rows,
+        "succeeded_rows": job.succeeded_rows,
+        "failed_rows": job.failed_rows,
+        "rows_per_second": round(job.processed_rows / elapsed, 1) if elapsed > 0 else 0.0,
+        "error_summary": job.error_summary,
+        "result": result,
+        "cancel_requested": job.cancel_requested,
+        "created_by": job.created_by,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+##
+# @brief Lists recent jobs, newest first.
+#
+# @param db The database session.
+# @param kind Optional kind filter.
+# @param limit Maximum number of jobs.
+#
+async def list_jobs(db: AsyncSession, kind: str | None = None, limit: int = 50) -> list[Job]:
+    # The per-row import report is stripped in the database: it can hold IMPORT_REPORT_MAX_ROWS
+    # entries per job and is only returned by the report endpoint
+    summary = type_coerce(cast(Job.result, JSONB).op("-")("report"), JSON)
+    query = select(Job, summary).options(defer(Job.result)).order_by(Job.created_at.desc()).limit(limit)
+    if kind:
+        query = query.where(Job.kind == kind)
+    jobs = []
+    for job, result in (await db.execute(query)).all():
+        set_committed_value(job, "result", result)
+        # Detached, so a later get() in this session loads the full result
+        db.expunge(job)
+        jobs.append(job)
+    return jobs
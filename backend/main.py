@@ -1,15 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, status, Request, Query, Response
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+from sqlalchemy import select, func, or_, update
 from sqlalchemy.future import select
-from sqlalchemy import text
 from pydantic import BaseModel
-import pandas as pd
-import io
-from database import engine, Base, get_db, AsyncSessionLocal
+import asyncio
+from database import get_db, get_read_db, AsyncSessionLocal, pool_metrics
 from models import Mechanic, User
-from auth_utils import verify_password, create_access_token, get_password_hash, ACCESS_TOKEN_EXPIRE_MINUTES, generate_otp
+from email_service import enqueue_activation_email, discard_activation_emails, outbox_worker, outbox_status
+from geo import mechanic_index, mechanic_clusters, rebuild_mechanic_index, ensure_mechanic_index, index_mechanic
+from pagination import encode_cursor, decode_cursor, keyset_condition, keyset_order, estimate_count, InvalidCursorError
+from rollups import apply_rollup_changes, rollup_snapshot, ensure_rollups, month_start
+from models import MonthlyCustomerRollup, MonthlyPremiumRollup, MonthlyExpiryRollup
+from cache import response_cache, principal_cache, CUSTOMERS_TAG
+from broadcasts import CHANNELS
+from jobs import enqueue_job, cancel_job, list_jobs, job_as_dict, fail_stale_jobs, job_backend, JOB_UPLOAD_DIR
+from models import Job
+import tasks  # registers the job handlers
+from importers import read_upload_columns, validate_upload_columns, UPLOAD_EXTENSIONS
+import shutil
+import contextlib
+import hmac
+import uuid
+from auth_utils import verify_password_async, create_access_token, get_password_hash_async, ACCESS_TOKEN_EXPIRE_MINUTES, generate_otp, hashing_stats, HashingBusyError
+from auth_utils import hash_otp, verify_otp_async, unusable_password, OTP_MAX_ATTEMPTS
+from admission import AdmissionMiddleware, admission_as_dict
+from profiling import ProfilingMiddleware, profile_store
+from metrics import MetricsMiddleware, render_metrics, mark_worker_dead, METRICS_TOKEN
+from migrations import ensure_schema
+from coordination import invalidation_bus, SUPERVISED
+from serialization import FastJSONResponse, ndjson_response, rows_to_dicts, stream_dicts
+from refresh_tokens import issue_refresh_token, rotate_refresh_token, revoke_refresh_token, revoke_user_refresh_tokens, purge_expired_refresh_tokens, InvalidRefreshToken
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import timedelta, datetime, timezone
 from jose import JWTError, jwt
@@ -23,12 +45,32 @@ app = FastAPI()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 SECRET_KEY = os.getenv("SECRET_KEY", "supersecretkey")
 ALGORITHM = "HS256"
+# When enabled, admin-only read endpoints authorize from the signed "adm" claim without a user lookup.
+# A demoted admin then keeps access until the token expires (ACCESS_TOKEN_EXPIRE_MINUTES).
+AUTH_TRUST_ADMIN_CLAIM = os.getenv("AUTH_TRUST_ADMIN_CLAIM", "0") == "1"
+
+@app.exception_handler(HashingBusyError)
+async def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    """
+    @brief Turns a full password-hashing queue into a retryable 503 response.
+    """
+    return JSONResponse(status_code=503, content={"detail": "Server busy, please retry"}, headers={"Retry-After": "1"})
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: str | None = None
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+def _access_token_for(user: User) -> str:
+    return create_access_token(
+        data={"sub": user.email if user.email else user.phone, "adm": user.is_admin},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES),
+    )
+
+def _decode_token(token: str) -> dict:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -36,25 +78,89 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession
     )
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
+        if payload.get("sub") is None:
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-        
+    return payload
+
+async def _load_user(payload: dict, db: AsyncSession) -> User:
+    email: str = payload["sub"]
+    snapshot = principal_cache.get(email)
+    if snapshot is not None:
+        # Detached partial copy: handlers that modify the user or check its credentials must
+        # re-load it in their session
+        return User(**snapshot)
+
     result = await db.execute(select(User).where(User.email == email))
     user = result.scalars().first()
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # Only the public fields /me returns, which include those authorization reads (id, email,
+    # is_admin, is_active): the password hash and OTP state never enter the cache
+    principal_cache.put(email, user.id, {key: getattr(user, key) for key in USER_RESPONSE_FIELDS})
     return user
 
-@app.get("/api/users/me")
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    """
+    @brief Resolves the user of a bearer token.
+    @details Served from the principal cache when possible; a cached user is a detached copy.
+    """
+    return await _load_user(_decode_token(token), db)
+
+class ClaimsPrincipal:
+    """
+    @brief Identity built from signed token claims only, for pure authorization checks.
+    """
+    def __init__(self, payload: dict):
+        self.email = payload["sub"]
+        self.is_admin = bool(payload["adm"])
+
+async def get_current_principal(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    """
+    @brief Resolves the caller for endpoints that only need to know who is asking and whether they are admin.
+    @details Uses the signed "adm" claim when AUTH_TRUST_ADMIN_CLAIM is enabled, otherwise falls back to get_current_user.
+    """
+    payload = _decode_token(token)
+    if AUTH_TRUST_ADMIN_CLAIM and "adm" in payload:
+        principal_cache.claim_hits += 1
+        return ClaimsPrincipal(payload)
+    return await _load_user(payload, db)
+
+class UserResponse(BaseModel):
+    """
+    @brief Public fields of a user; never includes the password hash or OTP state.
+    """
+    id: int
+    email: str | None
+    phone: str | None
+    full_name: str | None
+    premium: float | None
+    is_active: bool
+    is_admin: bool
+    policy_type: str | None
+    policy_number: str | None
+    policy_expiry: datetime | None
+    vehicle_plate: str | None
+    
+    class Config:
+        from_attributes = True
+
+## User columns selected by list endpoints, in UserResponse field order.
+USER_RESPONSE_FIELDS = list(UserResponse.model_fields)
+USER_RESPONSE_COLUMNS = [getattr(User, field) for field in USER_RESPONSE_FIELDS]
+
+@app.get("/api/users/me", response_model=UserResponse)
 async def read_users_me(current_user: User = Depends(get_current_user)):
     """
     @brief Retrieves the currently authenticated user's profile.
     
     @param current_user The current user object (injected by dependency).
-    @return The user object.
+    @return The user's public fields (UserResponse).
     """
     return current_user
 
@@ -77,17 +183,48 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
          result = await db.execute(select(User).where(User.phone == form_data.username))
          user = result.scalars().first()
 
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or not await verify_password_async(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.email if user.email else user.phone}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    refresh_token = issue_refresh_token(db, user.id)
+    await db.commit()
+    return {"access_token": _access_token_for(user), "token_type": "bearer", "refresh_token": refresh_token}
+
+@app.post("/token/refresh", response_model=Token)
+async def refresh_access_token(request: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """
+    @brief Exchanges a refresh token for a new access token and a new refresh token.
+    @details No password hashing is involved; the presented refresh token is rotated and stops working.
+
+    @param request The refresh token issued by /token, /register or a previous refresh.
+    @param db The database session.
+    @return A dictionary containing the new access and refresh tokens.
+    @throws HTTPException If the refresh token is invalid, expired or revoked.
+    """
+    try:
+        user, refresh_token = await rotate_refresh_token(db, request.refresh_token)
+    except InvalidRefreshToken:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {"access_token": _access_token_for(user), "token_type": "bearer", "refresh_token": refresh_token}
+
+@app.post("/token/revoke")
+async def revoke_token(request: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """
+    @brief Revokes the session of a refresh token (logout).
+
+    @param request The refresh token.
+    @param db The database session.
+    @return A success message.
+    """
+    await revoke_refresh_token(db, request.refresh_token)
+    return {"message": "Session revoked"}
 
 class UserRegister(BaseModel):
     full_name: str
@@ -118,22 +255,27 @@ async def register_user(user: UserRegister, db: AsyncSession = Depends(get_db)):
         email=user.email,
         phone=user.phone,
         full_name=user.full_name,
-        hashed_password=get_password_hash(user.password),
+        hashed_password=await get_password_hash_async(user.password),
         is_active=True,
         is_admin=False
     )
     
     db.add(new_user)
+    await apply_rollup_changes(db, added=[rollup_snapshot(new_user)])
     await db.commit()
+    await response_cache.invalidate_tags(CUSTOMERS_TAG)
     await db.refresh(new_user)
     
-    # Generate access token
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": new_user.email}, expires_delta=access_token_expires
-    )
-    
-    return {"access_token": access_token, "token_type": "bearer"}
+    # Generate access and refresh tokens
+    refresh_token = issue_refresh_token(db, new_user.id)
+    await db.commit()
+    return {"access_token": _access_token_for(new_user), "token_type": "bearer", "refresh_token": refresh_token}
+
+# Innermost: only admitted requests are traced and profiled
+app.add_middleware(ProfilingMiddleware)
+
+# Added before CORS so shed responses still carry CORS headers
+app.add_middleware(AdmissionMiddleware)
 
 origins = [
     "http://localhost:3000",
@@ -146,45 +288,57 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Total-Count", "X-Profile-Id"],
 )
 
+# Outermost, so shed and CORS-rejected requests are measured too
+app.add_middleware(MetricsMiddleware, router=app.router)
+
+async def run_startup_tasks():
+    """
+    @brief One-time startup work: pending schema migrations, missing analytics rollups, jobs left running by a dead worker and expired refresh tokens.
+    @details serve.py runs it once in the supervisor before starting the workers; a plain `uvicorn main:app` runs it from startup().
+    """
+    await ensure_schema()
+    async with AsyncSessionLocal() as session:
+        await ensure_rollups(session)
+        await fail_stale_jobs(session)
+        await purge_expired_refresh_tokens(session)
+
 @app.on_event("startup")
 async def startup():
     """
     @brief Startup event handler.
-    @details Initializes the database, runs migrations for missing OTP columns, and seeds the admin user if not present.
+    @details Runs the one-time startup work (under serve.py only the cheap schema version check), loads this process's mechanic spatial index and starts the email outbox worker and the invalidation listener.
     """
     try:
-        # Create tables
-        async with engine.begin() as conn:
-            await conn.run_sync(Base.metadata.create_all)
-            
-            # --- MIGRATION: ADD MISSING COLUMNS ---
-            try:
-                await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS otp_code VARCHAR"))
-                await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS otp_expiry TIMESTAMP WITH TIME ZONE"))
-            except:
-                pass 
-            # --------------------------------------
-
-        # Seed Admin User
+        if SUPERVISED:
+            await ensure_schema(retry_optional=False)
+        else:
+            await run_startup_tasks()
+
+        # The spatial index lives in process memory, so every worker loads its own
         async with AsyncSessionLocal() as session:
-            result = await session.execute(select(User).where(User.email == "admin@asfalya.com"))
-            if not result.scalars().first():
-                admin_user = User(
-                    email="admin@asfalya.com",
-                    hashed_password=get_password_hash("admin123"),
-                    phone="+0000000000",  # Dummy phone number to satisfy constraint
-                    is_active=True,
-                    is_admin=True
-                )
-                session.add(admin_user)
-                await session.commit()
+            await rebuild_mechanic_index(session)
+
+        outbox_worker.start()
+        invalidation_bus.start()
     except Exception as e:
         # We only log critical startup failures
         print(f"FAILED TO START APPLICATION: {e}")
         raise e
 
+@app.on_event("shutdown")
+async def shutdown():
+    """
+    @brief Shutdown event handler.
+    @details Stops the email outbox worker and the invalidation listener, cancels jobs running in this process and drops this worker's live metrics.
+    """
+    await outbox_worker.stop()
+    await invalidation_bus.stop()
+    await job_backend.stop()
+    mark_worker_dead()
+
 @app.get("/")
 def read_root():
     """
@@ -193,148 +347,244 @@ def read_root():
     """
     return {"Hello": "World"}
 
-@app.post("/api/upload/mechanics")
-async def upload_mechanics(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+@app.get("/metrics", include_in_schema=False)
+def get_metrics(request: Request):
+    """
+    @brief Prometheus metrics: request, SQL, bcrypt, email and import counters and latencies.
+    @details Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is set.
+    """
+    if METRICS_TOKEN and not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Not authorized")
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+async def spool_upload(file: UploadFile, kind: str) -> str:
+    """
+    @brief Saves an uploaded file to JOB_UPLOAD_DIR for a background import job.
+    @details The file is copied in 1 MB chunks off the event loop, then its header row is checked.
+    
+    @param file The uploaded .xlsx or .csv file.
+    @param kind "mechanics" or "customers".
+    @return The path of the saved file.
+    @throws HTTPException If the file type is not supported or required columns are missing.
+    """
+    extension = os.path.splitext(file.filename or "")[1].lower()
+    if extension not in UPLOAD_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="Invalid file format. Please upload an Excel (.xlsx) or CSV file.")
+
+    os.makedirs(JOB_UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(JOB_UPLOAD_DIR, f"{uuid.uuid4().hex}{extension}")
+
+    def copy():
+        with open(path, "wb") as out:
+            shutil.copyfileobj(file.file, out, 1024 * 1024)
+
+    try:
+        await asyncio.to_thread(copy)
+        columns = await asyncio.to_thread(read_upload_columns, path)
+    except Exception:
+        # open() itself may have failed, leaving nothing to remove
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+        raise HTTPException(status_code=400, detail="Could not read the uploaded file.")
+    error = validate_upload_columns(kind, columns)
+    if error:
+        os.remove(path)
+        raise HTTPException(status_code=400, detail=error)
+    return path
+
+@app.post("/api/upload/mechanics", status_code=202)
+async def upload_mechanics(
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_principal)
+):
     """
-    @brief Uploads a list of mechanics from an Excel file.
-    @details Admin only. Requires 'name', 'address', 'latitude', 'longitude' columns.
+    @brief Queues an import of mechanics from an Excel or CSV file.
+    @details Admin only. Requires 'name', 'address', 'latitude', 'longitude' columns. The import runs
+             as a background job; poll /api/jobs/{job_id} for progress and the result.
     
-    @param file The Excel file (.xlsx) containing mechanics data.
+    @param file The Excel (.xlsx) or CSV file containing mechanics data.
+    @param dry_run Validate and report rows without importing them.
     @param db The database session.
     @param current_user The current authenticated user (must be admin).
-    @return A success message with the count of imported mechanics.
+    @return The queued job, including its job_id.
     """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
-    if not file.filename.endswith('.xlsx'):
-        raise HTTPException(status_code=400, detail="Invalid file format. Please upload an Excel file.")
+    path = await spool_upload(file, "mechanics")
+    job = await enqueue_job(db, "import_mechanics", {"path": path, "filename": file.filename, "dry_run": dry_run}, created_by=current_user.email)
+    return {"message": "Import queued", **job_as_dict(job)}
 
-    try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Validation: Check required columns
-        required_columns = ['name', 'address', 'latitude', 'longitude']
-        if not all(col in df.columns for col in required_columns):
-             raise HTTPException(status_code=400, detail=f"Missing required columns: {required_columns}")
-
-        mechanics = []
-        for _, row in df.iterrows():
-            mechanic = Mechanic(
-                name=row['name'],
-                address=row['address'],
-                latitude=str(row['latitude']),
-                longitude=str(row['longitude']),
-                phone=str(row.get('phone', ''))
-            )
-            db.add(mechanic)
-        
-        await db.commit()
-        return {"message": f"Successfully imported {len(df)} mechanics"}
-        
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
-
-@app.post("/api/upload/customers")
-async def upload_customers(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+@app.post("/api/upload/customers", status_code=202)
+async def upload_customers(
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_principal)
+):
     """
-    @brief Uploads a list of customers from an Excel file.
-    @details Admin only. Generates OTPs for each new customer and sets a temporary random password.
+    @brief Queues an import of customers from an Excel or CSV file.
+    @details Admin only. Rows are upserted on phone/email: existing customers are updated, unchanged
+             rows skipped and invalid or duplicate rows rejected. New customers get OTPs and a temporary
+             random password. The import runs as a background job; poll /api/jobs/{job_id} for progress
+             and /api/jobs/{job_id}/report for the per-row outcome.
     
-    @param file The Excel file (.xlsx) containing customer data.
+    @param file The Excel (.xlsx) or CSV file containing customer data.
+    @param dry_run Classify and report rows without writing anything.
     @param db The database session.
     @param current_user The current authenticated user (must be admin).
-    @return A success message with the count of imported customers.
+    @return The queued job, including its job_id.
     """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
-    if not file.filename.endswith('.xlsx'):
-        raise HTTPException(status_code=400, detail="Invalid file format. Please upload an Excel file.")
+    path = await spool_upload(file, "customers")
+    job = await enqueue_job(db, "import_customers", {"path": path, "filename": file.filename, "dry_run": dry_run}, created_by=current_user.email)
+    return {"message": "Import queued", **job_as_dict(job)}
 
-    try:
-        contents = await file.read()
-        df = pd.read_excel(io.BytesIO(contents))
-        
-        # Validation: Check required columns
-        # We need either email or phone, so we check if at least one of these columns exists in the dataframe
-        if 'email' not in df.columns and 'phone' not in df.columns:
-             raise HTTPException(status_code=400, detail="Missing required columns: must have 'email' or 'phone'")
-
-        users = []
-        for _, row in df.iterrows():
-            email = row.get('email')
-            phone = row.get('phone')
-            
-            if pd.isna(email) and pd.isna(phone):
-                continue # Skip rows without email or phone
-
-            # Handle NaN values explicitly
-            email_val = str(email) if not pd.isna(email) else None
-            phone_val = str(phone) if not pd.isna(phone) else None
-
-            # Check if user already exists (simplified check)
-            # In a real app we'd query DB, but here we'll let unique constraint handle it or do a pre-check
-            # For now let's just create and catch integrity errors if needed, or better, skip provided duplicates in this simple implementation
-            
-            otp = generate_otp()
-            # Send real email via Resend
-            from email_service import send_activation_email
-            if email_val:
-                try:
-                    import asyncio
-                    asyncio.create_task(send_activation_email(email_val, otp)) # Background task for bulk
-                except Exception as e:
-                    # Log error but don't stop everything
-                    print(f"Failed to trigger onboarding email for {email_val}")
-
-            user = User(
-                email=email_val,
-                phone=phone_val,
-                hashed_password=get_password_hash(generate_otp(12)), # Random initial password
-                otp_code=get_password_hash(otp),
-                otp_expiry=datetime.now(timezone.utc) + timedelta(days=7), # Give them a week to activate
-                is_active=True, # They are active, just can't login without password
-                is_admin=False
-            )
-            db.add(user)
-        
-        await db.commit()
-        return {"message": f"Successfully imported {len(df)} customers"}
-        
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail=str(e))
+class MechanicResponse(BaseModel):
+    id: int
+    name: str
+    address: str
+    latitude: float
+    longitude: float
+    phone: str | None
+
+class NearbyMechanicResponse(MechanicResponse):
+    ## Only present in location searches.
+    distance_km: float | None = None
 
-@app.get("/api/mechanics")
-async def get_mechanics(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+class ClusterResponse(BaseModel):
+    count: int
+    latitude: float
+    longitude: float
+
+class MechanicClustersResponse(BaseModel):
+    zoom: int
+    clusters: list[ClusterResponse]
+    points: list[MechanicResponse]
+
+## Mechanic columns selected by the map endpoints, in MechanicResponse field order.
+MECHANIC_RESPONSE_FIELDS = list(MechanicResponse.model_fields)
+MECHANIC_RESPONSE_COLUMNS = [getattr(Mechanic, field) for field in MECHANIC_RESPONSE_FIELDS]
+
+@app.get("/api/mechanics", response_model=list[NearbyMechanicResponse], response_class=FastJSONResponse)
+async def get_mechanics(
+    lat: float | None = Query(None, ge=-90, le=90),
+    lon: float | None = Query(None, ge=-180, le=180),
+    radius_km: float | None = Query(None, gt=0),
+    limit: int = Query(20, ge=1, le=500),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_principal)
+):
     """
-    @brief Retrieves a list of all mechanics.
+    @brief Retrieves mechanics, optionally the nearest ones to a location.
+    @details Without `lat`/`lon` every mechanic is returned; `format=ndjson` streams them as
+             newline-delimited JSON. With them, the in-process spatial index returns up to `limit`
+             mechanics within `radius_km`, sorted by distance.
     
+    @param lat Latitude of the search origin.
+    @param lon Longitude of the search origin.
+    @param radius_km Optional search radius in kilometres.
+    @param limit Maximum number of mechanics to return for a location search.
+    @param format "json" (default) or "ndjson".
     @param db The database session.
     @param current_user The current authenticated user.
-    @return A list of Mechanic objects.
+    @return A list of mechanics; location searches include a `distance_km` field.
     """
-    result = await db.execute(select(Mechanic))
-    mechanics = result.scalars().all()
-    return mechanics
+    if lat is None or lon is None:
+        query = select(*MECHANIC_RESPONSE_COLUMNS)
+        if format == "ndjson":
+            return ndjson_response(stream_dicts(db, query, MECHANIC_RESPONSE_FIELDS))
+        result = await db.execute(query)
+        return FastJSONResponse(rows_to_dicts(result.all(), MECHANIC_RESPONSE_FIELDS))
 
+    await ensure_mechanic_index(db)
+    nearest = mechanic_index.nearest(lat, lon, limit=limit, radius_km=radius_km)
+    mechanics = []
+    if nearest:
+        result = await db.execute(select(*MECHANIC_RESPONSE_COLUMNS).where(Mechanic.id.in_([mechanic_id for _, mechanic_id in nearest])))
+        by_id = {m["id"]: m for m in rows_to_dicts(result.all(), MECHANIC_RESPONSE_FIELDS)}
+        mechanics = [
+            {**by_id[mechanic_id], "distance_km": round(distance, 3)}
+            for distance, mechanic_id in nearest
+            if mechanic_id in by_id
+        ]
+    return ndjson_response(mechanics) if format == "ndjson" else FastJSONResponse(mechanics)
 
-class UserResponse(BaseModel):
-    id: int
-    email: str | None
-    phone: str | None
-    full_name: str | None
-    premium: float | None
-    is_active: bool
-    is_admin: bool
-    policy_type: str | None
-    policy_number: str | None
-    policy_expiry: datetime | None
-    vehicle_plate: str | None
+
+@app.get("/api/mechanics/clusters", response_model=MechanicClustersResponse, response_class=FastJSONResponse)
+async def get_mechanic_clusters(
+    bbox: str,
+    zoom: int = Query(..., ge=0, le=22),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_principal)
+):
+    """
+    @brief Retrieves pre-aggregated mechanic clusters for a map viewport.
+    @details Clusters come from the in-process zoom-level grid index. From the index's point zoom
+             onwards (and for clusters holding a single mechanic) individual mechanics are returned.
     
-    class Config:
-        from_attributes = True
+    @param bbox The viewport as "min_lon,min_lat,max_lon,max_lat" (Leaflet's toBBoxString()).
+    @param zoom The map zoom level.
+    @param db The database session.
+    @param current_user The current authenticated user.
+    @return A dictionary with `clusters` (count + centroid) and `points` (mechanics).
+    @throws HTTPException If the bounding box is malformed.
+    """
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be 'min_lon,min_lat,max_lon,max_lat'")
+    if min_lon > max_lon or min_lat > max_lat:
+        raise HTTPException(status_code=400, detail="bbox must be 'min_lon,min_lat,max_lon,max_lat'")
+
+    await ensure_mechanic_index(db)
+    clusters, points = mechanic_clusters.query(min_lon, min_lat, max_lon, max_lat, zoom)
+
+    mechanics = []
+    if points:
+        result = await db.execute(select(*MECHANIC_RESPONSE_COLUMNS).where(Mechanic.id.in_([p[0] for p in points])))
+        mechanics = rows_to_dicts(result.all(), MECHANIC_RESPONSE_FIELDS)
+
+    return FastJSONResponse({
+        "zoom": zoom,
+        "clusters": [{"count": count, "latitude": lat, "longitude": lon} for count, lat, lon in clusters],
+        "points": mechanics,
+    })
+
+class MechanicCreate(BaseModel):
+    name: str
+    address: str
+    latitude: float
+    longitude: float
+    phone: str | None = None
+
+@app.post("/api/mechanics")
+async def create_mechanic(mechanic_create: MechanicCreate, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+    """
+    @brief Creates a single mechanic.
+    @details Admin only. The new mechanic is added to the spatial and cluster indexes incrementally.
+    
+    @param mechanic_create The mechanic data.
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return The created Mechanic.
+    @throws HTTPException If not authorized or the coordinates are out of range.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    if abs(mechanic_create.latitude) > 90 or abs(mechanic_create.longitude) > 180:
+        raise HTTPException(status_code=400, detail="Invalid coordinates")
+
+    mechanic = Mechanic(**mechanic_create.model_dump())
+    db.add(mechanic)
+    await db.commit()
+    await db.refresh(mechanic)
+    index_mechanic(mechanic)
+    return mechanic
 
 class UserUpdate(BaseModel):
     email: str | None = None
@@ -346,22 +596,110 @@ class UserUpdate(BaseModel):
     policy_expiry: datetime | None = None
     vehicle_plate: str | None = None
 
-@app.get("/api/customers", response_model=list[UserResponse])
-async def get_customers(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+## Columns the customer list can be sorted by (prefix with "-" for descending).
+CUSTOMER_SORT_COLUMNS = {
+    "id": User.id,
+    "created_at": User.created_at,
+    "policy_expiry": User.policy_expiry,
+    "premium": User.premium,
+    "full_name": User.full_name,
+}
+
+@app.get("/api/customers", response_model=list[UserResponse], response_class=FastJSONResponse)
+async def get_customers(
+    limit: int | None = Query(None, ge=1, le=1000),
+    cursor: str | None = None,
+    sort: str = "id",
+    policy_type: str | None = None,
+    expiry_from: datetime | None = None,
+    expiry_to: datetime | None = None,
+    active: bool | None = None,
+    q: str | None = None,
+    count: str = Query("none", pattern="^(none|estimate|exact)$"),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_principal)
+):
     """
-    @brief Retrieves a list of all non-admin customers.
-    @details Admin only.
+    @brief Retrieves non-admin customers with keyset pagination, filters and sorting.
+    @details Admin only. Without `limit` every matching customer is returned; `format=ndjson`
+             streams them as newline-delimited JSON instead of building one large array. With
+             `limit`, the `X-Next-Cursor` response header carries the cursor for the next page
+             (absent on the last page). `count=estimate` reports the planner's row estimate and
+             `count=exact` an exact count in the `X-Total-Count` header.
     
+    @param limit Page size.
+    @param cursor Cursor returned by the previous page.
+    @param sort Sort column, optionally prefixed with "-" for descending order.
+    @param policy_type Only customers with this policy type.
+    @param expiry_from Only policies expiring at or after this time.
+    @param expiry_to Only policies expiring at or before this time.
+    @param active Only active (or inactive) customers.
+    @param q Case-insensitive search over name, plate, policy number, email and phone.
+    @param count Total count mode: "none", "estimate" or "exact".
+    @param format "json" (default) or "ndjson".
     @param db The database session.
     @param current_user The current authenticated user (must be admin).
-    @return A list of UserResponse objects.
-    @throws HTTPException If not authorized.
+    @return A list of customers (UserResponse fields).
+    @throws HTTPException If not authorized or the sort/cursor is invalid.
     """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
-    
-    result = await db.execute(select(User).where(User.is_admin == False))
-    return result.scalars().all()
+
+    descending = sort.startswith("-")
+    sort_column = CUSTOMER_SORT_COLUMNS.get(sort.lstrip("-"))
+    if sort_column is None:
+        raise HTTPException(status_code=400, detail=f"Invalid sort. Choose from: {', '.join(CUSTOMER_SORT_COLUMNS)}")
+
+    # The sort column is selected too when it is not a response field, for the next cursor
+    columns = USER_RESPONSE_COLUMNS + ([] if sort_column.key in USER_RESPONSE_FIELDS else [sort_column])
+    query = select(*columns).where(User.is_admin == False)
+    if policy_type is not None:
+        query = query.where(User.policy_type == policy_type)
+    if expiry_from is not None:
+        query = query.where(User.policy_expiry >= expiry_from)
+    if expiry_to is not None:
+        query = query.where(User.policy_expiry <= expiry_to)
+    if active is not None:
+        query = query.where(User.is_active == active)
+    if q:
+        query = query.where(or_(
+            User.full_name.icontains(q, autoescape=True),
+            User.vehicle_plate.icontains(q, autoescape=True),
+            User.policy_number.icontains(q, autoescape=True),
+            User.email.icontains(q, autoescape=True),
+            User.phone.icontains(q, autoescape=True),
+        ))
+
+    headers = {}
+    if count == "exact":
+        total = await db.execute(select(func.count()).select_from(query.subquery()))
+        headers["X-Total-Count"] = str(total.scalar())
+    elif count == "estimate":
+        headers["X-Total-Count"] = str(await estimate_count(db, query))
+
+    if cursor:
+        try:
+            value, row_id = decode_cursor(cursor, sort)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(keyset_condition(sort_column, User.id, descending, value, row_id))
+
+    query = query.order_by(*keyset_order(sort_column, User.id, descending))
+    if limit is None:
+        if format == "ndjson":
+            return ndjson_response(stream_dicts(db, query, USER_RESPONSE_FIELDS), headers=headers)
+        result = await db.execute(query)
+        return FastJSONResponse(rows_to_dicts(result.all(), USER_RESPONSE_FIELDS), headers=headers)
+
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        headers["X-Next-Cursor"] = encode_cursor(sort, last[sort_column.key], last["id"])
+    customers = rows_to_dicts(rows, USER_RESPONSE_FIELDS)
+    return ndjson_response(customers, headers=headers) if format == "ndjson" else FastJSONResponse(customers, headers=headers)
 
 class UserCreate(BaseModel):
     email: str | None = None
@@ -390,22 +728,13 @@ async def create_customer(user_create: UserCreate, db: AsyncSession = Depends(ge
              raise HTTPException(status_code=400, detail="Phone already registered")
 
     otp = generate_otp()
-    # Send real email via Resend
-    from email_service import send_activation_email
-    if user_create.email:
-        try:
-            import asyncio
-            asyncio.create_task(send_activation_email(user_create.email, otp))
-        except Exception as e:
-            # Log error but don't stop everything
-            print(f"Failed to trigger onboarding email for {user_create.email}")
-
+    otp_expiry = datetime.now(timezone.utc) + timedelta(days=7)
     new_user = User(
         email=user_create.email,
         phone=user_create.phone,
-        hashed_password=get_password_hash(generate_otp(12)), # Random initial password
-        otp_code=get_password_hash(otp),
-        otp_expiry=datetime.now(timezone.utc) + timedelta(days=7),
+        hashed_password=unusable_password(), # No password until activation
+        otp_code=hash_otp(otp),
+        otp_expiry=otp_expiry,
         is_active=True,
         is_admin=False,
         full_name=user_create.full_name,
@@ -417,7 +746,13 @@ async def create_customer(user_create: UserCreate, db: AsyncSession = Depends(ge
     )
     
     db.add(new_user)
+    await apply_rollup_changes(db, added=[rollup_snapshot(new_user)])
+    # Queue the onboarding email in the same transaction as the user
+    if user_create.email:
+        await enqueue_activation_email(db, user_create.email, otp, otp_expiry)
     await db.commit()
+    await response_cache.invalidate_tags(CUSTOMERS_TAG)
+    outbox_worker.notify()
     await db.refresh(new_user)
     return new_user
 
@@ -431,6 +766,7 @@ async def update_customer(user_id: int, user_update: UserUpdate, db: AsyncSessio
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
+    before = rollup_snapshot(user)
     if user_update.email is not None:
         user.email = user_update.email
     if user_update.phone is not None:
@@ -448,45 +784,165 @@ async def update_customer(user_id: int, user_update: UserUpdate, db: AsyncSessio
     if user_update.vehicle_plate is not None:
         user.vehicle_plate = user_update.vehicle_plate
         
+    await apply_rollup_changes(db, removed=[before], added=[rollup_snapshot(user)])
     await db.commit()
+    principal_cache.invalidate_user(user.id)
+    await response_cache.invalidate_tags(CUSTOMERS_TAG)
     await db.refresh(user)
     return user
 
 class NotificationRequest(BaseModel):
     message: str
     target_audience: str = "all" # 'all', 'active', 'renewal_1week'
+    channel: str = "whatsapp" # 'whatsapp', 'sms', 'email'
 
-@app.post("/api/notifications/broadcast")
+@app.post("/api/notifications/broadcast", status_code=202)
 async def broadcast_notification(
     request: NotificationRequest, 
     db: AsyncSession = Depends(get_db), 
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_principal)
 ):
+    """
+    @brief Starts a broadcast to a target audience as a background job.
+    @details Recipients are streamed from the database in chunks and sent through the selected
+             channel with its rate limit. Poll the returned job id for progress.
+    
+    @param request The message, target audience and channel.
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return The initial job status, including its job_id.
+    @throws HTTPException If not authorized or the channel is unknown.
+    """
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
+    if request.channel not in CHANNELS:
+        raise HTTPException(status_code=400, detail=f"Unknown channel; expected one of: {', '.join(CHANNELS)}")
+
+    job = await enqueue_job(db, "broadcast", request.model_dump(), created_by=current_user.email)
+    return broadcast_as_dict(job)
+
+def broadcast_as_dict(job: Job) -> dict:
+    """
+    @brief Serializes a broadcast job, adding the message counts the admin page reads.
+    """
+    result = job.result or {}
+    return {**job_as_dict(job), "sent_count": result.get("sent_count", job.succeeded_rows), "skipped": result.get("skipped")}
+
+@app.get("/api/notifications/broadcast/{job_id}")
+async def get_broadcast_status(job_id: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports the progress of a broadcast job.
     
-    query = select(User).where(User.is_admin == False)
-    if request.target_audience == 'active':
-        query = query.where(User.is_active == True)
-    elif request.target_audience == 'renewal_1week':
-        now = datetime.now()
-        next_week = now + timedelta(days=7)
-        # Check if expiry is in the future AND within next 7 days
-        query = query.where(User.policy_expiry >= now).where(User.policy_expiry <= next_week)
-        
-    result = await db.execute(query)
-    users = result.scalars().all()
-    
-    count = 0
-    print(f"--- START BROADCAST: {request.message} ---")
-    for user in users:
-        if user.phone:
-            # Mock sending
-            print(f"[Mock WhatsApp] Sending to {user.phone}: {request.message}")
-            count += 1
-    print(f"--- END BROADCAST: Sent {count} messages ---")
-            
-    return {"status": "success", "sent_count": count}
+    @param job_id The id returned when the broadcast was started.
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return Job status with sent_count, skipped, failures, progress and throughput.
+    @throws HTTPException If not authorized or the job is unknown.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = await db.get(Job, job_id)
+    if job is None or job.kind != "broadcast":
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    return broadcast_as_dict(job)
+
+@app.delete("/api/notifications/broadcast/{job_id}")
+async def cancel_broadcast(job_id: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_principal)):
+    """
+    @brief Cancels a broadcast job. Messages already sent are not recalled.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = await cancel_job(db, job_id)
+    if job is None or job.kind != "broadcast":
+        raise HTTPException(status_code=404, detail="Broadcast job not found")
+    return broadcast_as_dict(job)
+
+@app.get("/api/jobs")
+async def get_jobs(
+    kind: str | None = None,
+    limit: int = Query(50, ge=1, le=200),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_principal)
+):
+    """
+    @brief Lists recent background jobs, newest first.
+    
+    @param kind Optional job kind filter ('import_mechanics', 'import_customers', 'broadcast').
+    @param limit Maximum number of jobs to return.
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return A list of jobs.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return [job_as_dict(job) for job in await list_jobs(db, kind, limit)]
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports the status, progress, row counts, errors and result of a background job.
+    
+    @param job_id The job id.
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return The job.
+    @throws HTTPException If not authorized or the job is unknown.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = await db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_as_dict(job)
+
+@app.get("/api/jobs/{job_id}/report")
+async def get_job_report(
+    job_id: str,
+    status: str | None = Query(None, pattern="^(inserted|updated|skipped|rejected)$"),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_principal)
+):
+    """
+    @brief Returns the per-row report of a finished import job.
+    
+    @param job_id The job id.
+    @param status Optional filter: 'inserted', 'updated', 'skipped' or 'rejected'.
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return Row counts per status and a list of {row, status, reason} entries (row is the sheet row number).
+    @throws HTTPException If not authorized, or the job is unknown or has no report.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = await db.get(Job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not isinstance(job.result, dict) or "report" not in job.result:
+        raise HTTPException(status_code=404, detail="This job has no row report")
+    result = job.result
+    rows = result["report"] if status is None else [r for r in result["report"] if r["status"] == status]
+    return {**{k: v for k, v in result.items() if k != "report"}, "report": rows}
+
+@app.post("/api/jobs/{job_id}/cancel")
+async def cancel_job_endpoint(job_id: str, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_principal)):
+    """
+    @brief Cancels a background job.
+    @details Queued jobs are cancelled immediately; running jobs stop at their next progress update.
+             Import chunks already committed are kept.
+    
+    @param job_id The job id.
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return The job.
+    @throws HTTPException If not authorized or the job is unknown.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    job = await cancel_job(db, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_as_dict(job)
 
 @app.delete("/api/customers/{user_id}")
 async def delete_customer(user_id: int, db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
@@ -498,75 +954,92 @@ async def delete_customer(user_id: int, db: AsyncSession = Depends(get_db), curr
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
         
+    await apply_rollup_changes(db, removed=[rollup_snapshot(user)])
     await db.delete(user)
     await db.commit()
+    principal_cache.invalidate_user(user_id)
+    await response_cache.invalidate_tags(CUSTOMERS_TAG)
     return {"message": "User deleted successfully"}
 
 # Analytics Endpoints
-from collections import Counter, defaultdict
+# Aggregates are read from the rollup tables maintained by rollups.py, so each
+# endpoint reads O(months) rows regardless of the number of customers. Results are
+# cached and invalidated through the "customers" tag whenever a customer changes.
 
 @app.get("/api/analytics/policy-distribution")
-async def get_policy_distribution(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_policy_distribution(db: AsyncSession = Depends(get_read_db), current_user: User = Depends(get_current_principal)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    result = await db.execute(select(User.policy_type))
-    policies = result.scalars().all()
-    
-    # Filter out None and count
-    counts = Counter([p for p in policies if p])
-    return [{"name": k, "value": v} for k, v in counts.items()]
+    async def load():
+        policies = func.sum(MonthlyPremiumRollup.policies)
+        result = await db.execute(
+            select(MonthlyPremiumRollup.policy_type, policies)
+            .where(MonthlyPremiumRollup.policy_type != "")
+            .group_by(MonthlyPremiumRollup.policy_type)
+            .having(policies > 0)
+        )
+        return [{"name": name, "value": int(value)} for name, value in result.all()]
+
+    return await response_cache.get_or_load("analytics:policy-distribution", load, tags=[CUSTOMERS_TAG])
 
 @app.get("/api/analytics/expiry-timeline")
-async def get_expiry_timeline(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_expiry_timeline(db: AsyncSession = Depends(get_read_db), current_user: User = Depends(get_current_principal)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    now = datetime.now()
-    six_months_later = now + timedelta(days=180)
+    async def load():
+        now = datetime.now()
+        six_months_later = now + timedelta(days=180)
+        first_month = month_start(now)
+        last_month = month_start(six_months_later)
+    
+        # Whole months in between come from the rollup
+        result = await db.execute(
+            select(MonthlyExpiryRollup.month, MonthlyExpiryRollup.policies)
+            .where(MonthlyExpiryRollup.month > first_month)
+            .where(MonthlyExpiryRollup.month < last_month)
+        )
+        monthly_counts = {month: count for month, count in result.all()}
     
-    result = await db.execute(select(User.policy_expiry).where(User.policy_expiry >= now).where(User.policy_expiry <= six_months_later))
-    expiries = result.scalars().all()
+        # The two partial months at the edges of the window are counted exactly (range scans on ix_users_policy_expiry)
+        async def count_expiring(*conditions):
+            result = await db.execute(select(func.count()).select_from(User).where(User.is_admin == False).where(*conditions))
+            return result.scalar()
+    
+        next_month = datetime.combine((first_month + timedelta(days=32)).replace(day=1), datetime.min.time())
+        monthly_counts[first_month] = await count_expiring(User.policy_expiry >= now, User.policy_expiry < next_month)
+        monthly_counts[last_month] = await count_expiring(
+            User.policy_expiry >= datetime.combine(last_month, datetime.min.time()),
+            User.policy_expiry <= six_months_later,
+        )
     
-    # Aggregate by Month-Year
-    monthly_counts = defaultdict(int)
-    for date in expiries:
-        if date:
-            key = date.strftime("%Y-%m") # e.g., 2024-01
-            monthly_counts[key] += 1
-            
-    # Sort and format
-    sorted_keys = sorted(monthly_counts.keys())
-    return [{"month": k, "count": monthly_counts[k]} for k in sorted_keys]
+        return [{"month": k.strftime("%Y-%m"), "count": v} for k, v in sorted(monthly_counts.items()) if v > 0]
+
+    return await response_cache.get_or_load("analytics:expiry-timeline", load, tags=[CUSTOMERS_TAG])
 
 @app.get("/api/analytics/customer-growth")
-async def get_customer_growth(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_customer_growth(db: AsyncSession = Depends(get_read_db), current_user: User = Depends(get_current_principal)):
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Get all creation dates
-    result = await db.execute(select(User.created_at))
-    dates = result.scalars().all()
-    
-    monthly_counts = defaultdict(int)
-    for date in dates:
-        if date:
-            key = date.strftime("%Y-%m")
-            monthly_counts[key] += 1
-            
-    sorted_keys = sorted(monthly_counts.keys())
-    
-    # Calculate cumulative growth
-    growth_data = []
-    cumulative = 0
-    for key in sorted_keys:
-        cumulative += monthly_counts[key]
-        growth_data.append({"month": key, "users": cumulative})
-        
-    return growth_data
+    async def load():
+        # Calculate cumulative growth over the monthly sign-up rollup
+        monthly = (
+            select(MonthlyCustomerRollup.month, MonthlyCustomerRollup.customers)
+            .where(MonthlyCustomerRollup.customers > 0)
+            .subquery()
+        )
+        result = await db.execute(
+            select(monthly.c.month, func.sum(monthly.c.customers).over(order_by=monthly.c.month))
+            .order_by(monthly.c.month)
+        )
+        return [{"month": k.strftime("%Y-%m"), "users": int(v)} for k, v in result.all()]
+
+    return await response_cache.get_or_load("analytics:customer-growth", load, tags=[CUSTOMERS_TAG])
 
 @app.get("/api/analytics/financial-summary")
-async def get_financial_summary(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_financial_summary(db: AsyncSession = Depends(get_read_db), current_user: User = Depends(get_current_principal)):
     """
     @brief Calculates financial analytics for the dashboard.
     @details Returns total revenue, revenue by policy type, and revenue trend over time.
@@ -579,36 +1052,39 @@ async def get_financial_summary(db: AsyncSession = Depends(get_db), current_user
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Calculate Total Revenue
-    result = await db.execute(select(func.sum(User.premium)).where(User.is_admin == False))
-    total_revenue = result.scalar() or 0
-    
-    # Revenue by Policy Type
-    result = await db.execute(select(User.policy_type, func.sum(User.premium)).where(User.is_admin == False).group_by(User.policy_type))
-    revenue_by_type_raw = result.all()
-    revenue_by_type = [{"name": r[0] or "Unknown", "value": r[1] or 0} for r in revenue_by_type_raw]
-    
-    # Revenue Trend
-    result = await db.execute(select(User.created_at, User.premium).where(User.is_admin == False))
-    sales = result.all()
-    
-    monthly_sales = defaultdict(float)
-    for date, amount in sales:
-        if date and amount:
-            key = date.strftime("%Y-%m")
-            monthly_sales[key] += amount
-            
-    sorted_keys = sorted(monthly_sales.keys())
-    revenue_trend = [{"month": k, "amount": monthly_sales[k]} for k in sorted_keys]
-    
-    return {
-        "total_revenue": total_revenue,
-        "revenue_by_type": revenue_by_type,
-        "revenue_trend": revenue_trend
-    }
+    async def load():
+        # Calculate Total Revenue
+        result = await db.execute(select(func.sum(MonthlyPremiumRollup.premium)))
+        total_revenue = float(result.scalar() or 0)
+    
+        # Revenue by Policy Type
+        result = await db.execute(
+            select(MonthlyPremiumRollup.policy_type, func.sum(MonthlyPremiumRollup.premium))
+            .group_by(MonthlyPremiumRollup.policy_type)
+            .having(func.sum(MonthlyPremiumRollup.policies) > 0)
+        )
+        revenue_by_type = [{"name": r[0] or "Unknown", "value": float(r[1] or 0)} for r in result.all()]
+    
+        # Revenue Trend
+        amount = func.sum(MonthlyPremiumRollup.premium)
+        result = await db.execute(
+            select(MonthlyPremiumRollup.month, amount)
+            .group_by(MonthlyPremiumRollup.month)
+            .having(amount != 0)
+            .order_by(MonthlyPremiumRollup.month)
+        )
+        revenue_trend = [{"month": k.strftime("%Y-%m"), "amount": float(v)} for k, v in result.all()]
+    
+        return {
+            "total_revenue": total_revenue,
+            "revenue_by_type": revenue_by_type,
+            "revenue_trend": revenue_trend
+        }
+
+    return await response_cache.get_or_load("analytics:financial-summary", load, tags=[CUSTOMERS_TAG])
 
 @app.get("/api/analytics/stats")
-async def get_dashboard_stats(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_user)):
+async def get_dashboard_stats(db: AsyncSession = Depends(get_read_db), current_user: User = Depends(get_current_principal)):
     """
     @brief Retrieves high-level dashboard statistics.
     @details Returns counts for total customers, active policies, and expiring policies.
@@ -621,36 +1097,37 @@ async def get_dashboard_stats(db: AsyncSession = Depends(get_db), current_user:
     if not current_user.is_admin:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Total Customers
-    result_total = await db.execute(select(User).where(User.is_admin == False))
-    total_customers = len(result_total.scalars().all())
-
-    # Active Policies
-    result_active = await db.execute(select(User).where(User.is_active == True).where(User.is_admin == False))
-    active_policies = len(result_active.scalars().all())
-
-    # Expiring Soon (Next 30 days)
-    now = datetime.now()
-    next_month = now + timedelta(days=30)
-    result_expiring = await db.execute(
-        select(User)
-        .where(User.policy_expiry >= now)
-        .where(User.policy_expiry <= next_month)
-        .where(User.is_admin == False)
-    )
-    expiring_soon = len(result_expiring.scalars().all())
+    async def load():
+        # Total Customers and Active Policies
+        result = await db.execute(
+            select(func.sum(MonthlyCustomerRollup.customers), func.sum(MonthlyCustomerRollup.active))
+        )
+        total_customers, active_policies = result.one()
+
+        # Expiring Soon (Next 30 days, range scan on ix_users_policy_expiry)
+        now = datetime.now()
+        next_month = now + timedelta(days=30)
+        result_expiring = await db.execute(
+            select(func.count()).select_from(User)
+            .where(User.policy_expiry >= now)
+            .where(User.policy_expiry <= next_month)
+            .where(User.is_admin == False)
+        )
+        expiring_soon = result_expiring.scalar()
+
+        return {
+            "total_customers": int(total_customers or 0),
+            "active_policies": int(active_policies or 0),
+            "expiring_soon": expiring_soon
+        }
 
-    return {
-        "total_customers": total_customers,
-        "active_policies": active_policies,
-        "expiring_soon": expiring_soon
-    }
+    return await response_cache.get_or_load("analytics:stats", load, tags=[CUSTOMERS_TAG])
 
 @app.post("/auth/request-otp")
 async def request_otp(request: dict, db: AsyncSession = Depends(get_db)):
     """
     @brief Requests an OTP for account activation.
-    @details Generates a code, stores it hashed in DB, and sends it (mocked) to email.
+    @details Generates a code, stores it hashed in DB, and queues it in the email outbox.
     
     @param request Dictionary containing 'email'.
     @param db The database session.
@@ -670,17 +1147,12 @@ async def request_otp(request: dict, db: AsyncSession = Depends(get_db)):
         return {"message": "If this email is registered, a code has been sent."}
         
     otp = generate_otp()
-    user.otp_code = get_password_hash(otp) # Store hashed OTP for security
+    user.otp_code = hash_otp(otp) # Store hashed OTP for security
     user.otp_expiry = datetime.now(timezone.utc) + timedelta(minutes=15)
+    user.otp_attempts = 0
+    await enqueue_activation_email(db, email, otp, user.otp_expiry)
     await db.commit()
-    
-    # Send real email via Resend
-    from email_service import send_activation_email
-    try:
-        await send_activation_email(email, otp)
-    except Exception as e:
-        # Silently log for security
-        print(f"Failed to send OTP email: {e}")
+    outbox_worker.notify()
     
     return {"message": "If this email is registered, a code has been sent."}
 
@@ -710,9 +1182,20 @@ async def verify_otp(request: dict, db: AsyncSession = Depends(get_db)):
     if datetime.now(timezone.utc) > user.otp_expiry:
         raise HTTPException(status_code=400, detail="Code expired")
         
+    # Count the attempt before verifying, atomically, so parallel guesses cannot exceed the limit
+    attempts = await db.scalar(
+        update(User).where(User.id == user.id).values(otp_attempts=User.otp_attempts + 1).returning(User.otp_attempts)
+    )
+    await db.commit()
+    if attempts > OTP_MAX_ATTEMPTS:
+        raise HTTPException(status_code=429, detail="Too many attempts, please request a new code")
+
     # Verify hashed code
-    if not verify_password(code, user.otp_code):
+    if not await verify_otp_async(code, user.otp_code):
         raise HTTPException(status_code=400, detail="Invalid code")
+
+    await db.execute(update(User).where(User.id == user.id).values(otp_attempts=0))
+    await db.commit()
         
     # Valid! Issue a temporary token specific for password reset
     access_token_expires = timedelta(minutes=15) # Short life for this token
@@ -740,13 +1223,150 @@ async def set_password_endpoint(
     @param db The database session.
     @return A success message.
     """
+    # current_user may be a detached copy from the principal cache, of a user deleted since
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Could not validate credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    before = rollup_snapshot(user)
     # Update password
-    current_user.hashed_password = get_password_hash(request.new_password)
+    user.hashed_password = await get_password_hash_async(request.new_password)
     # Clear OTP fields
-    current_user.otp_code = None
-    current_user.otp_expiry = None
+    user.otp_code = None
+    user.otp_expiry = None
+    user.otp_attempts = 0
+    if user.email:
+        await discard_activation_emails(db, user.email)
     # Ensure active
-    current_user.is_active = True
+    user.is_active = True
+    # Sign out sessions started with the old password
+    await revoke_user_refresh_tokens(db, user.id)
     
+    await apply_rollup_changes(db, removed=[before], added=[rollup_snapshot(user)])
     await db.commit()
+    principal_cache.invalidate_user(user.id)
+    await response_cache.invalidate_tags(CUSTOMERS_TAG)
     return {"message": "Password updated successfully"}
+
+
+@app.get("/api/internal/hashing")
+async def get_hashing_stats(current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports load on the password hashing worker pool.
+    @details Admin only. Includes in-flight and queued hash calls, rejections and average timings.
+    
+    @param current_user The current authenticated user (must be admin).
+    @return A dictionary of hashing pool counters.
+    @throws HTTPException If not authorized.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return hashing_stats.as_dict()
+
+@app.get("/api/internal/email-outbox")
+async def get_email_outbox_status(db: AsyncSession = Depends(get_db), current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports email outbox delivery status.
+    @details Admin only. Returns message counts per status and the most recent permanent failures.
+    
+    @param db The database session.
+    @param current_user The current authenticated user (must be admin).
+    @return A dictionary with the transport name, status counts and recent failures.
+    @throws HTTPException If not authorized.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return await outbox_status(db)
+
+@app.get("/api/internal/cache")
+async def get_cache_stats(current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports response cache effectiveness.
+    @details Admin only. Returns the backend in use and hit, miss and coalesced-miss counters.
+    
+    @param current_user The current authenticated user (must be admin).
+    @return A dictionary of cache counters.
+    @throws HTTPException If not authorized.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return response_cache.as_dict()
+
+@app.get("/api/internal/principals")
+async def get_principal_cache_stats(current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports authenticated principal cache effectiveness.
+    @details Admin only. Returns hit, miss, claim-only and invalidation counters, and the counters of the cross-worker invalidation bus.
+    
+    @param current_user The current authenticated user (must be admin).
+    @return A dictionary of principal cache counters.
+    @throws HTTPException If not authorized.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {**principal_cache.as_dict(), "invalidation_bus": invalidation_bus.as_dict()}
+
+@app.get("/api/internal/admission")
+async def get_admission_stats(current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports admission control state.
+    @details Admin only. Returns, per route class, active and queued requests and how many requests were admitted or shed (queue full, queue timeout, per-IP or per-account rate limit).
+    
+    @param current_user The current authenticated user (must be admin).
+    @return A dictionary of admission counters.
+    @throws HTTPException If not authorized.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return admission_as_dict()
+
+@app.get("/api/internal/db-pool")
+async def get_db_pool_stats(current_user: User = Depends(get_current_principal)):
+    """
+    @brief Reports database connection pool usage.
+    @details Admin only. Returns, per engine (primary and, when configured, replica), checked out and overflow connections, the checkout time histogram, timeouts and connection ages.
+    
+    @param current_user The current authenticated user (must be admin).
+    @return A dictionary of pool metrics by engine.
+    @throws HTTPException If not authorized.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return {name: metrics.as_dict() for name, metrics in pool_metrics.items()}
+
+@app.get("/api/internal/profiles")
+async def list_profiles(current_user: User = Depends(get_current_principal)):
+    """
+    @brief Lists captured request reports, newest first.
+    @details Admin only. Reports are captured for requests slower than SLOW_REQUEST_MS and for
+             profiled requests (an admin's `X-Profile: 1` header or PROFILE_SAMPLE_RATE sampling).
+    
+    @param current_user The current authenticated user (must be admin).
+    @return A list of report summaries (id, trigger, route, status, duration, SQL count, N+1 candidates).
+    @throws HTTPException If not authorized.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return profile_store.list()
+
+@app.get("/api/internal/profiles/{report_id}")
+async def get_profile(report_id: str, current_user: User = Depends(get_current_principal)):
+    """
+    @brief Retrieves a captured request report.
+    @details Admin only. Includes the SQL statements with their timings, N+1 candidates and, for
+             profiled requests, the sampling profiler's call tree.
+    
+    @param report_id The report id (also returned in the X-Profile-Id response header).
+    @param current_user The current authenticated user (must be admin).
+    @return The report.
+    @throws HTTPException If not authorized or the report does not exist.
+    """
+    if not current_user.is_admin:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    report = profile_store.get(report_id)
+    if report is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return report
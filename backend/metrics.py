@@ -0,0 +1,141 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, CONTENT_TYPE_LATEST, generate_latest
+from prometheus_client import REGISTRY, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Prometheus metrics. With several uvicorn workers, point PROMETHEUS_MULTIPROC_DIR at an empty
+# directory shared by the workers (wiped on every deploy); each worker then writes its samples
+# to memory-mapped files and /metrics aggregates all of them.
+
+##
+# @brief Directory for multi-process metric files; unset for a single process.
+#
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+##
+# @brief Bearer token required to scrape /metrics; unset leaves the endpoint open.
+#
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+##
+# @brief Histogram buckets in seconds shared by request and SQL latencies.
+#
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests served.", ["method", "route", "status"])
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency.", ["method", "route"], buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served.", ["method", "route"], multiprocess_mode="livesum")
+
+SQL_LATENCY = Histogram("db_statement_duration_seconds", "SQL statement latency by query fingerprint.", ["query"], buckets=LATENCY_BUCKETS)
+
+PASSWORD_HASHES = Counter("password_hash_operations_total", "bcrypt hash and verify calls.", ["operation"])
+PASSWORD_HASH_REJECTED = Counter("password_hash_rejected_total", "bcrypt calls rejected because the hashing queue was full.")
+EMAILS = Counter("emails_total", "Outbox email delivery attempts.", ["status"])
+IMPORT_ROWS = Counter("import_rows_total", "Rows processed by imports.", ["kind", "status"])
+
+##
+# @brief Builds the /metrics response body.
+#
+# @return A tuple (body, content type).
+#
+def render_metrics() -> tuple[bytes, str]:
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+##
+# @brief Drops the live gauges of this worker (call on shutdown in multi-process mode).
+#
+def mark_worker_dead():
+    if PROMETHEUS_MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
+
+##
+# @brief ASGI middleware recording request count, latency and in-flight requests per route.
+# @details Requests are labeled with the route's path template (e.g. /api/jobs/{job_id}), so
+#          label cardinality is bounded by the number of routes.
+#
+class MetricsMiddleware:
+    def __init__(self, app, router):
+        self.app = app
+        self.router = router
+        self._routes: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def _route_of(self, scope) -> str:
+        key = (scope["method"], scope["path"])
+        route = self._routes.get(key)
+        if route is None:
+            route = "<unmatched>"
+            for candidate in self.router.routes:
+                match, _ = candidate.matches(scope)
+                if match.name == "FULL":
+                    route = candidate.path
+                    break
+            self._routes[key] = route
+            if len(self._routes) > 4096:
+                self._routes.popitem(last=False)
+        return route
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        method = scope["method"]
+        route = self._route_of(scope)
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        in_flight = HTTP_IN_FLIGHT.labels(method, route)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+            HTTP_REQUESTS.labels(method, route, str(status[0])).inc()
+            in_flight.dec()
+
+_PARAM = r"(?:\$\d+(?:::[A-Z]+(?: WITH(?:OUT)? TIME ZONE)?)?|%\(\w+\)s|\?)"
+_PARAM_LISTS = re.compile(rf"{_PARAM}(?:\s*,\s*{_PARAM})*")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SELECT_LISTS = re.compile(r"\bSELECT\b.*?\bFROM\b", re.S)
+_SPACES = re.compile(r"\s+")
+_fingerprints: OrderedDict[str, str] = OrderedDict()
+
+##
+# @brief Reduces a SQL statement to its shape: literals and parameter lists become "?" and select lists "...".
+#
+# @param statement The SQL sent to the driver.
+# @return The fingerprint, truncated to 200 characters.
+#
+def query_fingerprint(statement: str) -> str:
+    fingerprint = _fingerprints.get(statement)
+    if fingerprint is None:
+        fingerprint = _LITERALS.sub("?", _PARAM_LISTS.sub("?", statement))
+        fingerprint = _SELECT_LISTS.sub("SELECT ... FROM", fingerprint)
+        fingerprint = _SPACES.sub(" ", fingerprint).strip()[:200]
+        _fingerprints[statement] = fingerprint
+        if len(_fingerprints) > 2048:
+            _fingerprints.popitem(last=False)
+    return fingerprint
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is not None:
+        SQL_LATENCY.labels(query_fingerprint(statement)).observe(time.perf_counter() - started)
@@ -0,0 +1,279 @@
+"""
+@brief Versioned schema migrations.
+@details Migrations are numbered and applied in order; applied versions are recorded in the
+         schema_migrations table. One process applies them at a time, under a Postgres advisory
+         lock, so workers starting together never run DDL concurrently. Application startup only
+         compares the recorded version with LATEST_VERSION (see ensure_schema).
+
+Usage (from backend/, e.g. as the release step of a deploy):
+
+    python -m migrations           # apply pending migrations
+    python -m migrations status    # show applied and pending versions
+"""
+import argparse
+import asyncio
+import os
+import time
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex
+from database import engine, Base
+import models  # registers the tables
+
+##
+# @brief Apply pending migrations during application startup (set to 0 when a release step runs them).
+#
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+##
+# @brief How long (in milliseconds) a transactional migration waits for a table lock before failing.
+# @details Keeps an ALTER TABLE from queueing behind a long query while blocking every request behind it.
+#
+MIGRATION_LOCK_TIMEOUT_MS = int(os.getenv("MIGRATION_LOCK_TIMEOUT_MS", "10000"))
+
+##
+# @brief Key of the Postgres advisory lock held while migrating.
+#
+MIGRATION_LOCK_ID = 0x41736661_6C796100
+
+##
+# @brief A schema change.
+#
+class Migration:
+    def __init__(self, version: int, description: str, apply, concurrent: bool, optional: bool):
+        self.version = version
+        self.description = description
+        ## Async callable taking an AsyncConnection.
+        self.apply = apply
+        ## Runs outside a transaction (CREATE INDEX CONCURRENTLY); must be idempotent.
+        self.concurrent = concurrent
+        ## May raise MigrationSkipped; pending optional migrations do not block startup.
+        self.optional = optional
+
+##
+# @brief Raised by an optional migration whose prerequisite is missing (e.g. an extension).
+# @details The migration is not recorded, later migrations still run, and it is retried by the
+#          next migrate() call; it must therefore not depend on the versions after it.
+#
+class MigrationSkipped(Exception):
+    pass
+
+## Migrations by version.
+MIGRATIONS: dict[int, Migration] = {}
+
+##
+# @brief Registers a migration.
+#
+# @param version Version number; versions are applied in increasing order.
+# @param description Short description stored with the applied version.
+# @param concurrent Run outside a transaction, then record the version. The migration must be
+#        safe to re-run, since a failure after its work but before the record repeats it.
+# @param optional The migration may raise MigrationSkipped (see there).
+#
+def migration(version: int, description: str, concurrent: bool = False, optional: bool = False):
+    def register(func):
+        if version in MIGRATIONS:
+            raise ValueError(f"Duplicate migration version {version}")
+        MIGRATIONS[version] = Migration(version, description, func, concurrent, optional)
+        return func
+    return register
+
+async def _create_indexes_concurrently(conn, indexes):
+    invalid = set((await conn.execute(text("""
+        SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE NOT i.indisvalid
+    """))).scalars())
+    for index in indexes:
+        # An interrupted CREATE INDEX CONCURRENTLY leaves an invalid index that IF NOT EXISTS would keep
+        if index.name in invalid:
+            await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{index.name}"'))
+        ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=postgresql.dialect()))
+        await conn.execute(text(ddl.replace("INDEX", "INDEX CONCURRENTLY", 1)))
+
+@migration(1, "create missing tables")
+async def _create_tables(conn):
+    # New databases get the current schema here; later migrations are then no-ops for them
+    await conn.run_sync(Base.metadata.create_all)
+
+@migration(2, "policy columns on users")
+async def _policy_columns(conn):
+    await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS policy_type VARCHAR"))
+    await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS policy_number VARCHAR"))
+    await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS policy_expiry TIMESTAMP"))
+    await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS vehicle_plate VARCHAR"))
+
+@migration(3, "OTP columns on users")
+async def _otp_columns(conn):
+    await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS otp_code VARCHAR"))
+    await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS otp_expiry TIMESTAMP WITH TIME ZONE"))
+    await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS otp_attempts INTEGER NOT NULL DEFAULT 0"))
+
+@migration(4, "numeric mechanic coordinates")
+async def _numeric_coordinates(conn):
+    await conn.execute(text("""
+        DO $$
+        BEGIN
+            IF (SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'mechanics' AND column_name = 'latitude') = 'character varying' THEN
+                ALTER TABLE mechanics
+                    ALTER COLUMN latitude TYPE DOUBLE PRECISION USING latitude::double precision,
+                    ALTER COLUMN longitude TYPE DOUBLE PRECISION USING longitude::double precision;
+                -- Same fix the map used to apply client-side for values that lost their decimal point
+                UPDATE mechanics SET latitude = latitude / 10000 WHERE abs(latitude) > 90;
+                UPDATE mechanics SET longitude = longitude / 10000 WHERE abs(longitude) > 180;
+            END IF;
+        END $$
+    """))
+
+@migration(5, "model indexes on existing tables", concurrent=True)
+async def _model_indexes(conn):
+    # create_all only creates indexes for tables it creates itself
+    await _create_indexes_concurrently(conn, [index for table in Base.metadata.sorted_tables for index in table.indexes])
+
+@migration(6, "trigram indexes for customer search", concurrent=True, optional=True)
+async def _trigram_indexes(conn):
+    # Trigram indexes make the customer search (ILIKE '%q%') indexable
+    try:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except Exception as e:
+        raise MigrationSkipped(f"pg_trgm extension unavailable: {getattr(e, 'orig', e)}") from e
+    for column in ["full_name", "vehicle_plate", "policy_number", "email", "phone"]:
+        await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_users_{column}_trgm ON users USING gin ({column} gin_trgm_ops)"))
+
+@migration(7, "seed admin user")
+async def _seed_admin(conn):
+    from auth_utils import get_password_hash
+    await conn.execute(text("""
+        INSERT INTO users (email, hashed_password, phone, is_active, is_admin, otp_attempts)
+        SELECT 'admin@asfalya.com', :password, '+0000000000', true, true, 0
+        WHERE NOT EXISTS (SELECT 1 FROM users WHERE email = 'admin@asfalya.com')
+    """), {"password": get_password_hash("admin123")})
+
+## Highest known version; the schema this code expects.
+LATEST_VERSION = max(MIGRATIONS)
+
+async def _ensure_version_table(conn):
+    await conn.execute(text("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR NOT NULL,
+            applied_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            duration_ms DOUBLE PRECISION
+        )
+    """))
+
+##
+# @brief Returns the applied migration versions.
+#
+# @param conn An AsyncConnection.
+# @return The set of applied versions (empty when the database was never migrated).
+#
+async def applied_versions(conn) -> set[int]:
+    if (await conn.execute(text("SELECT to_regclass('schema_migrations')"))).scalar() is None:
+        return set()
+    return set((await conn.execute(text("SELECT version FROM schema_migrations"))).scalars())
+
+async def _record(conn, m: Migration, duration: float):
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, description, duration_ms) VALUES (:version, :description, :duration_ms)"),
+        {"version": m.version, "description": m.description, "duration_ms": round(duration * 1000, 2)},
+    )
+
+##
+# @brief Applies pending migrations under the migration advisory lock.
+# @details Waits while another process migrates, then applies whatever is still pending. Each
+#          transactional migration commits together with its version record; a failing
+#          migration raises and leaves later ones pending. A skipped optional migration stays
+#          pending and the run continues.
+#
+# @param target Apply migrations up to this version (default LATEST_VERSION).
+# @return The versions applied by this call.
+#
+async def migrate(target: int | None = None) -> list[int]:
+    target = LATEST_VERSION if target is None else target
+    applied = []
+    async with engine.connect() as lock_conn:
+        lock_conn = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        # Poll rather than block in pg_advisory_lock: a backend waiting inside that call holds a
+        # snapshot, and CREATE INDEX CONCURRENTLY in the migrating process would wait for it forever
+        waiting = False
+        while not (await lock_conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": MIGRATION_LOCK_ID})).scalar():
+            if not waiting:
+                print("Waiting for another process to finish migrating")
+                waiting = True
+            await asyncio.sleep(1)
+        try:
+            await _ensure_version_table(lock_conn)
+            done = await applied_versions(lock_conn)
+            for version in sorted(v for v in MIGRATIONS if v <= target and v not in done):
+                m = MIGRATIONS[version]
+                print(f"Applying migration {version}: {m.description}")
+                started = time.perf_counter()
+                try:
+                    if m.concurrent:
+                        async with engine.connect() as conn:
+                            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+                            await m.apply(conn)
+                            await _record(conn, m, time.perf_counter() - started)
+                    else:
+                        async with engine.begin() as conn:
+                            await conn.execute(text(f"SET LOCAL lock_timeout = {MIGRATION_LOCK_TIMEOUT_MS}"))
+                            await m.apply(conn)
+                            await _record(conn, m, time.perf_counter() - started)
+                except MigrationSkipped as e:
+                    if not m.optional:
+                        raise
+                    print(f"Skipped migration {version} ({e}); it stays pending and is retried on the next run")
+                    continue
+                applied.append(version)
+        finally:
+            await lock_conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": MIGRATION_LOCK_ID})
+    return applied
+
+##
+# @brief Startup check that the schema is at LATEST_VERSION.
+# @details Costs one or two catalog queries when the schema is current. Pending migrations are
+#          applied when MIGRATE_ON_STARTUP is enabled (one worker migrates, the others wait for the
+#          lock and find nothing left to do); otherwise startup fails. Pending optional
+#          migrations never fail startup.
+#
+# @param retry_optional Also run migrate() when only optional migrations are pending (serve.py's
+#        workers pass False: the supervisor has just retried them).
+#
+async def ensure_schema(retry_optional: bool = True):
+    async with engine.connect() as conn:
+        done = await applied_versions(conn)
+    pending = sorted(set(MIGRATIONS) - done)
+    required = [v for v in pending if not MIGRATIONS[v].optional]
+    if max(done, default=0) > LATEST_VERSION:
+        print(f"Database schema version {max(done)} is newer than this code ({LATEST_VERSION})")
+    if not required and (not pending or not retry_optional or not MIGRATE_ON_STARTUP):
+        if pending:
+            print(f"Optional migrations {pending} are pending")
+        return
+    if not MIGRATE_ON_STARTUP:
+        raise RuntimeError(f"Database schema is missing migrations {required}; run `python -m migrations`")
+    await migrate()
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", nargs="?", choices=["migrate", "status"], default="migrate")
+    parser.add_argument("--target", type=int, help="Apply migrations up to this version")
+    args = parser.parse_args()
+
+    async def run():
+        try:
+            if args.command == "status":
+                async with engine.connect() as conn:
+                    done = await applied_versions(conn)
+                for version, m in sorted(MIGRATIONS.items()):
+                    state = "applied" if version in done else "optional" if m.optional else "pending"
+                    print(f"{version:4}  {state:8} {m.description}")
+                return
+            applied = await migrate(args.target)
+            print(f"Applied {len(applied)} migration(s)" if applied else "No migrations applied")
+        finally:
+            await engine.dispose()
+    asyncio.run(run())
+
+if __name__ == "__main__":
+    _main()
@@ -1,4 +1,8 @@
-import pandas as pd
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd  # annotations only; the API never loads pandas through this module
 # from sklearn.base import BaseEstimator
 
 class ChurnPredictor:
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, Date, ForeignKey, Float, Index, Numeric, JSON
 from sqlalchemy.sql import func
 from database import Base
 
@@ -29,6 +29,8 @@ class User(Base):
     otp_code = Column(String, nullable=True)
     ## Expiration timestamp for the OTP.
     otp_expiry = Column(DateTime(timezone=True), nullable=True)
+    ## Failed verification attempts for the current OTP.
+    otp_attempts = Column(Integer, nullable=False, default=0, server_default="0")
     
     # Policy Details
     ## Full name of the user/policy holder.
@@ -44,6 +46,18 @@ class User(Base):
     ## License plate number associated with the policy.
     vehicle_plate = Column(String, nullable=True)
 
+    # Composite indexes backing keyset pagination and filters on the customer list
+    __table_args__ = (
+        Index("ix_users_admin_id", "is_admin", "id"),
+        Index("ix_users_admin_created_id", "is_admin", "created_at", "id"),
+        Index("ix_users_admin_expiry_id", "is_admin", "policy_expiry", "id"),
+        Index("ix_users_admin_policy_type_id", "is_admin", "policy_type", "id"),
+        # Analytics range scans and counts
+        Index("ix_users_policy_expiry", "policy_expiry"),
+        Index("ix_users_created_at", "created_at"),
+        Index("ix_users_admin_active", "is_admin", "is_active"),
+    )
+
 ##
 # @brief Represents a mechanic in the system.
 # @details This class maps to the 'mechanics' table in the database.
@@ -58,10 +72,155 @@ class Mechanic(Base):
     ## Physical address of the mechanic.
     address = Column(String, nullable=False)
     ## Latitude coordinate for map positioning.
-    latitude = Column(String, nullable=False) # Store as string or Float
+    latitude = Column(Float, nullable=False)
     ## Longitude coordinate for map positioning.
-    longitude = Column(String, nullable=False)
+    longitude = Column(Float, nullable=False)
     ## Contact phone number.
     phone = Column(String, nullable=True)
     ## Timestamp of when the mechanic record was created.
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+##
+# @brief Represents an outgoing email waiting in the transactional outbox.
+# @details This class maps to the 'email_outbox' table. Rows are written in the same
+#          transaction as the change that triggers them and drained by the outbox worker.
+#
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+
+    ## Unique identifier for the message.
+    id = Column(Integer, primary_key=True, index=True)
+    ## Recipient email address.
+    to_email = Column(String, nullable=False)
+    ## Email subject line.
+    subject = Column(String, nullable=False)
+    ## Rendered HTML body of messages queued without a template; cleared once the message is delivered or failed.
+    html = Column(String, nullable=True)
+    ## Name of the email_service template the body is rendered from at send time.
+    template = Column(String, nullable=True)
+    ## Template parameters (may hold a one-time code); cleared once the message is delivered, failed, expired or superseded.
+    params = Column(JSON, nullable=True)
+    ## Time after which the message is no longer worth sending (e.g. its one-time code expired).
+    expires_at = Column(DateTime(timezone=True), nullable=True)
+    ## Delivery status: 'pending', 'sending', 'sent', 'failed', 'expired' or 'superseded'.
+    status = Column(String, nullable=False, default="pending", index=True)
+    ## Number of delivery attempts made so far.
+    attempts = Column(Integer, nullable=False, default=0)
+    ## Earliest time the next attempt may run (also the lease expiry while 'sending').
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    ## Error message from the most recent failed attempt.
+    last_error = Column(String, nullable=True)
+    ## Message id returned by the email provider.
+    provider_id = Column(String, nullable=True)
+    ## Timestamp of when the message was queued.
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    ## Timestamp of successful delivery.
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+##
+# @brief Represents a background job (imports, broadcasts).
+# @details Maps to the 'jobs' table. Written by the job runner in jobs.py so any API worker can report progress.
+#
+class Job(Base):
+    __tablename__ = "jobs"
+
+    ## Unique identifier for the job (hex UUID).
+    id = Column(String(32), primary_key=True)
+    ## Handler name, e.g. 'import_customers'.
+    kind = Column(String, nullable=False, index=True)
+    ## Status: 'queued', 'running', 'completed', 'failed' or 'cancelled'.
+    status = Column(String, nullable=False, default="queued", index=True)
+    ## Handler parameters.
+    params = Column(JSON, nullable=True)
+    ## Completion percentage (0-100).
+    progress = Column(Float, nullable=False, default=0)
+    ## Number of rows or recipients to process, once known.
+    total_rows = Column(Integer, nullable=True)
+    ## Rows processed so far.
+    processed_rows = Column(Integer, nullable=False, default=0)
+    ## Rows processed successfully.
+    succeeded_rows = Column(Integer, nullable=False, default=0)
+    ## Rows that failed or were rejected.
+    failed_rows = Column(Integer, nullable=False, default=0)
+    ## Summary of errors encountered.
+    error_summary = Column(String, nullable=True)
+    ## Handler result once completed.
+    result = Column(JSON, nullable=True)
+    ## Set when cancellation is requested; handlers stop at their next progress update.
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    ## Email of the admin who started the job.
+    created_by = Column(String, nullable=True)
+    ## Timestamp of when the job was queued.
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    ## Timestamp of when a worker picked the job up.
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    ## Timestamp of the last status write (heartbeat while running).
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+    ## Timestamp of when the job finished.
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+
+##
+# @brief Represents a refresh token issued at login.
+# @details Maps to the 'refresh_tokens' table. Only a SHA-256 digest of the token is stored.
+#          Tokens rotate on every use; all tokens descending from one login share a family_id
+#          so a replayed (already rotated) token revokes the whole family.
+#
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    ## Unique identifier for the token.
+    id = Column(Integer, primary_key=True)
+    ## Owner of the token.
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    ## Hex SHA-256 digest of the token.
+    token_hash = Column(String(64), nullable=False, unique=True)
+    ## Identifier shared by the tokens of one login session.
+    family_id = Column(String(32), nullable=False, index=True)
+    ## Timestamp of when the token was issued.
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    ## Timestamp after which the token is no longer accepted.
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    ## Timestamp of when the token was rotated or revoked.
+    revoked_at = Column(DateTime(timezone=True), nullable=True)
+
+##
+# @brief Monthly customer sign-up rollup.
+# @details Maps to 'analytics_monthly_customers'. Maintained incrementally by rollups.py.
+#
+class MonthlyCustomerRollup(Base):
+    __tablename__ = "analytics_monthly_customers"
+
+    ## First day of the sign-up month (UTC).
+    month = Column(Date, primary_key=True)
+    ## Number of non-admin customers created in the month.
+    customers = Column(Integer, nullable=False, default=0)
+    ## How many of those customers are active.
+    active = Column(Integer, nullable=False, default=0)
+
+##
+# @brief Monthly premium rollup per policy type.
+# @details Maps to 'analytics_monthly_premium'. Policies without a type use the empty string.
+#
+class MonthlyPremiumRollup(Base):
+    __tablename__ = "analytics_monthly_premium"
+
+    ## First day of the sign-up month (UTC).
+    month = Column(Date, primary_key=True)
+    ## Policy type ('' when unknown).
+    policy_type = Column(String, primary_key=True)
+    ## Number of customers with this policy type created in the month.
+    policies = Column(Integer, nullable=False, default=0)
+    ## Sum of their premiums.
+    premium = Column(Numeric(18, 4), nullable=False, default=0)
+
+##
+# @brief Monthly policy expiry rollup.
+# @details Maps to 'analytics_expiry_monthly'.
+#
+class MonthlyExpiryRollup(Base):
+    __tablename__ = "analytics_expiry_monthly"
+
+    ## First day of the expiry month.
+    month = Column(Date, primary_key=True)
+    ## Number of non-admin policies expiring in the month.
+    policies = Column(Integer, nullable=False, default=0)
@@ -0,0 +1,100 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import and_, or_, text
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2
+from sqlalchemy.ext.asyncio import AsyncSession
+
+##
+# @brief Raised when a client sends a cursor that cannot be decoded or does not match the sort.
+#
+class InvalidCursorError(ValueError):
+    pass
+
+##
+# @brief Encodes a keyset position into an opaque, URL-safe cursor.
+#
+# @param sort The sort expression the cursor belongs to (e.g. "-created_at").
+# @param value The sort column value of the last row on the page.
+# @param row_id The id of the last row on the page (tie breaker).
+# @return The cursor string.
+#
+def encode_cursor(sort: str, value, row_id: int) -> str:
+    if isinstance(value, datetime):
+        value = {"dt": value.isoformat()}
+    raw = json.dumps([sort, value, row_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+##
+# @brief Decodes a cursor produced by encode_cursor.
+#
+# @param cursor The cursor string.
+# @param sort The sort expression of the current request.
+# @return A (value, id) tuple.
+# @throws InvalidCursorError If the cursor is malformed or was issued for another sort.
+#
+def decode_cursor(cursor: str, sort: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        if isinstance(value, dict):
+            value = datetime.fromisoformat(value["dt"])
+    except Exception:
+        raise InvalidCursorError("Invalid cursor")
+    if cursor_sort != sort or not isinstance(row_id, int):
+        raise InvalidCursorError("Cursor does not match the requested sort")
+    return value, row_id
+
+##
+# @brief Builds the ORDER BY clauses for a keyset sort (NULLs always last).
+#
+# @param column The sort column.
+# @param id_column The unique tie-breaker column.
+# @param descending Whether to sort descending.
+# @return A list of ORDER BY clauses.
+#
+def keyset_order(column, id_column, descending: bool):
+    if column is id_column:
+        return [id_column.desc() if descending else id_column.asc()]
+    if descending:
+        return [column.desc().nulls_last(), id_column.desc()]
+    return [column.asc().nulls_last(), id_column.asc()]
+
+##
+# @brief Builds the WHERE condition selecting rows after a cursor position.
+#
+# @param column The sort column.
+# @param id_column The unique tie-breaker column.
+# @param descending Whether the sort is descending.
+# @param value The sort value of the last row returned.
+# @param row_id The id of the last row returned.
+# @return A SQLAlchemy boolean expression.
+#
+def keyset_condition(column, id_column, descending: bool, value, row_id: int):
+    id_after = id_column < row_id if descending else id_column > row_id
+    if column is id_column:
+        return id_after
+    if value is None:
+        # Already inside the trailing NULL group
+        return and_(column.is_(None), id_after)
+    value_after = column < value if descending else column > value
+    return or_(value_after, and_(column == value, id_after), column.is_(None))
+
+##
+# @brief Estimates the number of rows a query would return from the planner statistics.
+# @details Runs EXPLAIN instead of the query, so the cost does not grow with the table size. The
+#          query's values (e.g. a search term) are passed as bound parameters, not rendered into the SQL.
+#
+# @param db The database session.
+# @param query The SELECT statement to estimate.
+# @return The planner's row estimate.
+#
+async def estimate_count(db: AsyncSession, query) -> int:
+    # Named parameters (":name"), the style text() binds. The psycopg2 dialect adds no "::TYPE" casts
+    # to them (text() would not recognize ":name::VARCHAR"); IN lists are rendered one per value
+    compiled = query.compile(dialect=PGDialect_psycopg2(paramstyle="named"), compile_kwargs={"render_postcompile": True})
+    result = await db.execute(text(f"EXPLAIN (FORMAT JSON) {compiled}"), compiled.params)
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
@@ -0,0 +1,242 @@
+import asyncio
+import contextvars
+import json
+import os
+import random
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from auth_utils import bearer_claims
+from metrics import query_fingerprint
+
+##
+# @brief Fraction of requests profiled with the sampling profiler (0 disables sampling).
+#
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+##
+# @brief Sampling interval of the profiler in seconds.
+#
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))
+
+##
+# @brief Requests slower than this (in milliseconds) get a report with their SQL statements.
+#
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+
+##
+# @brief A query fingerprint executed at least this many times in one request is reported as N+1.
+#
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD", "10"))
+
+##
+# @brief Maximum number of SQL statements recorded per request.
+#
+PROFILE_MAX_STATEMENTS = int(os.getenv("PROFILE_MAX_STATEMENTS", "1000"))
+
+##
+# @brief Number of reports kept.
+#
+PROFILE_MAX_REPORTS = int(os.getenv("PROFILE_MAX_REPORTS", "100"))
+
+##
+# @brief Optional directory where reports are written, so they survive restarts and every worker sees them.
+#
+PROFILE_REPORT_DIR = os.getenv("PROFILE_REPORT_DIR")
+
+##
+# @brief Request header with which an admin asks for a profile of that request.
+#
+PROFILE_HEADER = b"x-profile"
+
+##
+# @brief SQL statements issued while serving one request.
+#
+class RequestTrace:
+    def __init__(self):
+        self.started = time.perf_counter()
+        ## (offset seconds, statement, duration seconds) tuples.
+        self.statements = []
+        self.omitted = 0
+        ## Set when the response is done; tasks spawned by the request stop recording.
+        self.closed = False
+
+    def record(self, statement: str, started: float, duration: float):
+        if self.closed:
+            return
+        if len(self.statements) >= PROFILE_MAX_STATEMENTS:
+            self.omitted += 1
+            return
+        self.statements.append((started - self.started, statement, duration))
+
+    ##
+    # @brief Summarizes the statements and flags fingerprints repeated N_PLUS_ONE_THRESHOLD times or more.
+    #
+    def as_dict(self) -> dict:
+        by_fingerprint = defaultdict(lambda: [0, 0.0])
+        for _, statement, duration in self.statements:
+            entry = by_fingerprint[query_fingerprint(statement)]
+            entry[0] += 1
+            entry[1] += duration
+        return {
+            "count": len(self.statements) + self.omitted,
+            "total_ms": round(sum(d for _, _, d in self.statements) * 1000, 2),
+            "omitted": self.omitted,
+            "n_plus_one": [
+                {"query": query, "count": count, "total_ms": round(total * 1000, 2)}
+                for query, (count, total) in sorted(by_fingerprint.items(), key=lambda kv: -kv[1][0])
+                if count >= N_PLUS_ONE_THRESHOLD
+            ],
+            "statements": [
+                {"at_ms": round(offset * 1000, 2), "duration_ms": round(duration * 1000, 2), "sql": statement}
+                for offset, statement, duration in self.statements
+            ],
+        }
+
+_current_trace: contextvars.ContextVar[RequestTrace | None] = contextvars.ContextVar("request_trace", default=None)
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _current_trace.get() is not None:
+        context._trace_started = time.perf_counter()
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    trace = _current_trace.get()
+    started = getattr(context, "_trace_started", None)
+    if trace is not None and started is not None:
+        trace.record(statement, started, time.perf_counter() - started)
+
+##
+# @brief Keeps the most recent reports in memory and, when PROFILE_REPORT_DIR is set, on disk.
+#
+class ProfileStore:
+    def __init__(self, max_reports: int = PROFILE_MAX_REPORTS, directory: str | None = PROFILE_REPORT_DIR):
+        self.max_reports = max_reports
+        self.directory = directory
+        self._reports: OrderedDict[str, dict] = OrderedDict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def add(self, report: dict):
+        if self.directory:
+            with open(os.path.join(self.directory, f"{report['id']}.json"), "w") as f:
+                json.dump(report, f)
+            files = sorted(os.scandir(self.directory), key=lambda e: e.stat().st_mtime)
+            for entry in files[:-self.max_reports]:
+                os.remove(entry.path)
+            return
+        self._reports[report["id"]] = report
+        while len(self._reports) > self.max_reports:
+            self._reports.popitem(last=False)
+
+    def _all(self) -> list[dict]:
+        if not self.directory:
+            return list(self._reports.values())
+        reports = []
+        for entry in os.scandir(self.directory):
+            try:
+                with open(entry.path) as f:
+                    reports.append(json.load(f))
+            except (OSError, ValueError):
+                pass  # removed or being written by another worker
+        return reports
+
+    ##
+    # @brief Lists report summaries, newest first.
+    #
+    def list(self) -> list[dict]:
+        reports = sorted(self._all(), key=lambda r: r["started_at"], reverse=True)
+        return [
+            {k: v for k, v in r.items() if k not in ("sql", "profile")}
+            | {"sql_count": r["sql"]["count"], "n_plus_one": len(r["sql"]["n_plus_one"])}
+            for r in reports
+        ]
+
+    ##
+    # @brief Returns a full report, or None.
+    #
+    def get(self, report_id: str) -> dict | None:
+        if not self.directory:
+            return self._reports.get(report_id)
+        try:
+            with open(os.path.join(self.directory, f"{os.path.basename(report_id)}.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+## Process-wide report store.
+profile_store = ProfileStore()
+
+def _start_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        print("Profiling requested but pyinstrument is not installed")
+        return None
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    return profiler
+
+##
+# @brief ASGI middleware that records the SQL of every request and reports slow or profiled ones.
+# @details A request is profiled with pyinstrument when an admin sends `X-Profile: 1` or when it is
+#          picked by PROFILE_SAMPLE_RATE; its response then carries an X-Profile-Id header. Requests
+#          slower than SLOW_REQUEST_MS are reported with their SQL statements and N+1 candidates.
+#
+class ProfilingMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trigger = None
+        if PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE:
+            trigger = "sample"
+        elif any(name == PROFILE_HEADER and value == b"1" for name, value in scope["headers"]):
+            if (bearer_claims(scope["headers"]) or {}).get("adm"):
+                trigger = "header"
+        report_id = uuid.uuid4().hex
+        profiler = _start_profiler() if trigger else None
+        status = [500]
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if profiler is not None:
+                    message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", report_id.encode())]}
+            await send(message)
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        started_at = datetime.now(timezone.utc)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _current_trace.reset(token)
+            trace.closed = True
+            duration_ms = (time.perf_counter() - trace.started) * 1000
+            if profiler is not None:
+                profiler.stop()
+            if profiler is not None or duration_ms >= SLOW_REQUEST_MS:
+                report = {
+                    "id": report_id,
+                    "trigger": trigger or "slow",
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "query_string": scope.get("query_string", b"").decode("latin-1"),
+                    "status": status[0],
+                    "duration_ms": round(duration_ms, 2),
+                    "started_at": started_at.isoformat(),
+                    "sql": trace.as_dict(),
+                    "profile": profiler.output_text(unicode=True, color=False) if profiler is not None else None,
+                }
+                if profile_store.directory:
+                    await asyncio.to_thread(profile_store.add, report)
+                else:
+                    profile_store.add(report)
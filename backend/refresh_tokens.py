@@ -0,0 +1,120 @@
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth_utils import generate_refresh_token, hash_refresh_token, REFRESH_TOKEN_EXPIRE_DAYS
+from models import RefreshToken, User
+
+##
+# @brief Seconds during which a just-rotated token is rejected without revoking its family.
+# @details Covers two browser tabs refreshing with the same token at the same moment.
+#
+REFRESH_REUSE_GRACE_SECONDS = int(os.getenv("REFRESH_REUSE_GRACE_SECONDS", "10"))
+
+##
+# @brief Raised when a refresh token is unknown, expired, rotated or revoked.
+#
+class InvalidRefreshToken(Exception):
+    pass
+
+##
+# @brief Issues a new refresh token for a user (added to the session, committed by the caller).
+#
+# @param db The database session.
+# @param user_id The owner's id.
+# @param family_id The session family to continue; a new family is started when omitted (login).
+# @return The plain refresh token, to be returned to the client once.
+#
+def issue_refresh_token(db: AsyncSession, user_id: int, family_id: str | None = None) -> str:
+    token = generate_refresh_token()
+    db.add(RefreshToken(
+        user_id=user_id,
+        token_hash=hash_refresh_token(token),
+        family_id=family_id or uuid.uuid4().hex,
+        expires_at=datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return token
+
+##
+# @brief Exchanges a refresh token for a new one (rotation).
+# @details The old token is revoked atomically, so concurrent use of the same token succeeds once.
+#          Presenting a token that was rotated earlier than REFRESH_REUSE_GRACE_SECONDS ago means it
+#          leaked, and every token of its family is revoked.
+#
+# @param db The database session.
+# @param token The presented refresh token.
+# @return A tuple (user, new refresh token); the new token is committed.
+# @throws InvalidRefreshToken If the token cannot be used.
+#
+async def rotate_refresh_token(db: AsyncSession, token: str) -> tuple[User, str]:
+    now = datetime.now(timezone.utc)
+    token_hash = hash_refresh_token(token)
+    row = (await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.token_hash == token_hash, RefreshToken.revoked_at.is_(None), RefreshToken.expires_at > now)
+        .values(revoked_at=now)
+        .returning(RefreshToken.user_id, RefreshToken.family_id)
+    )).first()
+
+    if row is None:
+        stale = await db.scalar(select(RefreshToken).where(RefreshToken.token_hash == token_hash))
+        if stale is not None and stale.revoked_at is not None \
+                and now - stale.revoked_at > timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+            await db.execute(
+                update(RefreshToken)
+                .where(RefreshToken.family_id == stale.family_id, RefreshToken.revoked_at.is_(None))
+                .values(revoked_at=now)
+            )
+            print(f"Refresh token reuse detected for user {stale.user_id}; session revoked")
+        await db.commit()
+        raise InvalidRefreshToken()
+
+    user = await db.get(User, row.user_id)
+    if user is None:
+        await db.rollback()
+        raise InvalidRefreshToken()
+    new_token = issue_refresh_token(db, user.id, row.family_id)
+    await db.commit()
+    return user, new_token
+
+##
+# @brief Revokes the session a refresh token belongs to (logout).
+#
+# @param db The database session.
+# @param token The refresh token.
+#
+async def revoke_refresh_token(db: AsyncSession, token: str):
+    family_id = await db.scalar(
+        select(RefreshToken.family_id).where(RefreshToken.token_hash == hash_refresh_token(token))
+    )
+    if family_id is not None:
+        await db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.now(timezone.utc))
+        )
+    await db.commit()
+
+##
+# @brief Revokes every refresh token of a user (password change), in the caller's transaction.
+#
+# @param db The database session.
+# @param user_id The user's id.
+#
+async def revoke_user_refresh_tokens(db: AsyncSession, user_id: int):
+    await db.execute(
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.now(timezone.utc))
+    )
+
+##
+# @brief Deletes refresh tokens that expired more than a day ago.
+#
+# @param db The database session.
+#
+async def purge_expired_refresh_tokens(db: AsyncSession):
+    cutoff = datetime.now(timezone.utc) - timedelta(days=1)
+    await db.execute(delete(RefreshToken).where(RefreshToken.expires_at < cutoff))
+    await db.commit()
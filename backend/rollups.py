@@ -0,0 +1,155 @@
+import asyncio
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from sqlalchemy import text, select, exists
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import User, MonthlyCustomerRollup, MonthlyPremiumRollup, MonthlyExpiryRollup
+
+##
+# @brief Returns the first day of the month of a datetime.
+#
+# @param value A datetime; aware values are converted to UTC first.
+# @return The month as a date, or None.
+#
+def month_start(value) -> date | None:
+    if value is None:
+        return None
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc)
+    return date(value.year, value.month, 1)
+
+##
+# @brief Captures the fields of a user that feed the analytics rollups.
+#
+# @param user A User instance or a dictionary of User column values.
+# @return A snapshot dictionary, or None for admins (which are not counted).
+#
+def rollup_snapshot(user) -> dict | None:
+    get = user.get if isinstance(user, dict) else lambda key, default=None: getattr(user, key, default)
+    if get("is_admin"):
+        return None
+    return {
+        # New rows get created_at = now() from the server default
+        "created_month": month_start(get("created_at") or datetime.now(timezone.utc)),
+        "is_active": bool(get("is_active", True)),
+        "policy_type": get("policy_type") or "",
+        "premium": float(get("premium") or 0),
+        "expiry_month": month_start(get("policy_expiry")),
+    }
+
+##
+# @brief Applies rollup changes for a set of removed and added snapshots.
+# @details Deltas are aggregated in memory and written with one upsert per rollup table,
+#          in the caller's transaction, so rollups commit or roll back together with the rows.
+#
+# @param db The database session.
+# @param removed Snapshots of rows (or row versions) that no longer exist.
+# @param added Snapshots of rows (or row versions) that now exist.
+#
+async def apply_rollup_changes(db: AsyncSession, removed=(), added=()):
+    customers = defaultdict(lambda: [0, 0])
+    premiums = defaultdict(lambda: [0, 0.0])
+    expiries = defaultdict(int)
+
+    for sign, snapshots in ((-1, removed), (1, added)):
+        for snap in snapshots:
+            if snap is None:
+                continue
+            row = customers[snap["created_month"]]
+            row[0] += sign
+            row[1] += sign if snap["is_active"] else 0
+            row = premiums[(snap["created_month"], snap["policy_type"])]
+            row[0] += sign
+            row[1] += sign * snap["premium"]
+            if snap["expiry_month"] is not None:
+                expiries[snap["expiry_month"]] += sign
+
+    customer_rows = [{"month": m, "customers": c, "active": a} for m, (c, a) in customers.items() if c or a]
+    if customer_rows:
+        stmt = insert(MonthlyCustomerRollup)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[MonthlyCustomerRollup.month],
+            set_={
+                "customers": MonthlyCustomerRollup.customers + stmt.excluded.customers,
+                "active": MonthlyCustomerRollup.active + stmt.excluded.active,
+            },
+        ), customer_rows)
+
+    premium_rows = [
+        {"month": m, "policy_type": t, "policies": c, "premium": p}
+        for (m, t), (c, p) in premiums.items() if c or p
+    ]
+    if premium_rows:
+        stmt = insert(MonthlyPremiumRollup)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[MonthlyPremiumRollup.month, MonthlyPremiumRollup.policy_type],
+            set_={
+                "policies": MonthlyPremiumRollup.policies + stmt.excluded.policies,
+                "premium": MonthlyPremiumRollup.premium + stmt.excluded.premium,
+            },
+        ), premium_rows)
+
+    expiry_rows = [{"month": m, "policies": c} for m, c in expiries.items() if c]
+    if expiry_rows:
+        stmt = insert(MonthlyExpiryRollup)
+        await db.execute(stmt.on_conflict_do_update(
+            index_elements=[MonthlyExpiryRollup.month],
+            set_={"policies": MonthlyExpiryRollup.policies + stmt.excluded.policies},
+        ), expiry_rows)
+
+##
+# @brief Recomputes every rollup table from the users table.
+# @details Used for repair and for the first deployment; runs in a single transaction.
+#
+# @param db The database session.
+#
+async def rebuild_rollups(db: AsyncSession):
+    await db.execute(text("DELETE FROM analytics_monthly_customers"))
+    await db.execute(text("DELETE FROM analytics_monthly_premium"))
+    await db.execute(text("DELETE FROM analytics_expiry_monthly"))
+    await db.execute(text("""
+        INSERT INTO analytics_monthly_customers (month, customers, active)
+        SELECT date_trunc('month', created_at AT TIME ZONE 'UTC')::date, count(*), count(*) FILTER (WHERE is_active)
+        FROM users WHERE NOT is_admin AND created_at IS NOT NULL
+        GROUP BY 1
+    """))
+    await db.execute(text("""
+        INSERT INTO analytics_monthly_premium (month, policy_type, policies, premium)
+        SELECT date_trunc('month', created_at AT TIME ZONE 'UTC')::date, coalesce(policy_type, ''), count(*), coalesce(sum(premium), 0)
+        FROM users WHERE NOT is_admin AND created_at IS NOT NULL
+        GROUP BY 1, 2
+    """))
+    await db.execute(text("""
+        INSERT INTO analytics_expiry_monthly (month, policies)
+        SELECT date_trunc('month', policy_expiry)::date, count(*)
+        FROM users WHERE NOT is_admin AND policy_expiry IS NOT NULL
+        GROUP BY 1
+    """))
+    await db.commit()
+
+##
+# @brief Builds the rollups on first start, when customers exist but no rollup rows do.
+#
+# @param db The database session.
+#
+async def ensure_rollups(db: AsyncSession):
+    has_rollups = await db.scalar(select(exists().where(MonthlyCustomerRollup.month.is_not(None))))
+    has_customers = await db.scalar(select(exists().where(User.is_admin == False)))
+    if has_customers and not has_rollups:
+        await rebuild_rollups(db)
+
+async def _main(argv):
+    from database import AsyncSessionLocal, engine
+    if argv[1:] != ["rebuild"]:
+        print("usage: python rollups.py rebuild")
+        return
+    async with AsyncSessionLocal() as session:
+        print("Rebuilding analytics rollups...")
+        await rebuild_rollups(session)
+        print("Rollups rebuilt.")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -0,0 +1,91 @@
+import json
+import os
+from datetime import date, datetime
+from decimal import Decimal
+from fastapi.responses import Response, StreamingResponse
+
+# Fast path for large list responses: endpoints select only the columns they return, build plain
+# dicts from the rows and encode them here, bypassing jsonable_encoder and response_model
+# validation (the models still document the response schema). orjson is used when installed.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+##
+# @brief Encodes a value to JSON bytes.
+# @details Datetimes become ISO 8601 strings, like FastAPI's default encoder produces.
+#
+def dumps(value) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+##
+# @brief JSON response encoded with dumps(); content must already be plain dicts, lists and scalars.
+#
+class FastJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+##
+# @brief Converts result rows to dicts.
+#
+# @param rows Rows of a select over individual columns.
+# @param keys Output keys, in column order; extra trailing columns in the rows are ignored.
+# @return A list of dicts.
+#
+def rows_to_dicts(rows, keys: list[str]) -> list[dict]:
+    return [dict(zip(keys, row)) for row in rows]
+
+##
+# @brief Media type of newline-delimited JSON.
+#
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+##
+# @brief Streams objects as newline-delimited JSON, one object per line.
+#
+# @param chunks Async iterator of lists of JSON-serializable objects (e.g. one list per fetched
+#        batch), or a single list.
+# @param headers Extra response headers.
+#
+def ndjson_response(chunks, headers: dict | None = None) -> StreamingResponse:
+    async def body():
+        if isinstance(chunks, list):
+            if chunks:
+                yield b"\n".join(dumps(item) for item in chunks) + b"\n"
+            return
+        async for chunk in chunks:
+            if chunk:
+                yield b"\n".join(dumps(item) for item in chunk) + b"\n"
+    return StreamingResponse(body(), media_type=NDJSON_MEDIA_TYPE, headers=headers)
+
+##
+# @brief Rows fetched per round trip when streaming a query.
+#
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "1000"))
+
+##
+# @brief Runs a query with a server-side cursor and yields its rows as lists of dicts.
+# @details Meant to feed ndjson_response: rows are fetched STREAM_BATCH_SIZE at a time while the
+#          response is being sent, so memory stays flat however many rows match.
+#
+# @param db The session; FastAPI closes dependency sessions only after a streamed response ends.
+# @param query A select over individual columns.
+# @param keys Output keys, as for rows_to_dicts.
+#
+async def stream_dicts(db, query, keys: list[str]):
+    result = await db.stream(query.execution_options(yield_per=STREAM_BATCH_SIZE))
+    async for partition in result.partitions():
+        yield rows_to_dicts(partition, keys)
@@ -0,0 +1,151 @@
+"""
+@brief Production entry point: runs the one-time startup work once, then serves main:app from several worker processes.
+@details The supervisor applies pending migrations, builds missing rollups and cleans up stale jobs
+         and tokens before any worker starts; workers then only check the schema version and load
+         their own in-memory mechanic index. Workers are uvicorn processes behind one listening
+         socket, restarted when they die.
+
+         - SIGHUP restarts the workers one at a time (graceful reload: each finishes its in-flight
+           requests, for up to GRACEFUL_TIMEOUT seconds).
+         - SIGTTIN / SIGTTOU add / remove a worker.
+         - SIGTERM / SIGINT drain and stop.
+
+         Per-process state with several workers:
+         - Set REDIS_URL so the response cache and the rate limits are shared, and principal and
+           mechanic index invalidations reach every worker (coordination.py).
+         - Admission concurrency limits, the bcrypt pool and the database pool are per worker. The
+           bcrypt pool defaults to available CPUs / workers threads, and the worker count is capped
+           so that workers x (DB_POOL_SIZE + DB_MAX_OVERFLOW) fits in DB_MAX_CONNECTIONS.
+
+Usage (from backend/):
+
+    WEB_CONCURRENCY=4 python serve.py
+"""
+import asyncio
+import math
+import os
+import shutil
+import tempfile
+
+## Listening address.
+HOST = os.getenv("HOST", "0.0.0.0")
+
+## Listening port (Railway provides PORT).
+PORT = int(os.getenv("PORT", "8000"))
+
+##
+# @brief CPUs this process may use: its affinity mask, further limited by a cgroup CPU quota.
+# @details os.cpu_count() reports the host's cores, which inside a container can be many more
+#          than its quota.
+#
+def available_cpus() -> int:
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    quota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            limit, period = f.read().split()
+            if limit != "max":
+                quota = int(limit) / int(period)
+    except (OSError, ValueError):
+        try:  # cgroup v1
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                limit = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+            if limit > 0:
+                quota = limit / period
+        except (OSError, ValueError):
+            pass
+    if quota is not None:
+        cpus = min(cpus, math.ceil(quota))
+    return max(1, cpus)
+
+## CPUs available to the server (see available_cpus).
+CPUS = available_cpus()
+
+## Worker processes; defaults to one per available CPU, capped by DB_MAX_CONNECTIONS.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", str(CPUS)))
+
+##
+# @brief Connections the database accepts from this server (its max_connections less a reserve
+#        for migrations, admin sessions and replication); 0 disables the cap.
+# @details Every worker opens its own pool of up to DB_POOL_SIZE + DB_MAX_OVERFLOW connections,
+#          so the worker count is capped at DB_MAX_CONNECTIONS // (DB_POOL_SIZE + DB_MAX_OVERFLOW).
+#
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "90"))
+
+## Seconds a stopping or reloading worker gets to finish its in-flight requests.
+GRACEFUL_TIMEOUT = float(os.getenv("GRACEFUL_TIMEOUT", "30"))
+
+## Proxies trusted to set X-Forwarded-For (see admission.FORWARDED_ALLOW_IPS; the Dockerfile sets "*").
+FORWARDED_ALLOW_IPS = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+## Restart a worker after this many requests (0 disables), to cap slow memory growth.
+WORKER_MAX_REQUESTS = int(os.getenv("WORKER_MAX_REQUESTS", "0"))
+
+##
+# @brief Sets the environment inherited by the workers; must run before the app modules are imported.
+#
+# @param workers Number of worker processes.
+#
+def configure_environment(workers: int):
+    # One bcrypt thread per core in total rather than per worker
+    os.environ.setdefault("HASH_POOL_WORKERS", str(max(1, CPUS // workers)))
+    if workers > 1:
+        directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+        if directory:
+            # Samples of a previous run's processes would otherwise be aggregated forever
+            shutil.rmtree(directory, ignore_errors=True)
+            os.makedirs(directory)
+        else:
+            os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="asfalya-metrics-")
+        if not os.getenv("REDIS_URL"):
+            print(f"Serving with {workers} workers without REDIS_URL: caches and rate limits are per worker")
+
+async def _prepare():
+    import main
+    from database import dispose_engines
+    try:
+        await main.run_startup_tasks()
+    finally:
+        # Workers open their own connections
+        await dispose_engines()
+
+##
+# @brief Number of workers to start: WEB_CONCURRENCY, capped so their pools fit in DB_MAX_CONNECTIONS.
+#
+def worker_count() -> int:
+    from database import DB_POOL_SIZE, DB_MAX_OVERFLOW
+    workers = max(1, WEB_CONCURRENCY)
+    per_worker = DB_POOL_SIZE + DB_MAX_OVERFLOW
+    if DB_MAX_CONNECTIONS > 0 and per_worker > 0:
+        cap = max(1, DB_MAX_CONNECTIONS // per_worker)
+        if workers > cap:
+            print(f"Capping workers at {cap}: {workers} x {per_worker} pooled connections would exceed DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS}")
+            workers = cap
+    print(f"Workers: {workers} ({CPUS} CPU(s) available, up to {workers * per_worker} database connections)")
+    return workers
+
+def _main():
+    import uvicorn
+    workers = worker_count()
+    configure_environment(workers)
+    asyncio.run(_prepare())
+    os.environ["SERVE_SUPERVISED"] = "1"
+    print(f"Serving on {HOST}:{PORT} with {workers} worker(s)")
+    uvicorn.run(
+        "main:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        limit_max_requests=WORKER_MAX_REQUESTS or None,
+        proxy_headers=True,
+        forwarded_allow_ips=FORWARDED_ALLOW_IPS,
+    )
+
+if __name__ == "__main__":
+    _main()
@@ -0,0 +1,86 @@
+import asyncio
+import os
+from database import AsyncSessionLocal
+from jobs import job_handler, celery_app
+from importers import import_mechanics, import_customers, import_upload, read_upload_columns, validate_upload_columns, estimate_upload_rows
+from broadcasts import run_broadcast
+from geo import rebuild_mechanic_index
+from coordination import invalidation_bus
+from cache import response_cache, CUSTOMERS_TAG
+from metrics import IMPORT_ROWS
+
+# Job handlers. Importing this module registers them; Celery workers load it with
+# `celery -A tasks.celery_app worker`.
+
+async def _refresh_mechanic_index():
+    # A fresh session: the import's may be stuck in a failed transaction. A failure here is
+    # only logged so it cannot hide the import's own error; other workers rebuild on the event.
+    try:
+        async with AsyncSessionLocal() as db:
+            await rebuild_mechanic_index(db)
+    except Exception as e:
+        print(f"Mechanic index rebuild after import failed: {e}")
+    invalidation_bus.publish("mechanics")
+
+async def _import_file(ctx, kind: str, path: str, import_frame, dry_run: bool) -> dict:
+    try:
+        error = validate_upload_columns(kind, await asyncio.to_thread(read_upload_columns, path))
+        if error:
+            raise ValueError(error)
+        await ctx.progress(0, total=await asyncio.to_thread(estimate_upload_rows, path), force=True)
+
+        async def on_progress(report):
+            await ctx.progress(report.rows_read, failed=report.counts["rejected"])
+
+        try:
+            async with AsyncSessionLocal() as db:
+                report = await import_upload(db, path, import_frame, dry_run=dry_run, on_progress=on_progress)
+        finally:
+            # Batches committed before a failure or cancellation are visible
+            if kind == "customers" and not dry_run:
+                await response_cache.invalidate_tags(CUSTOMERS_TAG)
+            elif not dry_run:
+                await _refresh_mechanic_index()
+        ctx.total = report.rows_read  # the estimate is replaced by the exact count
+        if not dry_run:
+            for status, n in report.counts.items():
+                IMPORT_ROWS.labels(kind, status).inc(n)
+        await ctx.progress(report.rows_read, failed=report.counts["rejected"], force=True)
+        counts = ", ".join(f"{n} {status}" for status, n in report.counts.items())
+        prefix = "Dry run" if dry_run else "Import finished"
+        return {"message": f"{prefix}: {counts} {kind}", **report.as_dict()}
+    finally:
+        os.remove(path)
+
+##
+# @brief Imports mechanics from an uploaded .xlsx or .csv file.
+#
+# @param ctx The JobContext.
+# @param path Path of the spooled upload; removed when the job ends.
+# @param filename Original file name.
+# @param dry_run Validate and report without writing.
+# @return Row counts per status, throughput and the per-row report.
+#
+@job_handler("import_mechanics")
+async def import_mechanics_job(ctx, path: str, filename: str | None = None, dry_run: bool = False) -> dict:
+    return await _import_file(ctx, "mechanics", path, import_mechanics, dry_run)
+
+##
+# @brief Imports customers from an uploaded .xlsx or .csv file.
+#
+# @param ctx The JobContext.
+# @param path Path of the spooled upload; removed when the job ends.
+# @param filename Original file name.
+# @param dry_run Classify and report rows without writing.
+# @return Row counts per status, throughput and the per-row report.
+#
+@job_handler("import_customers")
+async def import_customers_job(ctx, path: str, filename: str | None = None, dry_run: bool = False) -> dict:
+    return await _import_file(ctx, "customers", path, import_customers, dry_run)
+
+##
+# @brief Sends a broadcast message (see broadcasts.run_broadcast).
+#
+@job_handler("broadcast")
+async def broadcast_job(ctx, message: str, target_audience: str, channel: str) -> dict:
+    return await run_broadcast(ctx, message, target_audience, channel)
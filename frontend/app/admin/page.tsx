@@ -84,7 +84,16 @@ export default function AdminPage() {
             });
 
             if (res.ok) {
-                const data = await res.json();
+                // The broadcast runs as a background job; poll until it finishes
+                let data = await res.json();
+                while (data.status === "queued" || data.status === "running") {
+                    await new Promise((resolve) => setTimeout(resolve, 1000));
+                    const statusRes = await fetch(`${API_URL}/api/notifications/broadcast/${data.job_id}`, {
+                        headers: { Authorization: `Bearer ${token}` }
+                    });
+                    if (!statusRes.ok) break;
+                    data = await statusRes.json();
+                }
                 alert(`${t('notif_success_prefix')} ${data.sent_count} ${t('notif_success_suffix')}`);
                 setNotifOpen(false);
                 setNotifData({ message: "", target_audience: "all" });
@@ -54,6 +54,7 @@ export default function LoginPage() {
 
             const data = await res.json();
             localStorage.setItem("token", data.access_token);
+            localStorage.setItem("refresh_token", data.refresh_token);
             document.cookie = `token=${data.access_token}; path=/;`; // For middleware
 
             router.push("/");
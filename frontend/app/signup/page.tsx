@@ -50,6 +50,7 @@ export default function SignupPage() {
             if (res.ok) {
                 const data = await res.json();
                 localStorage.setItem("token", data.access_token);
+                localStorage.setItem("refresh_token", data.refresh_token);
                 // Set cookie for middleware
                 document.cookie = `token=${data.access_token}; path=/; max-age=86400; SameSite=Lax`;
                 router.push("/customer");
@@ -36,40 +36,37 @@ interface Customer {
     vehicle_plate?: string;
 }
 
+/** Number of customers fetched per page. */
+const PAGE_SIZE = 100;
+
 export default function CustomerList() {
     const { t } = useLanguage();
     const [customers, setCustomers] = useState<Customer[]>([]);
-    const [filteredCustomers, setFilteredCustomers] = useState<Customer[]>([]);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
     const [searchQuery, setSearchQuery] = useState("");
     const [editingCustomer, setEditingCustomer] = useState<Customer | null>(null);
     const [isEditDialogOpen, setIsEditDialogOpen] = useState(false);
 
+    // Search runs on the server; debounce so typing doesn't fire a request per keystroke
     useEffect(() => {
-        fetchCustomers();
-    }, []);
-
-    useEffect(() => {
-        const lowerQuery = searchQuery.toLowerCase();
-        const filtered = customers.filter(c =>
-            c.email?.toLowerCase().includes(lowerQuery) ||
-            c.full_name?.toLowerCase().includes(lowerQuery) ||
-            c.phone?.includes(lowerQuery) ||
-            c.vehicle_plate?.toLowerCase().includes(lowerQuery) ||
-            c.policy_number?.toLowerCase().includes(lowerQuery) ||
-            c.id.toString().includes(lowerQuery)
-        );
-        setFilteredCustomers(filtered);
-    }, [searchQuery, customers]);
+        const timer = setTimeout(() => fetchCustomers(), 300);
+        return () => clearTimeout(timer);
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+    }, [searchQuery]);
 
-    const fetchCustomers = async () => {
+    const fetchCustomers = async (cursor: string | null = null) => {
         const token = localStorage.getItem("token");
-        const res = await fetch(`${API_URL}/api/customers`, {
+        const params = new URLSearchParams({ limit: String(PAGE_SIZE), sort: "-created_at" });
+        if (searchQuery) params.set("q", searchQuery);
+        if (cursor) params.set("cursor", cursor);
+
+        const res = await fetch(`${API_URL}/api/customers?${params}`, {
             headers: { Authorization: `Bearer ${token}` },
         });
         if (res.ok) {
             const data = await res.json();
-            setCustomers(data);
-            setFilteredCustomers(data);
+            setCustomers(prev => cursor ? [...prev, ...data] : data);
+            setNextCursor(res.headers.get("X-Next-Cursor"));
         }
     };
 
@@ -136,7 +133,7 @@ export default function CustomerList() {
                     onChange={(e) => setSearchQuery(e.target.value)}
                     className="max-w-sm"
                 />
-                <CreateCustomerDialog onSuccess={fetchCustomers} />
+                <CreateCustomerDialog onSuccess={() => fetchCustomers()} />
             </div>
 
             <div className="rounded-md border">
@@ -155,7 +152,7 @@ export default function CustomerList() {
                         </TableRow>
                     </TableHeader>
                     <TableBody>
-                        {filteredCustomers.map((customer) => (
+                        {customers.map((customer) => (
                             <TableRow key={customer.id}>
                                 <TableCell>{customer.id}</TableCell>
                                 <TableCell className="font-medium">{customer.full_name || "-"}</TableCell>
@@ -201,7 +198,7 @@ export default function CustomerList() {
                                 </TableCell>
                             </TableRow>
                         ))}
-                        {filteredCustomers.length === 0 && (
+                        {customers.length === 0 && (
                             <TableRow>
                                 <TableCell colSpan={9} className="text-center h-24">
                                     {t('no_customers')}
@@ -212,6 +209,14 @@ export default function CustomerList() {
                 </Table>
             </div>
 
+            {nextCursor && (
+                <div className="flex justify-center">
+                    <Button variant="outline" onClick={() => fetchCustomers(nextCursor)}>
+                        {t('load_more')}
+                    </Button>
+                </div>
+            )}
+
             <Dialog open={isEditDialogOpen} onOpenChange={setIsEditDialogOpen}>
                 <DialogContent className="max-w-2xl">
                     <DialogHeader>
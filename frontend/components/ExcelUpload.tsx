@@ -50,13 +50,30 @@ export default function ExcelUpload() {
                 body: formData,
             });
 
-            const data = await response.json();
+            let data = await response.json();
 
             if (!response.ok) {
                 throw new Error(data.detail || t('upload_failed_msg'));
             }
 
-            setMessage(`${t('upload_success')}: ${data.message}`);
+            // The import runs as a background job; poll until it finishes
+            while (data.status === "queued" || data.status === "running") {
+                setMessage(`${t('uploading')} ${Math.round(data.progress || 0)}%`);
+                await new Promise((resolve) => setTimeout(resolve, 1000));
+                const jobResponse = await fetch(`${API_URL}/api/jobs/${data.job_id}`, {
+                    headers: { "Authorization": `Bearer ${token}` }
+                });
+                data = await jobResponse.json();
+                if (!jobResponse.ok) {
+                    throw new Error(data.detail || t('upload_failed_msg'));
+                }
+            }
+
+            if (data.status !== "completed") {
+                throw new Error(data.error_summary || t('upload_failed_msg'));
+            }
+
+            setMessage(`${t('upload_success')}: ${data.result.message}`);
             setFile(null);
         } catch (error: any) {
             setMessage(`${t('upload_error')}: ${error.message}`);
@@ -68,7 +85,7 @@ export default function ExcelUpload() {
     return (
         <Card>
             <CardHeader>
-                <CardTitle>{t('import_data')} (Excel)</CardTitle>
+                <CardTitle>{t('import_data')} (Excel / CSV)</CardTitle>
             </CardHeader>
             <CardContent>
                 <div className="flex flex-col gap-4">
@@ -86,7 +103,7 @@ export default function ExcelUpload() {
                     <Input
                         key={file ? file.name : 'reset'} // Reset input on success
                         type="file"
-                        accept=".xlsx"
+                        accept=".xlsx,.csv"
                         onChange={handleFileChange}
                         disabled={uploading}
                     />
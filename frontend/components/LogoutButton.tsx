@@ -3,13 +3,24 @@
 import { Button } from "@/components/ui/button";
 import { useRouter } from "next/navigation";
 import { useLanguage } from "@/context/LanguageContext";
+import { API_URL } from "@/lib/api";
 
 export default function LogoutButton() {
     const { t } = useLanguage();
     const router = useRouter();
 
     const handleLogout = () => {
+        const refreshToken = localStorage.getItem("refresh_token");
+        if (refreshToken) {
+            // Revoke the session server-side; logging out locally does not wait for it
+            fetch(`${API_URL}/token/revoke`, {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ refresh_token: refreshToken }),
+            }).catch(() => {});
+        }
         localStorage.removeItem("token");
+        localStorage.removeItem("refresh_token");
         document.cookie = "token=; path=/; expires=Thu, 01 Jan 1970 00:00:01 GMT;";
         router.push("/login");
     };
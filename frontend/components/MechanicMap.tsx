@@ -1,9 +1,9 @@
 "use client";
 
-import { MapContainer, TileLayer, Marker, Popup } from "react-leaflet";
+import { MapContainer, TileLayer, Marker, Popup, useMapEvents } from "react-leaflet";
 import "leaflet/dist/leaflet.css";
 import L from "leaflet";
-import { useEffect, useState } from "react";
+import { useCallback, useEffect, useState } from "react";
 import { API_URL } from "@/lib/api";
 import { useLanguage } from "@/context/LanguageContext";
 
@@ -19,19 +19,56 @@ interface Mechanic {
     id: number;
     name: string;
     address: string;
-    latitude: string;
-    longitude: string;
+    latitude: number;
+    longitude: number;
     phone?: string;
 }
 
+/**
+ * @brief Represents a pre-aggregated group of mechanics at the current zoom level.
+ */
+interface Cluster {
+    count: number;
+    latitude: number;
+    longitude: number;
+}
+
+/**
+ * @brief Builds the marker icon for a cluster, sized by its member count.
+ */
+function clusterIcon(count: number) {
+    const size = count < 10 ? 30 : count < 100 ? 38 : 46;
+    return L.divIcon({
+        html: `<div style="width:${size}px;height:${size}px;line-height:${size}px" class="rounded-full bg-blue-600/80 text-white text-xs font-bold text-center shadow">${count}</div>`,
+        className: "",
+        iconSize: [size, size],
+    });
+}
+
+/**
+ * @brief Reloads clusters whenever the viewport changes.
+ */
+function ViewportListener({ onChange }: { onChange: (bbox: string, zoom: number) => void }) {
+    const map = useMapEvents({
+        moveend: () => onChange(map.getBounds().toBBoxString(), map.getZoom()),
+    });
+
+    useEffect(() => {
+        onChange(map.getBounds().toBBoxString(), map.getZoom());
+    }, [map, onChange]);
+
+    return null;
+}
+
 /**
  * @brief Component to display mechanics on an interactive map.
- * @details Uses React Leaflet. Fetches mechanics data from the backend.
- *          Includes a fix for default Leaflet marker icons.
+ * @details Uses React Leaflet. Fetches server-side clusters for the visible area from the backend,
+ *          and individual mechanics once zoomed in. Includes a fix for default Leaflet marker icons.
  */
 export default function MechanicMap() {
     const { t } = useLanguage();
     const [mechanics, setMechanics] = useState<Mechanic[]>([]);
+    const [clusters, setClusters] = useState<Cluster[]>([]);
 
     useEffect(() => {
         // This fixes the missing icon issue
@@ -43,26 +80,26 @@ export default function MechanicMap() {
                 shadowUrl,
             });
         })();
+    }, []);
 
-        // Fetch mechanics
-        async function fetchMechanics() {
-            try {
-                const token = localStorage.getItem("token");
-                const res = await fetch(`${API_URL}/api/mechanics`, {
-                    headers: {
-                        Authorization: `Bearer ${token}`
-                    }
-                });
-                if (res.ok) {
-                    const data = await res.json();
-                    setMechanics(Array.isArray(data) ? data : []);
+    // Fetch clusters and mechanics for the visible area
+    const fetchViewport = useCallback(async (bbox: string, zoom: number) => {
+        try {
+            const token = localStorage.getItem("token");
+            const params = new URLSearchParams({ bbox, zoom: String(zoom) });
+            const res = await fetch(`${API_URL}/api/mechanics/clusters?${params}`, {
+                headers: {
+                    Authorization: `Bearer ${token}`
                 }
-            } catch (error) {
-                console.error("Failed to fetch mechanics", error);
+            });
+            if (res.ok) {
+                const data = await res.json();
+                setClusters(Array.isArray(data.clusters) ? data.clusters : []);
+                setMechanics(Array.isArray(data.points) ? data.points : []);
             }
+        } catch (error) {
+            console.error("Failed to fetch mechanics", error);
         }
-
-        fetchMechanics();
     }, []);
 
     return (
@@ -76,13 +113,18 @@ export default function MechanicMap() {
                 attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
                 url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
             />
+            <ViewportListener onChange={fetchViewport} />
+            {clusters.map((cluster) => (
+                <Marker
+                    key={`${cluster.latitude},${cluster.longitude}`}
+                    position={[cluster.latitude, cluster.longitude]}
+                    icon={clusterIcon(cluster.count)}
+                />
+            ))}
             {mechanics?.map((mech) => {
-                let lat = parseFloat(mech.latitude);
-                let lng = parseFloat(mech.longitude);
-
-                // Heuristic to fix missing decimal points from Excel import (e.g. 353370 -> 35.3370)
-                if (lat > 90) lat = lat / 10000;
-                if (lng > 180) lng = lng / 10000;
+                // Coordinates are stored as numbers and normalized by the backend on import
+                const lat = Number(mech.latitude);
+                const lng = Number(mech.longitude);
 
                 if (isNaN(lat) || isNaN(lng)) return null;
 
@@ -2,34 +2,66 @@
 
 import { useEffect } from "react";
 import { useRouter } from "next/navigation";
+import { API_URL } from "@/lib/api";
 
 export default function SessionManager() {
     const router = useRouter();
 
     useEffect(() => {
-        const checkSession = () => {
+        let timer: ReturnType<typeof setTimeout> | undefined;
+
+        const logout = () => {
+            localStorage.removeItem("token");
+            localStorage.removeItem("refresh_token");
+            document.cookie = "token=; path=/; expires=Thu, 01 Jan 1970 00:00:01 GMT;";
+            router.push("/login");
+        };
+
+        // Exchange the refresh token for a new token pair (no password check on the server)
+        const refresh = async () => {
+            const refreshToken = localStorage.getItem("refresh_token");
+            if (!refreshToken) return false;
+            try {
+                const res = await fetch(`${API_URL}/token/refresh`, {
+                    method: "POST",
+                    headers: { "Content-Type": "application/json" },
+                    body: JSON.stringify({ refresh_token: refreshToken }),
+                });
+                if (!res.ok) {
+                    // Another tab may have rotated the token a moment ago
+                    return localStorage.getItem("refresh_token") !== refreshToken;
+                }
+                const data = await res.json();
+                localStorage.setItem("token", data.access_token);
+                localStorage.setItem("refresh_token", data.refresh_token);
+                document.cookie = `token=${data.access_token}; path=/;`; // For middleware
+                return true;
+            } catch (e) {
+                console.error("Session refresh failed", e);
+                return false;
+            }
+        };
+
+        const checkSession = async () => {
             const token = localStorage.getItem("token");
             if (!token) return;
 
             try {
                 const payload = JSON.parse(atob(token.split('.')[1]));
                 const expiry = payload.exp * 1000; // Convert to milliseconds
-                const now = Date.now();
+                // Refresh a couple of minutes early so requests never carry an expired token
+                const timeUntilRefresh = expiry - Date.now() - 2 * 60 * 1000;
 
-                if (now >= expiry) {
-                    console.log("Session expired. Logging out.");
-                    logout();
-                } else {
-                    // Schedule logout
-                    const timeUntilExpiry = expiry - now;
-                    console.log(`Session valid for ${(timeUntilExpiry / 60000).toFixed(1)} minutes`);
-
-                    const timer = setTimeout(() => {
-                        console.log("Session time limit reached. Logging out.");
+                if (timeUntilRefresh <= 0) {
+                    if (await refresh()) {
+                        checkSession();
+                    } else {
+                        console.log("Session expired. Logging out.");
                         logout();
-                    }, timeUntilExpiry);
-
-                    return () => clearTimeout(timer);
+                    }
+                } else {
+                    console.log(`Session valid for ${(timeUntilRefresh / 60000).toFixed(1)} minutes before refresh`);
+                    timer = setTimeout(checkSession, timeUntilRefresh);
                 }
             } catch (e) {
                 console.error("Invalid token format", e);
@@ -38,27 +70,20 @@ export default function SessionManager() {
             }
         };
 
-        const logout = () => {
-            localStorage.removeItem("token");
-            document.cookie = "token=; path=/; expires=Thu, 01 Jan 1970 00:00:01 GMT;";
-            router.push("/login");
-        };
-
-        // Check continuously (e.g. every minute) to handle cases where tab was sleeping
-        // But simply setting the timeout above is usually efficient.
-        // We run it once on mount.
-        const cleanup = checkSession();
+        checkSession();
 
-        // Force refresh every 30 minutes
-        const refreshInterval = 30 * 60 * 1000; // 30 minutes
-        const intervalId = setInterval(() => {
-            console.log("Auto-refreshing page...");
-            window.location.reload();
-        }, refreshInterval);
+        // Re-check when the tab wakes up, since timers do not run while it sleeps
+        const onVisible = () => {
+            if (document.visibilityState === "visible") {
+                clearTimeout(timer);
+                checkSession();
+            }
+        };
+        document.addEventListener("visibilitychange", onVisible);
 
         return () => {
-            if (cleanup) cleanup();
-            clearInterval(intervalId);
+            clearTimeout(timer);
+            document.removeEventListener("visibilitychange", onVisible);
         };
     }, [router]);
 
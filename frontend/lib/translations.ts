@@ -119,6 +119,7 @@ export const translations = {
         delete_failed: "Failed to delete customer",
         update_failed: "Failed to update customer",
         no_customers: "No customers found.",
+        load_more: "Load more",
         edit_customer_title: "Edit Customer",
 
         // Activation & Errors
@@ -264,6 +265,7 @@ export const translations = {
         delete_failed: "Müşteri silinemedi",
         update_failed: "Müşteri güncellenemedi",
         no_customers: "Müşteri bulunamadı.",
+        load_more: "Daha fazla yükle",
         edit_customer_title: "Müşteriyi Düzenle",
 
         // Activation & Errors
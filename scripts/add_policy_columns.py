@@ -1,24 +0,0 @@
-import asyncio
-import sys
-import os
-
-# Add parent dir to sys.path to import backend modules
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + '/backend')
-
-from database import engine
-from sqlalchemy import text
-
-async def migrate():
-    print("Starting migration...")
-    async with engine.begin() as conn:
-        try:
-            await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS policy_type VARCHAR"))
-            await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS policy_number VARCHAR"))
-            await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS policy_expiry TIMESTAMP"))
-            await conn.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS vehicle_plate VARCHAR"))
-            print("Migration successful: Columns added.")
-        except Exception as e:
-            print(f"Migration failed: {e}")
-
-if __name__ == "__main__":
-    asyncio.run(migrate())